@@ -0,0 +1,418 @@
+import argparse
+import io
+import logging
+import os
+import tempfile
+import time
+import timeit
+
+from cpu import Flags
+from cycles import CLOCK_HZ
+from devices import ShiftRegister
+from machine import Machine8080
+from profiler import GuestProfiler, OpcodeProfiler
+import tracing
+from tracing import Tracer, TraceRecorder
+from utils import byte_to_signed_int, int_to_signed_byte
+
+
+def _report(name, per_flag, table):
+    print(f'{name:<8} {per_flag:8.1f} ns/op {table:8.1f} ns/op {per_flag / table:6.2f}x')
+
+
+def _time(func, operands, repeat):
+    """Returns the best time per call in nanoseconds.
+    """
+    def loop():
+        for args in operands:
+            func(*args)
+    best = min(timeit.repeat(loop, number=1, repeat=repeat))
+    return best * 1e9 / len(operands)
+
+
+def _old_add(flags, a, val):
+    flags[Flags.CARRY] = 0
+    flags[Flags.AUX_CARRY] = 0
+    if (a & 0xf) + (val & 0xf) > 0xf:
+        flags[Flags.AUX_CARRY] = 1
+    if a + val > 0xff:
+        flags[Flags.CARRY] = 1
+    res = (a + val) & 0xff
+    flags.calculate_parity(res)
+    flags.set_zero(res)
+    flags.set_sign(res)
+
+
+def _old_sub(flags, a, val):
+    val = byte_to_signed_int(val)
+    a = byte_to_signed_int(a)
+    flags.clear_all()
+    if a < val:
+        flags.set(Flags.CARRY)
+        flags.set(Flags.SIGN)
+    if (a & 0x0f) < (val & 0x0f):
+        flags.set(Flags.AUX_CARRY)
+    a -= val
+    if a == 0:
+        flags.set(Flags.ZERO)
+    flags.calculate_parity(int_to_signed_byte(a))
+
+
+def _old_logic(flags, res):
+    flags.clear(Flags.CARRY)
+    flags.clear(Flags.AUX_CARRY)
+    flags.calculate_parity(res)
+    flags.set_zero(res)
+    flags.set_sign(res)
+
+
+def _old_inr(flags, val):
+    flags[Flags.AUX_CARRY] = 1 if (val & 0x0f) == 0x0f else 0
+    val = (val + 1) & 0xff
+    flags.calculate_parity(val)
+    flags.set_zero(val)
+    flags.set_sign(val)
+
+
+def flags_benchmark(args):
+    """Times the flag updates for ADD, SUB, ORA and INR done one flag at a time
+    (the way the handlers used to) against the table lookups.
+    """
+    flags = Flags()
+    pairs = [(a, v) for a in range(0, 256, 3) for v in range(0, 256, 5)]
+    singles = [(b,) for b in range(256)] * 16
+    print(f'{"op":<8} {"per flag":>14} {"table":>14} {"speedup":>7}')
+    for name, old, new, operands in (
+            ("add", lambda a, v: _old_add(flags, a, v), flags.set_add_flags, pairs),
+            ("sub", lambda a, v: _old_sub(flags, a, v), flags.set_sub_flags, pairs),
+            ("logic", lambda r: _old_logic(flags, r), flags.set_logic_flags, singles),
+            ("inr", lambda v: _old_inr(flags, v), flags.set_inr_flags, singles)):
+        _report(name, _time(old, operands, args.repeat), _time(new, operands, args.repeat))
+
+
+# endless loop that fills a buffer using calls, the stack, memory and the ALU,
+# with interrupts enabled and a short RST 1 handler
+WORKLOAD = {
+    0x0000: [0xc3, 0x40, 0x00],  # JMP 0040
+    0x0008: [0xf5,               # PUSH PSW
+             0xf1,               # POP PSW
+             0xfb,               # EI
+             0xc9],              # RET
+    0x0040: [0x31, 0x00, 0x24,   # LXI SP, 2400
+             0xfb,               # EI
+             0x21, 0x00, 0x20,   # LXI H, 2000
+             0x06, 0x40,         # MVI B, 40
+             0x3e, 0x01,         # MVI A, 01
+             0x77,               # MOV M, A
+             0x23,               # INX H
+             0x87,               # ADD A
+             0xce, 0x03,         # ACI 03
+             0xcd, 0x60, 0x00,   # CALL 0060
+             0x05,               # DCR B
+             0xc2, 0x4b, 0x00,   # JNZ 004B
+             0xc3, 0x44, 0x00],  # JMP 0044
+    0x0060: [0xe5,               # PUSH H
+             0xd6, 0x07,         # SUI 07
+             0xe6, 0x7f,         # ANI 7F
+             0x2f,               # CMA
+             0x4f,               # MOV C, A
+             0x79,               # MOV A, C
+             0xe1,               # POP H
+             0xc9],              # RET
+}
+
+
+def _workload_machine(args, **kwargs):
+    """Returns a machine with the ROM from the command line (or the built in
+    workload) loaded.
+    """
+    machine = Machine8080(**kwargs)
+    if args.rom:
+        machine.load(args.rom)
+    else:
+        machine._memory = bytearray(0x10000)
+        for address, code in WORKLOAD.items():
+            machine._memory[address:address + len(code)] = bytes(code)
+    return machine
+
+
+def _throughput(machine, cycles, repeat):
+    """Returns the best emulated clock rate in Hz.
+    """
+    best = 0
+    for _ in range(repeat):
+        start = time.perf_counter()
+        executed = machine.run(cycles=cycles)
+        elapsed = time.perf_counter() - start
+        best = max(best, executed / elapsed)
+    return best
+
+
+def throughput_benchmark(args):
+    """Runs a fixed number of emulated clock cycles and reports emulated
+    cycles per host second for each execution mode.
+    """
+    logging.disable(logging.INFO)
+    print(f'{"mode":<12} {"MHz":>8} {"x 2 MHz":>8} {"speedup":>8}')
+    baseline = None
+    for name, kwargs in (("predecoded", {}),
+                         ("blocks", {"compile_blocks": True})):
+        hz = _throughput(_workload_machine(args, **kwargs), args.cycles, args.repeat)
+        baseline = baseline or hz
+        print(f'{name:<12} {hz / 1e6:8.3f} {hz / CLOCK_HZ:8.3f} {hz / baseline:7.2f}x')
+
+
+def profile_benchmark(args):
+    """Runs the workload under an OpcodeProfiler and prints where the time
+    went, with the profiler's cost on the emulated clock rate.
+    """
+    logging.disable(logging.INFO)
+    plain = _throughput(_workload_machine(args), args.cycles, args.repeat)
+    profiler = OpcodeProfiler()
+    profiled = _throughput(_workload_machine(args, profiler=profiler), args.cycles, args.repeat)
+    print(profiler.report(limit=20))
+    print()
+    print(f'unprofiled {plain / 1e6:.3f} MHz, profiled {profiled / 1e6:.3f} MHz '
+          f'({plain / profiled:.2f}x slower)')
+
+
+def hotspots_benchmark(args):
+    """Runs the workload under a GuestProfiler counting every instruction and
+    under one sampling every --sample cycles, and prints the sampled report
+    with the cost of each on the emulated clock rate.
+    """
+    logging.disable(logging.INFO)
+    plain = _throughput(_workload_machine(args, compile_blocks=True), args.cycles, args.repeat)
+    rates = {}
+    for name, interval in (("every", None), ("sampled", args.sample)):
+        profiler = GuestProfiler(sample_interval=interval)
+        rates[name] = _throughput(_workload_machine(args, compile_blocks=True, profiler=profiler),
+                                  args.cycles, args.repeat)
+    print(profiler.report(limit=10))
+    if args.collapsed:
+        profiler.write_collapsed(args.collapsed)
+    print()
+    print(f'{"mode":<12} {"MHz":>8} {"slowdown":>9}')
+    print(f'{"blocks":<12} {plain / 1e6:8.3f} {1:8.2f}x')
+    for name, hz in rates.items():
+        print(f'{name:<12} {hz / 1e6:8.3f} {plain / hz:8.2f}x')
+
+
+def trace_benchmark(args):
+    """Runs the workload with no tracer, with a Tracer keeping TraceRecords in
+    a deque, and with a TraceRecorder keeping only its ring and streaming to
+    a file with each compression method available, and reports the
+    emulated clock rate and the size of each file per record.
+    """
+    logging.disable(logging.INFO)
+    print(f'{"tracer":<16} {"MHz":>8} {"slowdown":>9} {"bytes/record":>13}')
+    baseline = _throughput(_workload_machine(args, compile_blocks=True), args.cycles, args.repeat)
+    print(f'{"none":<16} {baseline / 1e6:8.3f} {1:8.2f}x')
+    hz = _throughput(_workload_machine(args, compile_blocks=True, tracer=Tracer(limit=1 << 20)),
+                     args.cycles, args.repeat)
+    print(f'{"Tracer":<16} {hz / 1e6:8.3f} {baseline / hz:8.2f}x')
+    methods = [None, "zlib", "lzma"] + (["zstd"] if tracing.zstandard is not None else [])
+    with tempfile.TemporaryDirectory() as directory:
+        for method in methods:
+            path = None if method is None else os.path.join(directory, method)
+            recorder = TraceRecorder(path=path, compression=method)
+            hz = _throughput(_workload_machine(args, compile_blocks=True, tracer=recorder),
+                             args.cycles, args.repeat)
+            recorder.close()
+            name = "ring" if method is None else "ring + " + method
+            size = f'{os.path.getsize(path) / len(recorder):13.2f}' if path else ""
+            print(f'{name:<16} {hz / 1e6:8.3f} {baseline / hz:8.2f}x {size}')
+
+
+def interrupts_benchmark(args):
+    """Runs the workload with no interrupts and with an RST 1 every
+    --interval cycles (120 Hz at 2 MHz by default).  Reports the emulated
+    clock rate for both and the average cycles from raising an interrupt to
+    taking it.
+
+    Nothing is checked per instruction for interrupts, so the two rates
+    differ only by the work done in the interrupt handler and the extra
+    trips around the outer run loop.
+    """
+    logging.disable(logging.INFO)
+    print(f'{"mode":<12} {"interrupts":<11} {"MHz":>8} {"latency":>8}')
+    for name, kwargs in (("predecoded", {}),
+                         ("blocks", {"compile_blocks": True})):
+        machine = _workload_machine(args, **kwargs)
+        hz = _throughput(machine, args.cycles, args.repeat)
+        print(f'{name:<12} {"none":<11} {hz / 1e6:8.3f} {"-":>8}')
+
+        machine = _workload_machine(args, **kwargs)
+        best = 0
+        for _ in range(args.repeat):
+            latency = 0
+            serviced = machine.interrupts_serviced
+            executed = 0
+            start = time.perf_counter()
+            while executed < args.cycles:
+                machine.interrupt(1)
+                executed += machine.run(cycles=args.interval)
+                latency += machine.interrupt_latency
+            elapsed = time.perf_counter() - start
+            best = max(best, executed / elapsed)
+            serviced = machine.interrupts_serviced - serviced
+        print(f'{name:<12} {"every " + str(args.interval):<11} {best / 1e6:8.3f} {latency / serviced:8.1f}')
+
+
+def snapshot_benchmark(args):
+    """Times saving and restoring a snapshot of a running machine with each
+    compression method.
+    """
+    machine = _workload_machine(args, compile_blocks=True)
+    machine.run(cycles=args.cycles)
+    count = 100
+    print(f'{"compression":<12} {"bytes":>7} {"save us":>9} {"restore us":>11}')
+    for compression in (None, "zlib", "lzma"):
+        state = machine.snapshot(compression)
+        save = min(timeit.repeat(lambda: machine.snapshot(compression), number=count, repeat=args.repeat)) / count
+        restore = min(timeit.repeat(lambda: machine.restore(state), number=count, repeat=args.repeat)) / count
+        print(f'{str(compression):<12} {len(state):7} {save * 1e6:9.1f} {restore * 1e6:11.1f}')
+
+
+def rewind_benchmark(args):
+    """Runs the workload with and without a rewind buffer capturing every
+    frame, and reports the slowdown, the cost of a capture and the bytes
+    kept per keyframe and per delta.
+    """
+    from rewind import Rewind
+
+    plain = _throughput(_workload_machine(args, compile_blocks=True), args.cycles, args.repeat)
+    machine = _workload_machine(args, compile_blocks=True)
+    rewind = Rewind(machine)
+    rewind.start()
+    recorded = _throughput(machine, args.cycles, args.repeat)
+    captures = list(rewind._captures)
+    keyframes = [len(c.data) for c in captures if c.keyframe]
+    deltas = [len(c.data) for c in captures if not c.keyframe]
+    capture = min(timeit.repeat(rewind.capture, number=100, repeat=args.repeat)) / 100
+    print(f'without rewind {plain / 1e6:8.3f} MHz')
+    print(f'with rewind    {recorded / 1e6:8.3f} MHz ({recorded / plain * 100:.1f}%)')
+    print(f'capture        {capture * 1e6:8.1f} us')
+    print(f'keyframe       {sum(keyframes) / max(len(keyframes), 1):8.0f} bytes')
+    print(f'delta          {sum(deltas) / max(len(deltas), 1):8.0f} bytes')
+    print(f'buffer         {rewind.size:8d} bytes for {len(rewind)} captures, oldest at cycle {rewind.oldest}')
+
+
+def iobus_benchmark(args):
+    """Times the shift register on ports 2/3/4 the way the game drives it
+    (OUT 4, OUT 2, IN 3) at three levels: calling the device directly,
+    going through IOBus, and running the machine's OUT/IN handlers.  The
+    differences are the cost of the bus and of the handlers.  An unmapped
+    (latched) port is timed through the handlers for comparison.
+    """
+    logging.disable(logging.INFO)
+    machine = Machine8080()
+    machine._memory = bytearray(0x10000)
+    device = ShiftRegister()
+    device.attach(machine.io)
+    bus = machine.io
+    count = args.accesses
+    ports = [(4,), (2,), (3,)]
+
+    def direct():
+        for _ in range(count):
+            device.write_data(4, 0x5a)
+            device.write_offset(2, 3)
+            device.read_result(3)
+
+    def through_bus():
+        for _ in range(count):
+            bus.write(4, 0x5a)
+            bus.write(2, 3)
+            bus.read(3)
+
+    def through_handlers():
+        out = machine.out
+        inp = machine.input
+        data, offset, result = ports
+        for _ in range(count):
+            out(0xd3, data)
+            out(0xd3, offset)
+            inp(0xdb, result)
+
+    def latched():
+        out = machine.out
+        inp = machine.input
+        port = (0x20,)
+        for _ in range(count):
+            out(0xd3, port)
+            out(0xd3, port)
+            inp(0xdb, port)
+
+    print(f'{"path":<16} {"ns/access":>10}')
+    for name, func in (("device", direct), ("iobus", through_bus),
+                       ("in/out handlers", through_handlers), ("latched port", latched)):
+        best = min(timeit.repeat(func, number=1, repeat=args.repeat))
+        print(f'{name:<16} {best * 1e9 / (3 * count):10.1f}')
+
+
+def display_benchmark(args):
+    """Times building a frame from video RAM, redrawing only the rows that
+    changed, and writing it as PPM, and reports each as a share of the
+    16.7 ms a frame lasts at 60 fps.
+    """
+    from display import Display, VIDEO_RAM, VIDEO_RAM_SIZE
+
+    machine = Machine8080()
+    machine._memory = bytearray(0x10000)
+    machine._memory[VIDEO_RAM:VIDEO_RAM + VIDEO_RAM_SIZE] = bytes(b * 37 & 0xff for b in range(VIDEO_RAM_SIZE))
+    display = Display(machine)
+    stream = io.BytesIO()
+
+    def ppm():
+        stream.seek(0)
+        display.write_ppm(stream)
+
+    def full():
+        display.invalidate()
+        display.render_rgb()
+
+    def rows(count):
+        def draw():
+            for row in range(count):
+                machine.write_memory(VIDEO_RAM + row * 32, row)
+            display.render_rgb()
+        return draw
+
+    frames = args.frames
+    print(f'{"step":<16} {"ms/frame":>9} {"% of 60fps":>11}')
+    for name, func in (("render_rgb full", full), ("unchanged", display.render_rgb),
+                       ("8 rows changed", rows(8)), ("32 rows changed", rows(32)), ("ppm", ppm)):
+        best = min(timeit.repeat(func, number=frames, repeat=args.repeat)) / frames
+        print(f'{name:<16} {best * 1e3:9.3f} {best * 60 * 100:10.1f}%')
+
+
+BENCHMARKS = {
+    "display": display_benchmark,
+    "flags": flags_benchmark,
+    "hotspots": hotspots_benchmark,
+    "interrupts": interrupts_benchmark,
+    "iobus": iobus_benchmark,
+    "profile": profile_benchmark,
+    "rewind": rewind_benchmark,
+    "snapshot": snapshot_benchmark,
+    "throughput": throughput_benchmark,
+    "trace": trace_benchmark,
+}
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(usage="./benchmark.py BENCHMARK")
+    parser.add_argument("benchmark", choices=sorted(BENCHMARKS), help="The benchmark to run")
+    parser.add_argument("--repeat", type=int, default=5, help="Number of timing runs (best is reported)")
+    parser.add_argument("--rom", help="ROM to run instead of the built in workload")
+    parser.add_argument("--cycles", type=int, default=2000000, help="Emulated clock cycles per timing run")
+    parser.add_argument("--accesses", type=int, default=1000000,
+                        help="OUT 4/OUT 2/IN 3 sequences for the iobus benchmark")
+    parser.add_argument("--sample", type=int, default=10000, help="Cycles between samples for the hotspots benchmark")
+    parser.add_argument("--collapsed", help="File the hotspots benchmark writes collapsed stacks to")
+    parser.add_argument("--frames", type=int, default=600, help="Frames drawn by the display benchmark")
+    parser.add_argument("--interval", type=int, default=CLOCK_HZ // 120,
+                        help="Cycles between interrupts for the interrupts benchmark")
+
+    args = parser.parse_args()
+    BENCHMARKS[args.benchmark](args)
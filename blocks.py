@@ -0,0 +1,309 @@
+"""
+Basic-block compiler used by Machine8080.run() when compile_blocks is set.
+
+A basic block is a run of straight-line instructions that ends at the first
+instruction that can change the program counter (JMP/Jcc, CALL/Ccc, RET/Rcc,
+RST, PCHL, HLT) or enable interrupts (EI).  Every block is translated once
+into Python source, built with compile(), and cached by its start address.  Running a block executes
+all of its instructions without going back through handler dispatch.
+
+Register moves and loads, and the ALU instructions that work on registers
+or immediates, are written directly into the generated source using the
+flag tables from cpu.  Everything else becomes a direct call to the
+instruction's handler with its operands baked in as constants.  An
+instruction whose handler a tracer or profiler has wrapped is never
+inlined, so every one reaches its wrapped handler.
+
+Before each handler call the block brings the machine's PC and cycle
+counter up to date, so a handler sees (and an exception leaves) the same
+state as with run() without blocks.  Conditional calls and returns add
+their taken time themselves.
+
+After each handler call the block also returns if the cycle counter has
+reached the machine's deadline.  A handler that reaches a device can raise
+an interrupt or schedule an event, which cuts the deadline short, and the
+run loop has to take it at the same instruction boundary as without blocks.
+
+Blocks are indexed by the pages they cover so a write to code only throws
+away the blocks containing the written byte.  Invalidating a block sets
+BlockCompiler.stale; a block checks it after every instruction that can
+write memory and returns if it's set, so a block that patches its own
+remaining instructions stops and the new code is compiled from the next
+instruction.
+"""
+from collections import namedtuple
+
+from cpu import Flags, ARITHMETIC_FLAGS, AND_FLAGS, INCREMENT_FLAGS, \
+    SZP_FLAGS, ADD_FLAGS, SUB_FLAGS, INR_FLAGS, DCR_FLAGS
+from memory import MEMORY_SIZE, CODE_PAGE
+from cycles import CYCLES, TAKEN_EXTRA
+
+# instructions that end a basic block.  EI ends one so that a pending
+# interrupt is taken after the instruction that follows it.
+TERMINATORS = frozenset([0xc3, 0xc2, 0xca, 0xd2, 0xda, 0xe2, 0xea, 0xf2, 0xfa,   # JMP, Jcc
+                         0xcd, 0xc4, 0xcc, 0xd4, 0xdc, 0xe4, 0xec, 0xf4, 0xfc,   # CALL, Ccc
+                         0xc9, 0xc0, 0xc8, 0xd0, 0xd8, 0xe0, 0xe8, 0xf0, 0xf8,   # RET, Rcc
+                         0xc7, 0xcf, 0xd7, 0xdf, 0xe7, 0xef, 0xf7, 0xff,         # RST
+                         0xe9, 0x76,                                             # PCHL, HLT
+                         0xfb])                                                  # EI
+
+# long blocks are split so a single compile stays cheap
+MAX_BLOCK_INSTRUCTIONS = 64
+
+# no block can take longer than this (XTHL is the slowest instruction)
+MAX_BLOCK_CYCLES = MAX_BLOCK_INSTRUCTIONS * max(CYCLES) + max(TAKEN_EXTRA.values())
+
+# non-terminating instructions whose handlers can write memory: STAX, SHLD,
+# STA, INR M, DCR M, MVI M, MOV M,r, PUSH, XTHL
+MEMORY_WRITERS = frozenset([0x02, 0x12, 0x22, 0x32, 0x34, 0x35, 0x36,
+                            0x70, 0x71, 0x72, 0x73, 0x74, 0x75, 0x77,
+                            0xc5, 0xd5, 0xe5, 0xf5, 0xe3])
+
+# register encoding -> register number for the pair encodings B, D, H
+_PAIRS = {0: (0, 1), 1: (2, 3), 2: (4, 5)}
+
+_CARRY = f'((f.flags >> {Flags.CARRY}) & 1)'
+_KEEP_ARITHMETIC = ~ARITHMETIC_FLAGS & 0xff
+_KEEP_AND = ~AND_FLAGS & 0xff
+_KEEP_INCREMENT = ~INCREMENT_FLAGS & 0xff
+
+# ALU operation (bits 3-5 of the opcode) -> lines that combine A with v
+_ALU = (
+    [f'f.flags = (f.flags & {_KEEP_ARITHMETIC}) | ADD_FLAGS[(r[7] << 9) | v]',    # ADD
+     'r[7] = (r[7] + v) & 0xff'],
+    [f'v += {_CARRY}',                                                            # ADC
+     f'f.flags = (f.flags & {_KEEP_ARITHMETIC}) | ADD_FLAGS[(r[7] << 9) | v]',
+     'r[7] = (r[7] + v) & 0xff'],
+    [f'f.flags = (f.flags & {_KEEP_ARITHMETIC}) | SUB_FLAGS[(r[7] << 9) | v]',    # SUB
+     'r[7] = (r[7] - v) & 0xff'],
+    [f'c = {_CARRY}',                                                             # SBB
+     f'f.flags = (f.flags & {_KEEP_ARITHMETIC}) | SUB_FLAGS[(r[7] << 9) | (c << 8) | v]',
+     'r[7] = (r[7] - v - c) & 0xff'],
+    ['r[7] &= v',                                                                 # ANA
+     f'f.flags = (f.flags & {_KEEP_AND}) | SZP_FLAGS[r[7]]'],
+    ['r[7] ^= v',                                                                 # XRA
+     f'f.flags = (f.flags & {_KEEP_ARITHMETIC}) | SZP_FLAGS[r[7]]'],
+    ['r[7] |= v',                                                                 # ORA
+     f'f.flags = (f.flags & {_KEEP_ARITHMETIC}) | SZP_FLAGS[r[7]]'],
+    [f'f.flags = (f.flags & {_KEEP_ARITHMETIC}) | SUB_FLAGS[(r[7] << 9) | v]'],   # CMP
+)
+
+"""
+Block
+-- start first address of the block
+-- end address just past the last instruction
+-- instructions number of instructions in the block
+-- source generated Python source
+-- run compiled function that executes the block
+-- cycles clock cycles the block takes when no conditional call or return is taken
+-- max_cycles clock cycles the block takes when its conditional call or return is taken
+"""
+Block = namedtuple('Block', ['start', 'end', 'instructions', 'source', 'run', 'cycles', 'max_cycles'])
+
+
+class BlockCompiler:
+    def __init__(self, machine):
+        """
+        :param machine: Machine8080 whose code is compiled
+        """
+        self._machine = machine
+        self.blocks = {}
+        self.cache = {}
+        self.cycles = {}  # start address -> most cycles the block can take
+        self._pages = {}
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self.stale = False  # set when a block is invalidated
+
+    @property
+    def size(self):
+        return len(self.cache)
+
+    def stats(self):
+        """Returns the cache counters as a dictionary.
+        """
+        return {"hits": self.hits, "misses": self.misses, "size": self.size,
+                "invalidations": self.invalidations}
+
+    def clear(self):
+        """Throws away every compiled block.
+        """
+        self.blocks.clear()
+        self.cache.clear()
+        self.cycles.clear()
+        self._pages.clear()
+
+    def compile(self, address):
+        """Translates the block starting at address, caches it and returns the function
+        that runs it.
+        """
+        block = self.translate(address)
+        self.blocks[address] = block
+        self.cache[address] = block.run
+        self.cycles[address] = block.max_cycles
+        for page in self._block_pages(block):
+            self._pages.setdefault(page, set()).add(address)
+            self._machine._page_flags[page] |= CODE_PAGE
+        self.misses += 1
+        return block.run
+
+    def invalidate(self, address):
+        """Throws away every block that includes the byte at address.
+        """
+        for start in list(self._pages.get(address >> 8, ())):
+            block = self.blocks[start]
+            if block.start <= address < block.end:
+                for page in self._block_pages(block):
+                    self._pages[page].discard(start)
+                del self.blocks[start]
+                del self.cache[start]
+                del self.cycles[start]
+                self.invalidations += 1
+                self.stale = True
+
+    @staticmethod
+    def _block_pages(block):
+        """Returns the pages covered by the block
+        """
+        return range(block.start >> 8, ((min(block.end, MEMORY_SIZE) - 1) >> 8) + 1)
+
+    def translate(self, address):
+        """Builds (without caching) the Block starting at address.
+        """
+        machine = self._machine
+        memory = machine._memory
+        decoded = machine._decoded
+        namespace = {"m": machine, "r": machine._registers, "f": machine._flags, "b": self,
+                     "SZP_FLAGS": SZP_FLAGS, "ADD_FLAGS": ADD_FLAGS, "SUB_FLAGS": SUB_FLAGS,
+                     "INR_FLAGS": INR_FLAGS, "DCR_FLAGS": DCR_FLAGS}
+        lines = []
+        start = address
+        count = 0
+        cycles = 0
+        pending = 0  # cycles not yet added to m._cycles
+        taken_extra = 0
+        while True:
+            if address >= MEMORY_SIZE:
+                lines.extend(self._sync(address, pending))
+                lines.append('m._end_of_memory()')
+                break
+            if decoded.handlers[address] is None:
+                decoded.decode(memory, address)
+            opcode = decoded.opcodes[address]
+            length = decoded.lengths[address]
+            operands = decoded.operands[address]
+            handler = decoded.handlers[address]
+            cycles += decoded.cycles[address]
+            pending += decoded.cycles[address]
+            count += 1
+            address += length
+            if opcode in TERMINATORS:
+                taken_extra = TAKEN_EXTRA.get(opcode, 0)
+                if opcode == 0xc3 and not machine._instrumented[opcode]:
+                    lines.extend(self._sync(decoded.words[address - length], pending))
+                else:
+                    lines.extend(self._sync(address, pending))
+                    lines.append(self._call(namespace, handler, opcode, operands))
+                break
+            inline = None
+            if machine.opcodes[opcode].mnemonic != "UNKNOWN" and not machine._instrumented[opcode]:
+                inline = self._translate_instruction(opcode, operands)
+            if inline is not None:
+                lines.extend(inline)
+            else:
+                lines.extend(self._sync(address, pending))
+                pending = 0
+                lines.append(self._call(namespace, handler, opcode, operands))
+                if opcode in MEMORY_WRITERS:
+                    lines.append('if b.stale:')
+                    lines.append('    b.stale = False')
+                    lines.append('    return')
+                # a device the handler reached may have raised an interrupt
+                # or scheduled an event, cutting the deadline short
+                lines.append('if m._cycles >= m._deadline:')
+                lines.append('    return')
+            if count == MAX_BLOCK_INSTRUCTIONS:
+                lines.extend(self._sync(address, pending))
+                break
+
+        args = ", ".join(f'{name}={name}' for name in namespace)
+        source = f'def block_{start:04X}({args}):\n' + "".join(f'    {line}\n' for line in lines)
+        code = compile(source, f'<block {start:04X}>', 'exec')
+        exec(code, namespace)
+        return Block(start, address, count, source, namespace[f'block_{start:04X}'],
+                     cycles, cycles + taken_extra)
+
+    @staticmethod
+    def _sync(pc, pending):
+        """Returns the source that brings the PC and cycle counter up to date.
+        """
+        lines = [f'm._pc = 0x{pc:04X}']
+        if pending:
+            lines.append(f'm._cycles += {pending}')
+        return lines
+
+    @staticmethod
+    def _call(namespace, handler, opcode, operands):
+        """Returns the source for calling handler directly.  Named by opcode,
+        since wrapped handlers for different opcodes share a __name__.
+        """
+        name = f'h_{handler.__name__}_{opcode:02x}'
+        namespace[name] = handler
+        return f'{name}(0x{opcode:02X}, {operands!r})'
+
+    @staticmethod
+    def _translate_instruction(opcode, operands):
+        """Returns the lines of source for a non-terminating instruction, or
+        None if it has to be run by its handler.
+        """
+        if opcode == 0x00:                                   # NOP
+            return []
+        if 0x40 <= opcode <= 0x7f and opcode & 0x07 != 6 and opcode & 0x38 != 0x30:
+            dst = (opcode >> 3) & 0x07                       # MOV r, r
+            src = opcode & 0x07
+            return [] if dst == src else [f'r[{dst}] = r[{src}]']
+        if opcode & 0xc7 == 0x06 and opcode != 0x36:         # MVI r
+            return [f'r[{(opcode >> 3) & 0x07}] = 0x{operands[0]:02X}']
+        if opcode & 0xcf == 0x01:                            # LXI
+            rp = (opcode >> 4) & 0x3
+            if rp == 3:
+                return [f'm._sp = 0x{operands[1]:02X}{operands[0]:02X}']
+            hi, lo = _PAIRS[rp]
+            return [f'r[{hi}] = 0x{operands[1]:02X}', f'r[{lo}] = 0x{operands[0]:02X}']
+        if opcode & 0xc7 == 0x03:                            # INX/DCX
+            rp = (opcode >> 4) & 0x3
+            delta = "- 1" if opcode & 0x08 else "+ 1"
+            if rp == 3:
+                return [f'm._sp = (m._sp {delta}) & 0xffff']
+            hi, lo = _PAIRS[rp]
+            return [f'v = (((r[{hi}] << 8) | r[{lo}]) {delta}) & 0xffff',
+                    f'r[{hi}] = v >> 8',
+                    f'r[{lo}] = v & 0xff']
+        if opcode == 0xeb:                                   # XCHG
+            return ['r[4], r[2] = r[2], r[4]', 'r[5], r[3] = r[3], r[5]']
+        if 0x80 <= opcode <= 0xbf and opcode & 0x07 != 6:    # ALU r
+            return [f'v = r[{opcode & 0x07}]'] + _ALU[(opcode >> 3) & 0x07]
+        if opcode & 0xc7 == 0xc6:                            # ALU immediate
+            op = (opcode >> 3) & 0x07
+            lines = [f'v = 0x{operands[0]:02X}'] + _ALU[op]
+            if op == 4:                                      # ANI clears AC, unlike ANA
+                lines[-1] = f'f.flags = (f.flags & {_KEEP_ARITHMETIC}) | SZP_FLAGS[r[7]]'
+            return lines
+        if opcode & 0xc7 == 0x04 and opcode != 0x34:         # INR r
+            reg = (opcode >> 3) & 0x07
+            return [f'v = r[{reg}]',
+                    f'f.flags = (f.flags & {_KEEP_INCREMENT}) | INR_FLAGS[v]',
+                    f'r[{reg}] = (v + 1) & 0xff']
+        if opcode & 0xc7 == 0x05 and opcode != 0x35:         # DCR r
+            reg = (opcode >> 3) & 0x07
+            return [f'v = r[{reg}]',
+                    f'f.flags = (f.flags & {_KEEP_INCREMENT}) | DCR_FLAGS[v]',
+                    f'r[{reg}] = (v - 1) & 0xff']
+        if opcode == 0x2f:                                   # CMA
+            return ['r[7] ^= 0xff']
+        if opcode == 0x37:                                   # STC
+            return [f'f.flags |= {1 << Flags.CARRY}']
+        if opcode == 0x3f:                                   # CMC
+            return [f'f.flags ^= {1 << Flags.CARRY}']
+        return None
@@ -2,7 +2,7 @@
 """
 from collections import namedtuple
 
-from utils import is_negative
+from utils import is_negative, byte_to_signed_int, int_to_signed_byte
 
 
 class InvalidFlagException(Exception):
@@ -147,6 +147,150 @@ class Flags:
         if is_negative(val):
             self.set(Flags.SIGN)
 
+    # The set_*_flags methods below take the operands of an ALU instruction
+    # and set every flag the instruction affects with one table lookup.
+
+    def set_add_flags(self, a, val):
+        """
+        Flags for (A) + val.  val may include the carry bit, so it can be 0x100.
+        Affects: Z, S, P, CY, AC
+        """
+        self.flags = (self.flags & _NOT_ARITHMETIC) | ADD_FLAGS[(a << 9) | val]
+
+    def set_sub_flags(self, a, val, borrow=0):
+        """
+        Flags for (A) - val - borrow, compared as signed bytes.  borrow is the
+        carry bit for SBB/SBI and 0 otherwise.
+        Affects: Z, S, P, CY, AC
+        """
+        self.flags = (self.flags & _NOT_ARITHMETIC) | SUB_FLAGS[(a << 9) | (borrow << 8) | val]
+
+    def set_logic_flags(self, res):
+        """
+        Flags for an OR, XOR or AND immediate result.  CY and AC are cleared.
+        Affects: Z, S, P, CY, AC
+        """
+        self.flags = (self.flags & _NOT_ARITHMETIC) | SZP_FLAGS[res]
+
+    def set_and_flags(self, res):
+        """
+        Flags for an ANA result.  CY is cleared, AC is left alone.
+        Affects: Z, S, P, CY
+        """
+        self.flags = (self.flags & _NOT_AND) | SZP_FLAGS[res]
+
+    def set_szp_flags(self, res):
+        """
+        Zero, sign and parity flags for res, for DAA which works out CY and AC
+        itself.
+        Affects: Z, S, P
+        """
+        self.flags = (self.flags & _NOT_SZP) | SZP_FLAGS[res]
+
+    def set_inr_flags(self, val):
+        """
+        Flags for incrementing val.
+        Affects: Z, S, P, AC
+        """
+        self.flags = (self.flags & _NOT_INCREMENT) | INR_FLAGS[val]
+
+    def set_dcr_flags(self, val):
+        """
+        Flags for decrementing val.
+        Affects: Z, S, P, AC
+        """
+        self.flags = (self.flags & _NOT_INCREMENT) | DCR_FLAGS[val]
+
+
+# groups of flags set together by the ALU instructions
+ARITHMETIC_FLAGS = (1 << Flags.CARRY) | (1 << Flags.PARITY) | (1 << Flags.AUX_CARRY) | \
+                   (1 << Flags.ZERO) | (1 << Flags.SIGN)
+AND_FLAGS = ARITHMETIC_FLAGS & ~(1 << Flags.AUX_CARRY)
+INCREMENT_FLAGS = ARITHMETIC_FLAGS & ~(1 << Flags.CARRY)
+SZP_FLAG_BITS = INCREMENT_FLAGS & ~(1 << Flags.AUX_CARRY)
+
+"""
+Flag lookup tables
+
+Each entry holds the flag bits an operation produces, so setting the flags
+for an ALU instruction is one table lookup and one mask.
+
+SZP_FLAGS  -- zero, sign and parity bits of a byte
+ADD_FLAGS  -- indexed by (A << 9) | val where val is 0-0x100 (the operand
+              plus the carry bit for ADC/ACI)
+SUB_FLAGS  -- indexed by (A << 9) | (CY << 8) | val for A - val - CY, where
+              CY is the borrow for SBB/SBI and 0 for SUB/SUI/CMP/CPI.
+              Operands are compared as signed bytes.
+INR_FLAGS  -- indexed by the value before it's incremented
+DCR_FLAGS  -- indexed by the value before it's decremented
+"""
+
+
+def _build_szp_table():
+    table = bytearray(256)
+    for b in range(256):
+        if b == 0:
+            table[b] |= 1 << Flags.ZERO
+        if is_negative(b):
+            table[b] |= 1 << Flags.SIGN
+        if bin(b).count("1") % 2 == 0:
+            table[b] |= 1 << Flags.PARITY
+    return bytes(table)
+
+
+SZP_FLAGS = _build_szp_table()
+
+
+def _build_add_table():
+    table = bytearray(256 << 9)
+    aux_carry = 1 << Flags.AUX_CARRY
+    carry = 1 << Flags.CARRY
+    for a in range(256):
+        for val in range(0x101):
+            res = a + val
+            bits = SZP_FLAGS[res & 0xff]
+            if (a & 0xf) + (val & 0xf) > 0xf:
+                bits |= aux_carry
+            if res > 0xff:
+                bits |= carry
+            table[(a << 9) | val] = bits
+    return bytes(table)
+
+
+def _build_sub_table():
+    table = bytearray(256 << 9)
+    aux_carry = 1 << Flags.AUX_CARRY
+    borrow = (1 << Flags.CARRY) | (1 << Flags.SIGN)
+    zero = 1 << Flags.ZERO
+    parity = 1 << Flags.PARITY
+    for a in range(256):
+        signed_a = byte_to_signed_int(a)
+        for cy in (0, 1):
+            for val in range(0x100):
+                signed_val = byte_to_signed_int(val) + cy
+                bits = SZP_FLAGS[int_to_signed_byte(signed_a - signed_val) & 0xff] & parity
+                if signed_a < signed_val:
+                    bits |= borrow
+                if (signed_a & 0x0f) < (val & 0x0f) + cy:
+                    bits |= aux_carry
+                if signed_a == signed_val:
+                    bits |= zero
+                table[(a << 9) | (cy << 8) | val] = bits
+    return bytes(table)
+
+
+ADD_FLAGS = _build_add_table()
+SUB_FLAGS = _build_sub_table()
+INR_FLAGS = bytes(SZP_FLAGS[(b + 1) & 0xff] | ((b & 0x0f) == 0x0f) << Flags.AUX_CARRY
+                  for b in range(256))
+DCR_FLAGS = bytes(SZP_FLAGS[(b - 1) & 0xff] | ((b & 0x0f) == 0x00) << Flags.AUX_CARRY
+                  for b in range(256))
+
+_NOT_ARITHMETIC = ~ARITHMETIC_FLAGS & 0xff
+_NOT_AND = ~AND_FLAGS & 0xff
+_NOT_INCREMENT = ~INCREMENT_FLAGS & 0xff
+_NOT_SZP = ~SZP_FLAG_BITS & 0xff
+
 
 class InvalidPairException(Exception):
     pass
@@ -155,9 +299,14 @@ class InvalidPairException(Exception):
 RegisterPair = namedtuple("RegisterPair", ["hi", "lo"])
 
 
-class Registers:
+class Registers(bytearray):
     """
     Encapsulates registers and provides easy access to them.
+
+    The register file is a bytearray indexed directly by the register
+    encoding (B=0 ... A=7), so reading or writing a register is a plain
+    index with no validation.  Slot 6 (M) is unused.  Use CheckedRegisters
+    to catch bad register numbers.
     """
     B = 0
     C = 1
@@ -169,8 +318,7 @@ class Registers:
     A = 7
 
     def __init__(self):
-        self._registers = {Registers.B: 0, Registers.C: 0, Registers.D: 0, Registers.E: 0,
-                           Registers.H: 0, Registers.L: 0, Registers.A: 0}
+        super().__init__(8)
         # some registers are accessed by pairs and the first register (keys) are used to indicate which pair
         self._pairs = {Registers.H: RegisterPair(Registers.H, Registers.L),
                        Registers.B: RegisterPair(Registers.B, Registers.C),
@@ -179,24 +327,28 @@ class Registers:
                     RegisterPair(Registers.D, Registers.E),
                     RegisterPair(Registers.H, Registers.L)]
 
-    def __getitem__(self, reg):
+    def get_pair(self, hi):
         """
-        Returns the value of the given register
-        :param reg:
-        :return:
+        Returns the 16-bit value of the pair whose first register is hi.
+        :param hi: Registers.B, Registers.D or Registers.H (not checked)
         """
-        if type(reg) != int:
-            raise TypeError("Expected register number")
-        if reg not in self._registers:
-            raise IndexError(reg)
-        return self._registers[reg]
+        return (self[hi] << 8) | self[hi + 1]
 
-    def __setitem__(self, reg, val):
-        if type(reg) != int:
-            raise TypeError("Expected register number")
-        if reg not in self._registers:
-            raise IndexError(reg)
-        self._registers[reg] = val
+    def set_pair(self, hi, val):
+        """
+        Stores the 16-bit value in the pair whose first register is hi.
+        :param hi: Registers.B, Registers.D or Registers.H (not checked)
+        :param val: value to store; only the low 16 bits are kept
+        """
+        self[hi] = (val >> 8) & 0xff
+        self[hi + 1] = val & 0xff
+
+    def restore(self, values):
+        """
+        Sets every register slot at once, without validation.
+        :param values: 8 bytes, as returned by bytes(registers)
+        """
+        bytearray.__setitem__(self, slice(None), values)
 
     def get_address_from_pair(self, register):
         """
@@ -210,10 +362,7 @@ class Registers:
         """
         if register not in self._pairs:
             raise InvalidPairException()
-        pair = self._pairs[register]
-        hi = self._registers[pair.hi]
-        lo = self._registers[pair.lo]
-        return (hi << 8) | lo
+        return self.get_pair(register)
 
     def get_value_from_pair(self, pair):
         """
@@ -221,9 +370,7 @@ class Registers:
         :param pair:  A RegisterPair tuple
         :return:
         """
-        hi = self._registers[pair.hi]
-        lo = self._registers[pair.lo]
-        return (hi << 8) | lo
+        return (self[pair.hi] << 8) | self[pair.lo]
 
     def set_value_pair(self, pair, val):
         """
@@ -231,8 +378,8 @@ class Registers:
         :param pair: A RegisterPair tuple
         :param val:  The value to store.
         """
-        self._registers[pair.hi] = (val >> 8) & 0xff
-        self._registers[pair.lo] = val & 0xff
+        self[pair.hi] = (val >> 8) & 0xff
+        self[pair.lo] = val & 0xff
 
     @staticmethod
     def get_register_from_opcode(opcode, bit_offset):
@@ -259,3 +406,44 @@ class Registers:
         """
         return self._rp[pair_encoding]
 
+
+class CheckedRegisters(Registers):
+    """
+    Registers that validate every access.
+
+    Register numbers must be ints naming one of B, C, D, E, H, L or A and
+    values must fit in a byte.  Pairs must start at B, D or H.
+    """
+    _VALID = frozenset((Registers.B, Registers.C, Registers.D, Registers.E,
+                        Registers.H, Registers.L, Registers.A))
+
+    def __getitem__(self, reg):
+        """
+        Returns the value of the given register
+        :param reg:
+        :return:
+        """
+        if type(reg) != int:
+            raise TypeError("Expected register number")
+        if reg not in self._VALID:
+            raise IndexError(reg)
+        return super().__getitem__(reg)
+
+    def __setitem__(self, reg, val):
+        if type(reg) != int:
+            raise TypeError("Expected register number")
+        if reg not in self._VALID:
+            raise IndexError(reg)
+        if not 0 <= val <= 0xff:
+            raise ValueError(f'{val:X} does not fit in register {reg}')
+        super().__setitem__(reg, val)
+
+    def get_pair(self, hi):
+        if hi not in self._pairs:
+            raise InvalidPairException()
+        return super().get_pair(hi)
+
+    def set_pair(self, hi, val):
+        if hi not in self._pairs:
+            raise InvalidPairException()
+        super().set_pair(hi, val)
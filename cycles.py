@@ -0,0 +1,41 @@
+"""
+Instruction timing for the 8080.
+
+CYCLES holds the number of clock cycles (T-states) taken by each opcode.
+Conditional calls and returns are listed with their not-taken times; when
+the condition is met they take CALL_TAKEN_EXTRA or RET_TAKEN_EXTRA more.
+Conditional jumps take 10 cycles either way.
+
+The undocumented opcodes are timed like the instructions they mirror on
+real hardware.
+"""
+
+# clock rate of the 8080 in Space Invaders
+CLOCK_HZ = 2000000
+
+CALL_TAKEN_EXTRA = 6    # Ccc: 11 not taken, 17 taken
+RET_TAKEN_EXTRA = 6     # Rcc: 5 not taken, 11 taken
+
+CYCLES = bytes([
+    #  0   1   2   3   4   5   6   7   8   9   A   B   C   D   E   F
+       4, 10,  7,  5,  5,  5,  7,  4,  4, 10,  7,  5,  5,  5,  7,  4,   # 0
+       4, 10,  7,  5,  5,  5,  7,  4,  4, 10,  7,  5,  5,  5,  7,  4,   # 1
+       4, 10, 16,  5,  5,  5,  7,  4,  4, 10, 16,  5,  5,  5,  7,  4,   # 2
+       4, 10, 13,  5, 10, 10, 10,  4,  4, 10, 13,  5,  5,  5,  7,  4,   # 3
+       5,  5,  5,  5,  5,  5,  7,  5,  5,  5,  5,  5,  5,  5,  7,  5,   # 4
+       5,  5,  5,  5,  5,  5,  7,  5,  5,  5,  5,  5,  5,  5,  7,  5,   # 5
+       5,  5,  5,  5,  5,  5,  7,  5,  5,  5,  5,  5,  5,  5,  7,  5,   # 6
+       7,  7,  7,  7,  7,  7,  7,  7,  5,  5,  5,  5,  5,  5,  7,  5,   # 7
+       4,  4,  4,  4,  4,  4,  7,  4,  4,  4,  4,  4,  4,  4,  7,  4,   # 8
+       4,  4,  4,  4,  4,  4,  7,  4,  4,  4,  4,  4,  4,  4,  7,  4,   # 9
+       4,  4,  4,  4,  4,  4,  7,  4,  4,  4,  4,  4,  4,  4,  7,  4,   # A
+       4,  4,  4,  4,  4,  4,  7,  4,  4,  4,  4,  4,  4,  4,  7,  4,   # B
+       5, 10, 10, 10, 11, 11,  7, 11,  5, 10, 10, 10, 11, 17,  7, 11,   # C
+       5, 10, 10, 10, 11, 11,  7, 11,  5, 10, 10, 10, 11, 17,  7, 11,   # D
+       5, 10, 10, 18, 11, 11,  7, 11,  5,  5, 10,  4, 11, 17,  7, 11,   # E
+       5, 10, 10,  4, 11, 11,  7, 11,  5,  5, 10,  4, 11, 17,  7, 11,   # F
+])
+
+# the most a block ending in each opcode can take beyond its table time
+TAKEN_EXTRA = {opcode: CALL_TAKEN_EXTRA for opcode in (0xc4, 0xcc, 0xd4, 0xdc, 0xe4, 0xec, 0xf4, 0xfc)}
+TAKEN_EXTRA.update({opcode: RET_TAKEN_EXTRA for opcode in (0xc0, 0xc8, 0xd0, 0xd8, 0xe0, 0xe8, 0xf0, 0xf8)})
@@ -0,0 +1,42 @@
+"""
+Devices that plug into the IOBus.
+"""
+
+
+class ShiftRegister:
+    """
+    The external 16-bit shift register on the Space Invaders board.
+
+    Writing a byte to the data port shifts it into the top of the register
+    (the old top byte moves to the bottom).  Writing to the offset port sets
+    a shift amount of 0-7, and reading the result port returns the 8 bits
+    starting that many bits below the top of the register.
+
+    The 8080 has no barrel shifter, so the game uses this to draw sprites at
+    any pixel offset.
+    """
+    OFFSET_PORT = 2
+    RESULT_PORT = 3
+    DATA_PORT = 4
+
+    def __init__(self):
+        self.value = 0
+        self.offset = 0
+
+    def attach(self, bus, offset_port=OFFSET_PORT, result_port=RESULT_PORT, data_port=DATA_PORT):
+        """Maps the register's ports on the bus.
+
+        :param bus: IOBus to attach to
+        """
+        bus.map(offset_port, write=self.write_offset)
+        bus.map(result_port, read=self.read_result)
+        bus.map(data_port, write=self.write_data)
+
+    def write_offset(self, port, val):
+        self.offset = val & 0x07
+
+    def write_data(self, port, val):
+        self.value = (val << 8) | (self.value >> 8)
+
+    def read_result(self, port):
+        return ((self.value << self.offset) >> 8) & 0xff
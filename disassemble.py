@@ -1,5 +1,6 @@
 import argparse
-from machine import Machine8080, RomLoadException, RomException
+from machine import Machine8080, RomException
+from loader import RomLoadException
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(usage="./disassemble.py ROM")
@@ -0,0 +1,123 @@
+"""
+Predecoded instruction tables used by Machine8080.run().
+
+Instead of building an OpCode/operand list for every instruction executed,
+each address is decoded once into a set of flat per-address tables:
+
+    opcodes   -- opcode byte found at the address
+    lengths   -- length of the instruction (opcode + operands)
+    words     -- operand bytes packed little-endian into a 16-bit word
+    operands  -- operand tuple handed to the handler (shared, never rebuilt)
+    handlers  -- bound handler method from the machine's opcode table
+    cycles    -- clock cycles the instruction takes (not-taken time for
+                 conditional calls and returns)
+
+An address that hasn't been decoded yet has a handler of None.
+
+The tables take about 1.4 MB, so they aren't allocated until allocate() is
+called by the first run() or step().  Machines that only use execute(),
+and forks that haven't run yet, never pay for them.
+
+Every 256-byte page that holds a decoded instruction gets CODE_PAGE set in
+the machine's page flags so that Machine8080.write_memory() can tell when a
+write lands on code and invalidate just the instructions it overlaps.
+"""
+from array import array
+
+from cycles import CYCLES
+from memory import MEMORY_SIZE, CODE_PAGE
+
+# the PC can step past the end of memory after the last instruction; the
+# slots past the end hold the end-of-memory handler.
+_TABLE_SIZE = MEMORY_SIZE + 2
+
+# clears CODE_PAGE from every page flags byte (with bytes.translate)
+_CLEAR_CODE_PAGE = bytes(flags & ~CODE_PAGE for flags in range(256))
+
+# copied over the handler table to clear it without building a new list
+_UNDECODED = (None,) * MEMORY_SIZE
+
+# one-byte operands are shared between every address that uses them
+_BYTE_OPERANDS = tuple((b,) for b in range(256))
+
+
+class DecodeCache:
+    def __init__(self, opcodes, end_of_memory, page_flags):
+        """
+        :param opcodes: the machine's OpCode table, indexed by opcode byte
+        :param end_of_memory: handler run when the PC walks off the end of memory
+        :param page_flags: the machine's page flags (see memory.py); CODE_PAGE
+                           is set for pages holding decoded instructions
+        """
+        self._opcode_table = opcodes
+        self._end_of_memory = end_of_memory
+        self.page_flags = page_flags
+        self.invalidations = 0
+        self.opcodes = None
+        self.lengths = None
+        self.words = None
+        self.operands = None
+        self.handlers = None  # None until allocate()
+        self.cycles = None
+
+    def allocate(self):
+        """Allocates the tables if they haven't been already.
+        """
+        if self.handlers is not None:
+            return
+        self.opcodes = bytearray(_TABLE_SIZE)
+        self.lengths = bytearray(_TABLE_SIZE)
+        self.words = array('H', bytes(2 * _TABLE_SIZE))
+        self.operands = [()] * _TABLE_SIZE
+        self.handlers = [None] * MEMORY_SIZE + [self._end_of_memory] * (_TABLE_SIZE - MEMORY_SIZE)
+        self.cycles = bytearray(_TABLE_SIZE)
+
+    def clear(self):
+        """Forgets every decoded instruction.
+        """
+        self.page_flags[:] = self.page_flags.translate(_CLEAR_CODE_PAGE)
+        if self.handlers is None:
+            return
+        self.handlers[:MEMORY_SIZE] = _UNDECODED
+        for address in range(MEMORY_SIZE, _TABLE_SIZE):
+            self.handlers[address] = self._end_of_memory
+
+    def decode(self, memory, address):
+        """Decodes the instruction at address into the tables.
+
+        :param memory: memory to decode from
+        :param address: address of the opcode
+        :return: the handler for the instruction
+        :raises IndexError: if the instruction's operands run past the end of memory
+        """
+        op = self._opcode_table[memory[address]]
+        if op.length == 1:
+            operands = ()
+            word = 0
+        elif op.length == 2:
+            word = memory[address + 1]
+            operands = _BYTE_OPERANDS[word]
+        else:
+            lo = memory[address + 1]
+            hi = memory[address + 2]
+            word = (hi << 8) | lo
+            operands = (lo, hi)
+        self.opcodes[address] = op.opcode
+        self.lengths[address] = op.length
+        self.words[address] = word
+        self.operands[address] = operands
+        self.handlers[address] = op.handler
+        self.cycles[address] = CYCLES[op.opcode]
+        self.page_flags[address >> 8] |= CODE_PAGE
+        self.page_flags[((address + op.length - 1) >> 8) & 0xff] |= CODE_PAGE
+        return op.handler
+
+    def invalidate(self, address):
+        """Forgets any decoded instruction that includes the byte at address.
+        """
+        if self.handlers is None:
+            return
+        for start in range(max(address - 2, 0), address + 1):
+            if self.handlers[start] is not None and start + self.lengths[start] > address:
+                self.handlers[start] = None
+                self.invalidations += 1
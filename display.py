@@ -0,0 +1,109 @@
+"""
+Frame renderer for the Space Invaders video RAM.
+
+The video RAM is 7 KB at 0x2400: 224 rows of 32 bytes, one bit per pixel
+with the least significant bit first.  The monitor is mounted rotated 90
+degrees counter-clockwise, so each 256-pixel row of memory is a column of
+the picture, drawn bottom to top, and the picture is 224 pixels wide and 256
+tall.
+
+Frames are built with NumPy straight from a memoryview of the machine's
+memory: unpackbits expands the bytes, and a transpose and flip rotate them.
+No pixel is touched by Python code.
+
+The expanded bits are cached between frames.  The machine marks each
+32-byte row of video RAM that write_memory() touches (see
+Machine8080.track_writes), and render() only re-expands those rows, so a
+frame costs in proportion to what changed rather than to the screen size.
+"""
+import numpy as np
+
+VIDEO_RAM = 0x2400
+VIDEO_RAM_SIZE = 0x1c00
+WIDTH = 224
+HEIGHT = 256
+
+# black background, white pixels
+MONOCHROME = ((0x00, 0x00, 0x00), (0xff, 0xff, 0xff))
+
+
+class Display:
+    def __init__(self, machine, palette=MONOCHROME):
+        """
+        :param machine: Machine8080 whose video RAM is drawn
+        :param palette: RGB colours for pixels that are off and on
+        """
+        self._machine = machine
+        self._memory = None
+        self._vram = None
+        self._bits = np.zeros((WIDTH, HEIGHT), dtype=np.uint8)
+        self._rgb = np.zeros((WIDTH, HEIGHT, 3), dtype=np.uint8)
+        self._rgb_stale = np.zeros(WIDTH, dtype=bool)
+        self._dirty = machine.track_writes(VIDEO_RAM, VIDEO_RAM_SIZE)
+        self.palette = np.array(palette, dtype=np.uint8)
+        self.frames = 0
+
+    def _bind(self):
+        """Views the video RAM of the machine's current memory.  load()
+        replaces the memory, so this is checked on every frame.
+        """
+        self._memory = self._machine._memory
+        view = memoryview(self._memory)[VIDEO_RAM:VIDEO_RAM + VIDEO_RAM_SIZE]
+        self._vram = np.frombuffer(view, dtype=np.uint8).reshape(WIDTH, HEIGHT // 8)
+        self.invalidate()
+
+    def invalidate(self):
+        """Redraws every row on the next frame.  Needed after video RAM is
+        changed without going through write_memory().
+        """
+        self._dirty[:] = b'\x01' * WIDTH
+
+    def _update(self):
+        """Re-expands the rows of video RAM written since the last frame into
+        the cached bits and marks them for render_rgb().
+        """
+        if self._machine._memory is not self._memory:
+            self._bind()
+        self.frames += 1
+        dirty = self._dirty
+        if dirty.find(1) < 0:
+            return
+        if dirty.find(0) < 0:
+            self._bits[:] = np.unpackbits(self._vram, axis=1, bitorder='little')
+            self._rgb_stale[:] = True
+        else:
+            rows = np.flatnonzero(np.frombuffer(dirty, dtype=np.uint8))
+            self._bits[rows] = np.unpackbits(self._vram[rows], axis=1, bitorder='little')
+            self._rgb_stale[rows] = True
+        dirty[:] = bytes(WIDTH)
+
+    def render(self):
+        """Returns the current frame as a HEIGHT x WIDTH array of 0s and 1s,
+        top row first.  The array is a view of the cached frame, so it
+        changes when the next frame is rendered.
+        """
+        self._update()
+        return self._bits.T[::-1]
+
+    def render_rgb(self):
+        """Returns the current frame as a HEIGHT x WIDTH x 3 array of colours,
+        again a view of a cached frame.
+        """
+        self._update()
+        rows = np.flatnonzero(self._rgb_stale)
+        if len(rows):
+            self._rgb[rows] = np.take(self.palette, self._bits[rows], axis=0)
+            self._rgb_stale[:] = False
+        return self._rgb.transpose(1, 0, 2)[::-1]
+
+    def write_raw(self, stream):
+        """Writes the frame to stream as WIDTH * HEIGHT bytes, 0x00 or 0xff,
+        top row first.
+        """
+        stream.write((self.render() * 0xff).astype(np.uint8).tobytes())
+
+    def write_ppm(self, stream):
+        """Writes the frame to stream as a binary (P6) PPM image.
+        """
+        stream.write(b'P6\n%d %d\n255\n' % (WIDTH, HEIGHT))
+        stream.write(self.render_rgb().tobytes())
@@ -1,16 +1,64 @@
 """
 implements a class that emulates the IO bus.  I guess (though I'm not positive)
 that this will also then include "connections" to the graphics.
+
+Devices register read and write handlers for the ports they answer on.  The
+handlers are kept in two 256-entry lists indexed by port number, so IN and
+OUT are a list index and a call.  Ports nobody has mapped behave like a
+latch: a read returns the last value written to the port (0 at first).
+
+Every access is counted per port in read_counts and write_counts.
 """
+from array import array
+
+PORT_COUNT = 256
 
 
 class IOBus:
     def __init__(self):
-        self.ports = {}
+        self.latched = bytearray(PORT_COUNT)
+        self.readers = [self.latched.__getitem__] * PORT_COUNT
+        self.writers = [self.latched.__setitem__] * PORT_COUNT
+        self.read_counts = array('L', [0]) * PORT_COUNT
+        self.write_counts = array('L', [0]) * PORT_COUNT
+
+    def map(self, port, read=None, write=None):
+        """Connects handlers to a port.
+
+        :param port: port number, 0-255
+        :param read: called as read(port) for IN; returns the byte read.
+                     If None the port's read side is left alone.
+        :param write: called as write(port, val) for OUT.  If None the port's
+                      write side is left alone.
+        """
+        if read is not None:
+            self.readers[port] = read
+        if write is not None:
+            self.writers[port] = write
+
+    def unmap(self, port):
+        """Puts the port back to the default latch behaviour.
+        """
+        self.readers[port] = self.latched.__getitem__
+        self.writers[port] = self.latched.__setitem__
 
     def read(self, port):
-        return self.ports.setdefault(port, 0)
+        self.read_counts[port] += 1
+        return self.readers[port](port)
 
     def write(self, port, val):
-        self.ports[port] = val
+        self.write_counts[port] += 1
+        self.writers[port](port, val)
+
+    def counts(self):
+        """Returns {port: (reads, writes)} for every port that was accessed.
+        """
+        return {port: (self.read_counts[port], self.write_counts[port])
+                for port in range(PORT_COUNT)
+                if self.read_counts[port] or self.write_counts[port]}
 
+    def reset_counts(self):
+        """Zeroes the access counters.
+        """
+        self.read_counts = array('L', [0]) * PORT_COUNT
+        self.write_counts = array('L', [0]) * PORT_COUNT
@@ -0,0 +1,181 @@
+"""
+Loads ROM images into the 64 KB address space.
+
+ROM files are memory-mapped read-only and copied into memory with a single
+slice assignment, so the file is never read into an intermediate bytes
+object and the memory is never built up from a list.  Images that are
+already in memory (bytes, bytearray, memoryview or anything else with the
+buffer interface) are copied the same way with no file I/O at all.
+
+Arcade boards spread their ROM over several chips, so a ROM set is given as
+a manifest of RomEntry(source, address, crc32) records that are copied into
+one address space, each checked against its CRC-32 when one is given.
+INVADERS is the manifest for the four 2 KB Space Invaders chips.
+
+Intel HEX files (.hex, .ihx) are parsed a record at a time as they are read,
+and each data record is copied straight to its address.
+"""
+from collections import namedtuple
+import mmap
+import os
+import zlib
+
+MEMORY_SIZE = 0x10000
+HEX_EXTENSIONS = ('.hex', '.ihx')
+
+RomEntry = namedtuple('RomEntry', ['source', 'address', 'crc32'], defaults=(0, None))
+
+INVADERS = (
+    RomEntry('invaders.h', 0x0000, 0x734f5ad8),
+    RomEntry('invaders.g', 0x0800, 0x6bfaca4a),
+    RomEntry('invaders.f', 0x1000, 0x0ccead96),
+    RomEntry('invaders.e', 0x1800, 0x14e538b0),
+)
+
+# Intel HEX record types
+HEX_DATA = 0x00
+HEX_END_OF_FILE = 0x01
+HEX_EXTENDED_SEGMENT_ADDRESS = 0x02
+HEX_EXTENDED_LINEAR_ADDRESS = 0x04
+
+
+class RomLoadException(Exception):
+    def __init__(self, msg):
+        self._msg = msg
+
+    def __str__(self):
+        return self._msg
+
+
+def copy_rom(memory, source, address=0, crc32=None):
+    """Copies a ROM image into memory.
+
+    :param memory: bytearray to copy into
+    :param source: path of a ROM file, or a bytes-like object holding the image.
+                   Files ending in .hex or .ihx are read as Intel HEX (see
+                   copy_hex), with address added to every record's address.
+    :param address: address the image starts at
+    :param crc32: CRC-32 the image must have, or None to skip the check.
+                  Not used for Intel HEX files, whose records carry their own
+                  checksums.
+    :return: number of bytes copied
+
+    :raises RomLoadException: if the file cannot be read, the image doesn't
+                              fit in memory or its CRC-32 doesn't match
+    """
+    if not isinstance(source, (str, os.PathLike)):
+        return _copy(memory, memoryview(source).cast('B'), address, crc32, "image")
+    if os.fspath(source).lower().endswith(HEX_EXTENSIONS):
+        return copy_hex(memory, source, address)
+    try:
+        with open(source, "rb") as fp:
+            if os.fstat(fp.fileno()).st_size == 0:
+                return _copy(memory, b'', address, crc32, source)
+            with mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ) as image:
+                return _copy(memory, image, address, crc32, source)
+    except OSError as e:
+        raise RomLoadException("{0}".format(e))
+
+
+def _copy(memory, image, address, crc32=None, name="image"):
+    end = address + len(image)
+    if address < 0 or end > len(memory):
+        raise RomLoadException("{0}: {1} bytes at {2:04X} don't fit in memory".format(name, len(image), address))
+    if crc32 is not None and zlib.crc32(image) != crc32:
+        raise RomLoadException("{0}: CRC-32 is {1:08x}, expected {2:08x}".format(name, zlib.crc32(image), crc32))
+    memory[address:end] = image
+    return len(image)
+
+
+def copy_hex(memory, source, offset=0):
+    """Copies the data records of an Intel HEX file into memory.
+
+    The file is parsed one line at a time, so it's never held in memory as a
+    whole.  Extended segment and linear address records move the base
+    address; start address records are ignored.
+
+    :param memory: bytearray to copy into
+    :param source: path of the file, or an iterable of its lines (an open
+                   text file, for instance)
+    :param offset: added to the address of every record
+    :return: number of bytes copied
+
+    :raises RomLoadException: if the file cannot be read, a record is
+                              malformed or fails its checksum, or data falls
+                              outside memory
+    """
+    if not isinstance(source, (str, os.PathLike)):
+        return _copy_records(memory, source, offset, "<stream>")
+    try:
+        with open(source, "r") as fp:
+            return _copy_records(memory, fp, offset, source)
+    except OSError as e:
+        raise RomLoadException("{0}".format(e))
+
+
+def _copy_records(memory, lines, offset, name):
+    base = 0
+    copied = 0
+    for number, line in enumerate(lines, 1):
+        line = line.strip()
+        if not line:
+            continue
+        where = "{0}:{1}".format(name, number)
+        if line[0] != ':':
+            raise RomLoadException("{0}: record doesn't start with ':'".format(where))
+        try:
+            record = bytes.fromhex(line[1:])
+        except ValueError:
+            raise RomLoadException("{0}: record isn't hexadecimal".format(where))
+        if len(record) < 5 or len(record) != record[0] + 5:
+            raise RomLoadException("{0}: record length doesn't match its byte count".format(where))
+        if sum(record) & 0xff:
+            raise RomLoadException("{0}: bad record checksum".format(where))
+        kind = record[3]
+        if kind == HEX_DATA:
+            address = offset + base + ((record[1] << 8) | record[2])
+            copied += _copy(memory, memoryview(record)[4:-1], address, name=where)
+        elif kind == HEX_END_OF_FILE:
+            break
+        elif kind in (HEX_EXTENDED_SEGMENT_ADDRESS, HEX_EXTENDED_LINEAR_ADDRESS) and record[0] != 2:
+            raise RomLoadException("{0}: address record needs 2 data bytes".format(where))
+        elif kind == HEX_EXTENDED_SEGMENT_ADDRESS:
+            base = ((record[4] << 8) | record[5]) << 4
+        elif kind == HEX_EXTENDED_LINEAR_ADDRESS:
+            base = ((record[4] << 8) | record[5]) << 16
+    return copied
+
+
+def load_rom_set(entries, directory=None):
+    """Returns a new 64 KB memory holding every image of a ROM set.
+
+    :param entries: RomEntry records (or (source, address[, crc32]) tuples)
+    :param directory: directory that relative file names are found in
+
+    :raises RomLoadException: if an image cannot be read, doesn't fit or
+                              fails its CRC-32 check
+    """
+    memory = bytearray(MEMORY_SIZE)
+    for entry in entries:
+        source, address, crc32 = RomEntry(*entry)
+        if directory is not None and isinstance(source, (str, os.PathLike)):
+            source = os.path.join(directory, source)
+        copy_rom(memory, source, address, crc32)
+    return memory
+
+
+def load_rom(source):
+    """Returns a new 64 KB memory holding the ROM and zeros everywhere else.
+
+    :param source: path of a ROM file (binary or Intel HEX), a bytes-like
+                   object holding the image, or a list or tuple of RomEntry
+                   records for a ROM set
+
+    :raises RomLoadException: if the ROM cannot be read or doesn't fit in
+                              64 KB
+    """
+    if isinstance(source, (list, tuple)):
+        return load_rom_set(source)
+    memory = bytearray(MEMORY_SIZE)
+    copy_rom(memory, source)
+    return memory
@@ -0,0 +1,181 @@
+"""
+Differential lockstep runner: runs two Machine8080s that should behave the
+same (a trusted reference engine and a faster candidate) side by side and
+finds the first instruction after which they disagree.
+
+Both machines are run `interval` cycles at a time and compared after each
+run: PC, SP, registers, flags, cycle count, interrupt and halt state, and
+optionally memory.  run() stops on the first instruction boundary at or past
+its budget, which is the same boundary in every engine, so engines are
+kept in step by cycles rather than by instruction counts (compiled blocks
+can't stop after a given number of instructions, but they do stop on the
+same cycle boundaries as predecoded dispatch).
+
+Each machine is snapshotted before every run.  When a comparison fails,
+both are restored and re-run with a budget found by binary search, down to
+the last budget after which they still agree and the next one after which
+they don't.  These stop one instruction apart, and that instruction is the
+one reported.  The search needs the machines to be deterministic:
+snapshots don't hold IO devices or scheduled events, so these have to give
+the same results when the same cycles are run again.
+"""
+import argparse
+from collections import namedtuple
+
+from cpu import Registers
+from machine import Machine8080
+from loader import RomLoadException
+
+ENGINES = {
+    "predecoded": {},
+    "blocks": {"compile_blocks": True},
+}
+
+REGISTER_NAMES = (("B", Registers.B), ("C", Registers.C), ("D", Registers.D), ("E", Registers.E),
+                  ("H", Registers.H), ("L", Registers.L), ("A", Registers.A))
+
+# one field that differs between the machines
+Difference = namedtuple('Difference', ['field', 'reference', 'candidate'])
+# where the machines diverged: the cycle count and PC of the instruction
+# after which they disagree (the machines' state before it runs), the
+# instruction disassembled, and how they differ after it
+Divergence = namedtuple('Divergence', ['cycle', 'pc', 'instruction', 'differences'])
+
+
+def differences(reference, candidate, memory=False):
+    """Returns a Difference for every part of the two machines' state that
+    isn't the same.
+
+    :param memory: compare memory too; only the first differing address is
+                   reported
+    """
+    found = []
+    for field, value in (("pc", lambda m: m._pc), ("sp", lambda m: m._sp),
+                         ("flags", lambda m: m._flags.flags), ("cycles", lambda m: m._cycles),
+                         ("interrupts", lambda m: m._interrupts), ("halted", lambda m: m._halted)):
+        if value(reference) != value(candidate):
+            found.append(Difference(field, value(reference), value(candidate)))
+    if reference._registers != candidate._registers:
+        for name, index in REGISTER_NAMES:
+            if reference._registers[index] != candidate._registers[index]:
+                found.append(Difference(name, reference._registers[index], candidate._registers[index]))
+    if memory and reference._memory[:] != candidate._memory[:]:
+        for address, (expected, actual) in enumerate(zip(reference._memory, candidate._memory)):
+            if expected != actual:
+                found.append(Difference("memory[{0:04X}]".format(address), expected, actual))
+                break
+    return found
+
+
+def disassemble_at(machine, address):
+    """Returns the instruction at address as text, e.g. "CALL $1A5F".
+    """
+    op = machine.opcodes[machine.read_byte(address)]
+    operands = [machine.read_byte(address + i) for i in range(1, op.length)]
+    return "{0} {1}".format(op.mnemonic, Machine8080.format_operand(op, operands)).strip()
+
+
+class Lockstep:
+    def __init__(self, reference, candidate, interval=1000, memory=False):
+        """
+        :param reference: Machine8080 running the engine trusted to be right
+        :param candidate: Machine8080 running the engine being checked, in
+                          the same state as reference
+        :param interval: cycles run between comparisons
+        :param memory: compare memory as well as registers at each check
+        """
+        self.reference = reference
+        self.candidate = candidate
+        self.interval = interval
+        self.memory = memory
+        self.checks = 0
+
+    def run(self, cycles):
+        """Runs both machines for cycles cycles, or until they diverge.
+
+        :return: a Divergence, with both machines left just after the
+                 diverging instruction, or None if they agreed throughout
+        """
+        reference = self.reference
+        end = reference.cycles + cycles
+        while reference.cycles < end:
+            budget = min(self.interval, end - reference.cycles)
+            saved = (reference.snapshot(), self.candidate.snapshot())
+            reference.run(cycles=budget)
+            self.candidate.run(cycles=budget)
+            self.checks += 1
+            if differences(reference, self.candidate, self.memory):
+                return self._bisect(saved, budget)
+            if reference.halted and not reference._interrupts:
+                # nothing can wake it
+                break
+        return None
+
+    def _run_from(self, saved, budget):
+        """Restores both machines from saved and runs them budget cycles.
+        """
+        for machine, state in zip((self.reference, self.candidate), saved):
+            machine.restore(state)
+            if budget:
+                machine.run(cycles=budget)
+
+    def _bisect(self, saved, budget):
+        """Finds the shortest budget after which the machines differ when run
+        from saved, knowing they agree after 0 cycles and differ after
+        budget.
+        """
+        agree, differ = 0, budget
+        while differ - agree > 1:
+            middle = (agree + differ) // 2
+            self._run_from(saved, middle)
+            if differences(self.reference, self.candidate, self.memory):
+                differ = middle
+            else:
+                agree = middle
+        self._run_from(saved, agree)
+        cycle = self.reference.cycles
+        pc = self.reference._pc
+        instruction = disassemble_at(self.reference, pc)
+        self._run_from(saved, differ)
+        return Divergence(cycle, pc, instruction, differences(self.reference, self.candidate, self.memory))
+
+
+def compare(rom, candidate="blocks", reference="predecoded", cycles=10000000, interval=1000, memory=False):
+    """Loads rom into a machine for each engine and runs them in lockstep.
+
+    :param rom: anything Machine8080.load() accepts
+    :param candidate: name of the engine in ENGINES to check
+    :param reference: name of the engine in ENGINES to check it against
+    :return: a Divergence, or None if they agreed throughout
+    """
+    machines = []
+    for engine in (reference, candidate):
+        machine = Machine8080(**ENGINES[engine])
+        machine.load(rom)
+        machines.append(machine)
+    return Lockstep(*machines, interval=interval, memory=memory).run(cycles)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(usage="./lockstep.py ROM")
+    parser.add_argument("rom", metavar="ROM", help="The ROM to run")
+    parser.add_argument("--candidate", choices=sorted(ENGINES), default="blocks", help="Engine to check")
+    parser.add_argument("--reference", choices=sorted(ENGINES), default="predecoded",
+                        help="Engine to check it against")
+    parser.add_argument("--cycles", type=int, default=10000000, help="Clock cycles to run")
+    parser.add_argument("--interval", type=int, default=1000, help="Clock cycles between comparisons")
+    parser.add_argument("--memory", action="store_true", help="Compare memory as well as registers")
+
+    args = parser.parse_args()
+    try:
+        divergence = compare(args.rom, args.candidate, args.reference, args.cycles, args.interval, args.memory)
+    except RomLoadException as e:
+        print("Error reading ROM: {0}".format(e))
+    else:
+        if divergence is None:
+            print("{0} and {1} agree for {2} cycles".format(args.reference, args.candidate, args.cycles))
+        else:
+            print("Diverged at cycle {0} after {1:04X}: {2}".format(divergence.cycle, divergence.pc,
+                                                                   divergence.instruction))
+            for d in divergence.differences:
+                print("  {0}: {1} expected, {2} got".format(d.field, d.reference, d.candidate))
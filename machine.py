@@ -1,34 +1,20 @@
 import sys
 import logging
 from collections import namedtuple
-import time
 
-from cpu import Flags, Registers, RegisterPair
-from utils import byte_to_signed_int, int_to_signed_byte
+from cpu import Flags, Registers, CheckedRegisters, RegisterPair
 from iobus import IOBus
-
-class Timing:
-    def __init__(self, name):
-        self.name = name
-        self.avg = 0
-
-    def add_time(self, t):
-        if self.avg == 0:
-            self.avg = t
-        else:
-            self.avg = (self.avg + t) / 2
-        
-__instruction_times = {}
-
-def clock(func):
-    def clocked(*args):
-        t0 = time.perf_counter()
-        func(*args)
-        elapsed = time.perf_counter() - t0
-        timing = __instruction_times.setdefault(func.__name__, 
-                                                Timing(func.__name__))
-        timing.add_time(elapsed)
-    return clocked
+from loader import load_rom
+import snapshot
+from dispatch import DecodeCache
+from memory import MemoryMap, copy_on_write, PAGE_COUNT, CODE_PAGE, WATCHED_PAGE, MAPPED_PAGE
+from blocks import BlockCompiler, MAX_BLOCK_CYCLES
+from scheduler import Scheduler, NEVER
+from cycles import CYCLES, CALL_TAKEN_EXTRA, RET_TAKEN_EXTRA
+
+# write_memory() marks writes to a tracked range in rows of this many bytes
+DIRTY_ROW_SHIFT = 5
+DIRTY_ROW_SIZE = 1 << DIRTY_ROW_SHIFT
 
 """
 OpCode object
@@ -56,14 +42,6 @@ M  -- 111  (negative/minus)
 """
 ConditionalFlag = namedtuple('ConditionalFlag', ['flag', 'val'])
 
-class RomLoadException(Exception):
-    def __init__(self, msg):
-        self._msg = msg
-
-    def __str__(self):
-        return self._msg
-
-
 class RomException(Exception):
     def __init__(self, msg):
         self._msg = msg
@@ -95,13 +73,38 @@ class HaltException(Exception):
 
 
 class Machine8080:
-    def __init__(self):
+    def __init__(self, compile_blocks=False, checked_registers=False, memory_map=None, tracer=None,
+                 profiler=None):
+        """
+        :param compile_blocks: if True, run() translates basic blocks into
+                               Python functions instead of dispatching
+                               one instruction at a time.
+        :param checked_registers: if True, every register access is validated
+                                  (see cpu.CheckedRegisters).  Slower; meant
+                                  for debugging and tests.
+        :param memory_map: memory.MemoryMap declaring ROM, mirrored and device
+                           regions.  By default all memory is RAM.
+        :param tracer: tracing.Tracer that records every instruction executed.
+                       Without one the handlers run untraced at no cost.
+        :param profiler: profiler.OpcodeProfiler or profiler.GuestProfiler, or a
+                         list of them.  Like the tracer they cost nothing
+                         when not given.
+        """
         self._memory = None
         self._pc = 0
         self._flags = Flags()
-        self._registers = Registers()
+        self._registers = CheckedRegisters() if checked_registers else Registers()
         self._sp = 0
-        self._interrupts = True # true for enabled... this will change
+        self._cycles = 0
+        self._interrupts = False  # interrupts are disabled at reset
+        self._ei_delay = False  # set by EI until the next instruction has run
+        self._pending_interrupt = None  # RST vector of the interrupt waiting to be taken
+        self._interrupt_raised_at = 0
+        self._halted = False
+        self._deadline = 0  # cycle count at which the run loop stops
+        self._scheduler = Scheduler()
+        self.interrupt_latency = 0  # cycles between raising and taking the last interrupt
+        self.interrupts_serviced = 0
         self._io = IOBus()
         self._condition_flags = {0: ConditionalFlag(Flags.ZERO, 0),
                                  1: ConditionalFlag(Flags.ZERO, 1),
@@ -369,29 +372,127 @@ class Machine8080:
             OpCode(int('fe', 16), 2, "CPI", "immediate", self.cpi),
             OpCode(int('ff', 16), 1, "RST", "none", self.rst),
         )
+        # tracer and profilers wrap the handlers; blocks don't inline wrapped opcodes
+        plain = self.opcodes
+        if profiler is None:
+            instruments = []
+        elif isinstance(profiler, (list, tuple)):
+            instruments = list(profiler)
+        else:
+            instruments = [profiler]
+        if tracer is not None:
+            instruments.append(tracer)
+        for instrument in instruments:
+            self.opcodes = tuple(op._replace(handler=instrument.wrap(self, op)) for op in self.opcodes)
+        self._instrumented = bytearray(op.handler is not plain[op.opcode].handler for op in self.opcodes)
+        self._page_flags = bytearray(PAGE_COUNT)  # CODE_PAGE/WATCHED_PAGE/MAPPED_PAGE bits
+        self._tracked_start = 0
+        self._dirty_rows = bytearray()
+        self._decoded = DecodeCache(self.opcodes, self._end_of_memory, self._page_flags)
+        self._blocks = BlockCompiler(self) if compile_blocks else None
+        self.map_memory(memory_map if memory_map is not None else MemoryMap())
+
+    def map_memory(self, memory_map):
+        """Replaces the memory map.
+
+        :param memory_map: memory.MemoryMap to use
+        """
+        self._memory_map = memory_map
+        self._device_pages = memory_map.device_pages
+        for page in range(PAGE_COUNT):
+            if memory_map.mapped_pages[page]:
+                self._page_flags[page] |= MAPPED_PAGE
+            else:
+                self._page_flags[page] &= ~MAPPED_PAGE
+        if self._memory is not None:
+            memory_map.sync(self._memory)
 
     def _enable_interrupts(self, enabled):
         """Enables and disables interrupts.
 
-        I'm not sure how to handle these yet so I'm just 
-        basically making a placeholder.
+        Enabling takes effect after the next instruction, so the run loop is
+        stopped to step that instruction before a pending interrupt is taken.
         """
         self._interrupts = enabled
+        if enabled:
+            self._ei_delay = True
+            self._deadline = 0
 
-    def load(self, romfile):
-        """Loads the given ROM file
+    def load(self, rom):
+        """Loads the given ROM at address 0
 
-        :param romfile: full path to the ROM to load
+        :param rom: full path to the ROM to load, a bytes-like object
+                    holding the ROM image, or a list of loader.RomEntry
+                    records for a ROM set (see loader.load_rom)
 
         :raises RomLoadException: if the file cannot be read
         """
-        try:
-            with open(romfile, "rb") as fp:
-                self._memory = bytearray(fp.read())
-                self._memory = self._memory + bytearray([0 for x in range(0x10000 - len(self._memory))])
-                self._pc = 0
-        except Exception as e:
-            raise RomLoadException("{0}".format(e))
+        self._memory = load_rom(rom)
+        self._memory_map.sync(self._memory)
+        self._pc = 0
+        self._halted = False
+        self._pending_interrupt = None
+        self._memory_changed()
+
+    def _memory_changed(self):
+        """Forgets everything derived from the old contents of memory.
+        """
+        self._dirty_rows[:] = b'\x01' * len(self._dirty_rows)
+        self._decoded.clear()
+        if self._blocks is not None:
+            self._blocks.clear()
+
+    def _replace_memory(self, data):
+        """Copies data over the whole of memory.
+
+        :param data: 64 KB bytes-like object
+        """
+        if self._memory is None or len(self._memory) != len(data):
+            self._memory = bytearray(data)
+        else:
+            self._memory[:] = data
+        self._memory_changed()
+
+    def fork(self, count=1):
+        """Returns copies of the machine that can run independently of it and
+        of each other.
+
+        Each copy starts with this machine's registers, flags, interrupt
+        state, cycle count, IO port latches and memory map.  Memory is
+        copy-on-write (see memory.copy_on_write): copies share it with each
+        other until they write to it, and this machine keeps its own.
+        Scheduled events and IO devices are not copied, as with snapshots.
+        A copy allocates its predecoded tables when it first runs, so
+        copies that are never run cost little more than the memory pages
+        they write.
+
+        :param count: number of copies
+        :return: list of Machine8080
+        """
+        children = []
+        for memory in copy_on_write(self._memory, count):
+            child = Machine8080(compile_blocks=self._blocks is not None,
+                                checked_registers=isinstance(self._registers, CheckedRegisters),
+                                memory_map=self._memory_map)
+            snapshot.copy_state(self, child)
+            child._memory = memory
+            children.append(child)
+        return children
+
+    def snapshot(self, compression=None):
+        """Returns the machine's state as a binary snapshot (see snapshot.py).
+
+        :param compression: None, "zlib" or "lzma"
+        """
+        return snapshot.save(self, compression)
+
+    def restore(self, state):
+        """Restores a state returned by snapshot().
+
+        :param state: the snapshot
+        :raises snapshot.SnapshotException: if state isn't a valid snapshot
+        """
+        snapshot.restore(self, state)
 
     def disassemble(self):
         """Disassembles the loaded ROM.
@@ -412,6 +513,7 @@ class Machine8080:
         if self._memory is None:
             raise RomException("No ROM file loaded.")
         for inst, operands in self.next_instruction():
+            self._cycles += CYCLES[inst.opcode]
             try:
                 inst.handler(inst.opcode, operands)
             except EmulatorRuntimeException as e:
@@ -419,6 +521,247 @@ class Machine8080:
             except HaltException:
                 break
 
+    @property
+    def cycles(self):
+        """Number of clock cycles executed since the machine was created.
+        """
+        return self._cycles
+
+    def run(self, cycles=None):
+        """Executes the loaded ROM using the predecoded tables.
+
+        This gives the same results as execute() but each address is only
+        decoded once, so nothing is allocated per instruction.
+
+        The inner loop only compares the cycle counter against a deadline:
+        the end of the budget or the next scheduled event, whichever is
+        first.  Scheduled events are fired and pending interrupts serviced
+        between runs of the inner loop; interrupt(), schedule() and EI cut
+        the deadline short, so nothing is checked per instruction.
+
+        :param cycles: if given, stop at the first instruction boundary once
+                       this many clock cycles have been executed.  A halted
+                       machine idles until then, firing any events that come
+                       due.  Otherwise run until HALT with nothing scheduled
+                       to wake the machine.
+        :return: number of clock cycles executed
+        """
+        if self._memory is None:
+            raise RomException("No ROM file loaded.")
+        self._decoded.allocate()
+        start = self._cycles
+        end = NEVER if cycles is None else start + cycles
+        scheduler = self._scheduler
+        run_until_deadline = self._run_predecoded if self._blocks is None else self._run_blocks
+        while True:
+            if self._ei_delay and self._cycles < end:
+                # the instruction after EI runs before any interrupt is taken
+                self._ei_delay = False
+                if not self._halted:
+                    self._step_instruction()
+                # the stepped instruction may be another EI, which starts a new delay
+                continue
+            scheduler.run_due(self._cycles)
+            if self._pending_interrupt is not None and self._interrupts and not self._ei_delay:
+                self._service_interrupt()
+            if self._halted:
+                # nothing runs until an event (or the caller) raises an interrupt
+                wake = min(scheduler.next_deadline, end)
+                if end == NEVER and (wake == NEVER or not self._interrupts):
+                    break
+                self._cycles = max(self._cycles, wake)
+                if self._cycles >= end:
+                    break
+                continue
+            if self._cycles >= end:
+                break
+            self._deadline = min(end, scheduler.next_deadline)
+            run_until_deadline()
+        return self._cycles - start
+
+    def schedule(self, cycle, callback):
+        """Calls callback(cycle) between instructions once the cycle counter
+        reaches cycle.  See scheduler.Scheduler.schedule().
+
+        :return: handle that can be passed to cancel()
+        """
+        if cycle < self._deadline:
+            self._deadline = cycle
+        return self._scheduler.schedule(cycle, callback)
+
+    def cancel(self, event):
+        """Cancels an event returned by schedule().
+        """
+        self._scheduler.cancel(event)
+
+    def _run_predecoded(self):
+        """Executes instructions from the predecoded tables until HALT or the
+        deadline.
+        """
+        memory = self._memory
+        decoded = self._decoded
+        handlers = decoded.handlers
+        opcodes = decoded.opcodes
+        lengths = decoded.lengths
+        operands = decoded.operands
+        timing = decoded.cycles
+        while self._cycles < self._deadline:
+            pc = self._pc
+            handler = handlers[pc]
+            if handler is None:
+                handler = decoded.decode(memory, pc)
+            self._pc = pc + lengths[pc]
+            self._cycles += timing[pc]
+            try:
+                handler(opcodes[pc], operands[pc])
+            except EmulatorRuntimeException as e:
+                logging.error("{}".format(e))
+            except HaltException:
+                self._halted = True
+                return
+
+    def _run_blocks(self):
+        """Executes compiled basic blocks until HALT or the deadline.
+
+        A block is only run whole if it can't end past the deadline;
+        otherwise instructions are stepped one at a time so the machine stops
+        on the same instruction boundary as run() without blocks.  Blocks that
+        haven't been compiled yet are only compiled if any block could fit.
+        """
+        blocks = self._blocks
+        cache = blocks.cache
+        block_cycles = blocks.cycles
+        blocks.stale = False
+        while True:
+            try:
+                while self._cycles < self._deadline:
+                    pc = self._pc
+                    run_block = cache.get(pc)
+                    if run_block is None:
+                        if self._cycles + MAX_BLOCK_CYCLES > self._deadline:
+                            self._execute_instruction()
+                            continue
+                        run_block = blocks.compile(pc)
+                    elif self._cycles + block_cycles[pc] > self._deadline:
+                        self._execute_instruction()
+                        continue
+                    else:
+                        blocks.hits += 1
+                    run_block()
+                return
+            except EmulatorRuntimeException as e:
+                logging.error("{}".format(e))
+            except HaltException:
+                self._halted = True
+                return
+
+    def _execute_instruction(self):
+        """Executes the instruction at the PC using the predecoded tables.
+        """
+        pc = self._pc
+        decoded = self._decoded
+        handler = decoded.handlers[pc]
+        if handler is None:
+            handler = decoded.decode(self._memory, pc)
+        self._pc = pc + decoded.lengths[pc]
+        self._cycles += decoded.cycles[pc]
+        handler(decoded.opcodes[pc], decoded.operands[pc])
+
+    def _step_instruction(self):
+        """Executes one instruction, noting whether the machine halted.
+
+        :return: True if the instruction was HALT
+        """
+        try:
+            self._execute_instruction()
+        except EmulatorRuntimeException as e:
+            logging.error("{}".format(e))
+        except HaltException:
+            self._halted = True
+            return True
+        return False
+
+    def step(self, count=1):
+        """Executes count instructions using the predecoded tables.
+
+        Due events are fired and pending interrupts serviced between
+        instructions, the same way as run().
+
+        :param count: number of instructions to execute
+        :return: number of instructions executed; less than count if the
+                 machine halted
+        """
+        if self._memory is None:
+            raise RomException("No ROM file loaded.")
+        self._decoded.allocate()
+        scheduler = self._scheduler
+        for executed in range(count):
+            if scheduler.next_deadline <= self._cycles:
+                scheduler.run_due(self._cycles)
+            if self._ei_delay:
+                self._ei_delay = False
+            elif self._pending_interrupt is not None and self._interrupts:
+                self._service_interrupt()
+            if self._halted:
+                return executed
+            if self._step_instruction():
+                return executed + 1
+        return count
+
+    def interrupt(self, vector):
+        """Raises an interrupt that restarts at RST vector.
+
+        The interrupt is taken between instructions once interrupts are
+        enabled (and not until the instruction after EI has run).  Taking it
+        disables interrupts, wakes the machine if it's halted, pushes the PC
+        and jumps to 8 * vector.  Only one interrupt can be pending; a new
+        one replaces it.
+
+        :param vector: RST number, 0-7
+        """
+        if not 0 <= vector <= 7:
+            raise ValueError(f'Invalid RST vector {vector}')
+        self._pending_interrupt = vector
+        self._interrupt_raised_at = self._cycles
+        if self._interrupts:
+            self._deadline = 0
+
+    def _service_interrupt(self):
+        """Takes the pending interrupt by running its RST instruction.
+        """
+        vector = self._pending_interrupt
+        self._pending_interrupt = None
+        self._interrupts = False
+        self._halted = False
+        self.interrupt_latency = self._cycles - self._interrupt_raised_at
+        self.interrupts_serviced += 1
+        self._cycles += CYCLES[0xc7]
+        # a machine that ran off the end of memory stopped with the PC at
+        # 0x10000; the 8080's 16-bit PC wraps to 0
+        self._pc &= 0xffff
+        # through the opcode table so tracers and profilers see it; operands
+        # of None mark an interrupt rather than an RST at PC - 1
+        opcode = 0xc7 | (vector << 3)
+        self.opcodes[opcode].handler(opcode, None)
+
+    @property
+    def io(self):
+        """The IOBus devices are mapped onto.
+        """
+        return self._io
+
+    @property
+    def halted(self):
+        """True if the machine executed HLT and hasn't been woken by an interrupt.
+        """
+        return self._halted
+
+    def _end_of_memory(self, *args):
+        """Stops run() when the program counter moves past the end of memory,
+        which is where execute() runs out of instructions.
+        """
+        raise HaltException()
+
     @staticmethod
     def format_operand(opcode, ops):
         """
@@ -463,24 +806,123 @@ class Machine8080:
         Reads size bytes of memory starting at the given address.
         :param address:
         :param size:
-        :return: tuple of memory read or just byte if size == 1
+        :return: list of the bytes read
         :raises: OutOfMemory error if the read goes past the end of memory
         """
-        if address + size >= len(self._memory):
+        if address < 0 or address + size > len(self._memory):
             raise OutOfMemoryException()
-        return [b for b in self._memory[address:address + size]]
+        if any(self._device_pages[address >> 8:((address + size - 1) >> 8) + 1]):
+            return [self._read_device(a) for a in range(address, address + size)]
+        return list(self._memory[address:address + size])
 
-    def write_memory(self, address, data):
+    def read_byte(self, address):
         """
-        Writes the given data one byte to the given address
-        :param address:   Memory address
+        Reads the byte at address.  Addresses wrap around at 64 KB.
+        :param address: Memory address
+        :return: the byte
+        """
+        address &= 0xffff
+        if self._device_pages[address >> 8]:
+            return self._read_device(address)
+        return self._memory[address]
+
+    def read_word(self, address):
+        """
+        Reads the little-endian word at address (low byte first).  The
+        address of the high byte wraps around from FFFF to 0000.
+        :param address: Memory address
+        :return: the 16-bit value
+        """
+        address &= 0xffff
+        high = (address + 1) & 0xffff
+        if self._device_pages[address >> 8] or self._device_pages[high >> 8]:
+            return self._read_device(address) | (self._read_device(high) << 8)
+        return self._memory[address] | (self._memory[high] << 8)
+
+    def _read_device(self, address):
+        page = address >> 8
+        reader = self._memory_map.readers[page]
+        return reader(address) if reader is not None else self._memory[address + self._memory_map.offsets[page]]
+
+    def write_byte(self, address, data):
+        """
+        Writes one byte to address.  Addresses wrap around at 64 KB.
+        :param address: Memory address
         :param data: Data to write
-        :return:
         """
+        address &= 0xffff
+        if self._page_flags[address >> 8]:
+            self._write_flagged(address, data)
+        else:
+            self._memory[address] = data
+
+    write_memory = write_byte
+
+    def write_word(self, address, data):
+        """
+        Writes a 16-bit value to address, low byte first.  The address of
+        the high byte wraps around from FFFF to 0000.
+        :param address: Memory address
+        :param data: Data to write
+        """
+        self.write_byte(address, data & 0xff)
+        self.write_byte(address + 1, data >> 8)
+
+    def _write_flagged(self, address, data):
+        """write_memory() for pages that are mapped, hold code or are watched.
+        """
+        page = address >> 8
+        if self._page_flags[page] & MAPPED_PAGE:
+            writer = self._memory_map.writers[page]
+            if writer is not None:
+                # ROM or device memory
+                writer(address, data)
+                return
+            # RAM or a mirror of it
+            self._store(address + self._memory_map.offsets[page], data)
+        else:
+            self._store(address, data)
+
+    def _store(self, address, data):
         self._memory[address] = data
+        flags = self._page_flags[address >> 8]
+        if flags & CODE_PAGE:
+            self._invalidate_code(address)
+        if flags & WATCHED_PAGE:
+            offset = address - self._tracked_start
+            if 0 <= offset < len(self._dirty_rows) * DIRTY_ROW_SIZE:
+                self._dirty_rows[offset >> DIRTY_ROW_SHIFT] = 1
+
+    def track_writes(self, start, size):
+        """Starts recording which DIRTY_ROW_SIZE-byte rows of a memory range
+        are written.  Only one range is tracked at a time; tracking a new one
+        replaces it.
+
+        :param start: first address of the range, a multiple of DIRTY_ROW_SIZE
+        :param size: length of the range in bytes
+        :return: bytearray with one entry per row, set to 1 by write_memory()
+                 when the row is written (and for every row by load()).  The
+                 caller clears the entries it has dealt with.
+        """
+        for page in range(PAGE_COUNT):
+            self._page_flags[page] &= ~WATCHED_PAGE
+        for page in range(start >> 8, (start + size - 1 >> 8) + 1):
+            self._page_flags[page] |= WATCHED_PAGE
+        self._tracked_start = start
+        self._dirty_rows = bytearray(b'\x01' * -(-size // DIRTY_ROW_SIZE))
+        return self._dirty_rows
+
+    def _invalidate_code(self, address):
+        """Drops decoded instructions and compiled blocks that include address.
+        Called for writes into pages that hold code.
+        """
+        address &= 0xffff
+        self._decoded.invalidate(address)
+        if self._blocks is not None:
+            self._blocks.invalidate(address)
 
     def nop(self, *args):
-        logging.info("NOP")
+        pass
 
     def mov(self, opcode, *args):
         """
@@ -501,19 +943,18 @@ class Machine8080:
         :param args:  This is ignored; mov is a one byte instruction
         :return:
         """
-        logging.info(f'MOV {opcode:02X}')
         dst = Registers.get_register_from_opcode(opcode, 3)
         src = Registers.get_register_from_opcode(opcode, 0)
 
         if dst != Registers.M and src != Registers.M:
             self._registers[dst] = self._registers[src]
         else:
-            addr = self._registers.get_address_from_pair(Registers.H)
+            addr = self._registers.get_pair(Registers.H)
             if src == Registers.M:
-                self._registers[dst], *_ = self.read_memory(addr, 1)
+                self._registers[dst] = self.read_byte(addr)
             else:
                 # dst is memory
-                self.write_memory(addr, self._registers[src])
+                self.write_byte(addr, self._registers[src])
 
     def unhandled_instruction(self, opcode, *args):
         logging.warning(f'Unhandled instruction: {opcode:02X}')
@@ -526,11 +967,10 @@ class Machine8080:
         :param args:
         :return:
         """
-        logging.info(f'STAX {opcode:02X}')
         assert ((opcode == 0x02) or (opcode == 0x12))
         pair = Registers.B if opcode == 0x02 else Registers.D
-        address = self._registers.get_address_from_pair(pair)
-        self.write_memory(address, self._registers[Registers.A])
+        address = self._registers.get_pair(pair)
+        self.write_byte(address, self._registers[Registers.A])
 
     def ldax(self, opcode, *args):
         """
@@ -540,11 +980,10 @@ class Machine8080:
         :param args:
         :return:
         """
-        logging.info(f'LDAX {opcode:02X}')
         assert (opcode in (0x0a, 0x1a))
         pair = Registers.B if opcode == 0x0a else Registers.D
-        address = self._registers.get_address_from_pair(pair)
-        self._registers[Registers.A], *_ = self.read_memory(address, 1)
+        address = self._registers.get_pair(pair)
+        self._registers[Registers.A] = self.read_byte(address)
 
     def pchl(self, *args):
         """
@@ -557,8 +996,7 @@ class Machine8080:
         :param args:
         :return:
         """
-        logging.info('PCHL')
-        self._pc = self._registers.get_address_from_pair(Registers.H)
+        self._pc = self._registers.get_pair(Registers.H)
 
     def jmp(self, opcode, operands):
         """
@@ -568,7 +1006,6 @@ class Machine8080:
         :return:
         """
         lo, hi = operands
-        logging.info(f'JMP {hi:02X}{lo:02X}')
         self._pc = (hi << 8) | lo
 
     def conditional_jmp(self, opcode, operands):
@@ -580,7 +1017,6 @@ class Machine8080:
         :return:
         """
         lo, hi = operands
-        logging.info(f'CONDITIONAL JMP {opcode:02X} {hi:02X}{lo:02X}')
         # map opcodes to the flags that dictate them and the expected setting
         jmpbits = {0xda: (Flags.CARRY, 1), 0xd2: (Flags.CARRY, 0), 0xe2: (Flags.PARITY, 0),
                    0xea: (Flags.PARITY, 1), 0xf2: (Flags.SIGN, 0), 0xfa: (Flags.SIGN, 1),
@@ -593,14 +1029,11 @@ class Machine8080:
     def _logical_and_accumulator(self, val):
         """Performs logical AND with val and contents of accumulator.
 
-        sets Zero, Sign, Parity bits appropriately.
+        :return: the result stored in the accumulator
         """
         res = val & self._registers[Registers.A]
         self._registers[Registers.A] = res
-        self._flags.calculate_parity(res)
-        self._flags.set_zero(res)
-        self._flags.set_sign(res)
-        
+        return res
 
     def ana(self, opcode, *args):
         """
@@ -612,25 +1045,20 @@ class Machine8080:
         :param args:
         :return:
         """
-        logging.info(f'ANA {opcode:02X}')
         reg = self._registers.get_register_from_opcode(opcode, 0)
         if reg == Registers.M:
-            val, *_ = self.read_memory(self._registers.get_address_from_pair(Registers.H), 1)
+            val = self.read_byte(self._registers.get_pair(Registers.H))
         else:
             val = self._registers[reg]
 
-        self._flags.clear(Flags.CARRY)
-        self._logical_and_accumulator(val)
+        self._flags.set_and_flags(self._logical_and_accumulator(val))
 
     def ani(self, opcode, operands):
         """Logical AND the immediate byte with the accumulator.
 
         CY and AC are reset
         """
-        logging.info(f'ANI {operands[0]:02X}')
-        self._flags.clear(Flags.CARRY)
-        self._flags.clear(Flags.AUX_CARRY)
-        self._logical_and_accumulator(operands[0])
+        self._flags.set_logic_flags(self._logical_and_accumulator(operands[0]))
 
     def _internal_or(self, val, orfunc):
         """[A] = orfunc([A], val)
@@ -639,13 +1067,8 @@ class Machine8080:
         Sign, Zero, Parity are set accordingly
         """
         res = orfunc(val, self._registers[Registers.A])
-        logging.debug(f'[_internal_xor] {val:02X} ^ {self._registers[Registers.A]:02X} = {res:02X}')
         self._registers[Registers.A] = res
-        self._flags.clear(Flags.CARRY)
-        self._flags.clear(Flags.AUX_CARRY)
-        self._flags.calculate_parity(res)
-        self._flags.set_zero(res)
-        self._flags.set_sign(res)
+        self._flags.set_logic_flags(res)
 
     def xra(self, opcode, *args):
         """
@@ -665,10 +1088,9 @@ class Machine8080:
         :param opcode:
         :param args:
         """
-        logging.info(f'XRA {opcode:02X}')
         reg = self._registers.get_register_from_opcode(opcode, 0)
         if reg == Registers.M:
-            val, *_ = self.read_memory(self._registers.get_address_from_pair(Registers.H), 1)
+            val = self.read_byte(self._registers.get_pair(Registers.H))
         else:
             val = self._registers[reg]
         self._internal_or(val, lambda a,b: a ^ b)
@@ -699,7 +1121,7 @@ class Machine8080:
         """
         reg = self._registers.get_register_from_opcode(opcode, 3)
         if reg == Registers.M:
-            self.write_memory(self._registers.get_address_from_pair(Registers.H), operands[0])
+            self.write_byte(self._registers.get_pair(Registers.H), operands[0])
         else:
             self._registers[reg] = operands[0]
 
@@ -712,7 +1134,6 @@ class Machine8080:
         00rp0001
         """
         rp = (opcode >> 4) & 0x3
-        logging.debug(f'register pair: {rp:02x}')
         if rp == 0x3: # stack pointer
             self._sp = (operands[1] << 8) | operands[0]
         else:
@@ -728,7 +1149,7 @@ class Machine8080:
         :return:
         """
         address = (operands[1] << 8) | operands[0]
-        self._registers[Registers.A], *_ = self.read_memory(address, 1)
+        self._registers[Registers.A] = self.read_byte(address)
 
     def sta(self, opcode, operands):
         """
@@ -738,7 +1159,7 @@ class Machine8080:
         :return:
         """
         address = (operands[1] << 8) | operands[0]
-        self.write_memory(address, self._registers[Registers.A])
+        self.write_byte(address, self._registers[Registers.A])
 
     def lhld(self, opcode, operands):
         """
@@ -752,7 +1173,7 @@ class Machine8080:
         :return:
         """
         address = (operands[1] << 8) | operands[0]
-        self._registers[Registers.L], self._registers[Registers.H] = self.read_memory(address, 2)
+        self._registers.set_pair(Registers.H, self.read_word(address))
 
     def shld(self, opcodes, operands):
         """
@@ -764,8 +1185,7 @@ class Machine8080:
         :return:
         """
         address = (operands[1] << 8) | operands[0]
-        self.write_memory(address, self._registers[Registers.L])
-        self.write_memory(address+1, self._registers[Registers.H])
+        self.write_word(address, self._registers.get_pair(Registers.H))
 
     def xchg(self, opcode, *args):
         """
@@ -794,8 +1214,8 @@ class Machine8080:
         """
         reg = Registers.get_register_from_opcode(opcode, 0)
         if reg == Registers.M:
-            address = self._registers.get_address_from_pair(Registers.H)
-            val, *_ = self.read_memory(address, 1)
+            address = self._registers.get_pair(Registers.H)
+            val = self.read_byte(address)
         else:
             val = self._registers[reg]
         self._internal_or(val, lambda a,b: a | b)
@@ -820,9 +1240,8 @@ class Machine8080:
         :param opcode:
         :param operands:
         """
-        self.write_memory(self._sp-1, (self._pc >> 8) & 0xFF)
-        self.write_memory(self._sp-2, self._pc & 0xFF)
-        self._sp -= 2
+        self._sp = (self._sp - 2) & 0xffff
+        self.write_word(self._sp, self._pc)
         self._pc = (operands[1] << 8) | operands[0]
 
     def conditional_call(self, opcode, operands):
@@ -850,6 +1269,7 @@ class Machine8080:
         bitflag = (opcode >> 3) & 0x07  # mask off 3 bits
         cf = self._condition_flags[bitflag]
         if self._flags[cf.flag] == cf.val:
+            self._cycles += CALL_TAKEN_EXTRA
             self.call(opcode, operands)
 
     def ret(self, opcode, *args):
@@ -861,9 +1281,8 @@ class Machine8080:
         :param opcode:
         :param args:
         """
-        lo, hi = self.read_memory(self._sp, 2)
-        self._pc = (hi << 8) | lo
-        self._sp += 2
+        self._pc = self.read_word(self._sp)
+        self._sp = (self._sp + 2) & 0xffff
 
     def conditional_ret(self, opcode, *args):
         """
@@ -878,6 +1297,7 @@ class Machine8080:
         bitflag = (opcode >> 3) & 0x7
         cf = self._condition_flags[bitflag]
         if self._flags[cf.flag] == cf.val:
+            self._cycles += RET_TAKEN_EXTRA
             self.ret(opcode)
 
     def cmc(self, *args):
@@ -913,9 +1333,8 @@ class Machine8080:
         :param args:
         """
         rh, rl = self._registers.get_pairs((opcode >> 4) & 0x3)
-        self.write_memory(self._sp - 1, self._registers[rh])
-        self.write_memory(self._sp - 2, self._registers[rl])
-        self._sp -= 2
+        self._sp = (self._sp - 2) & 0xffff
+        self.write_word(self._sp, (self._registers[rh] << 8) | self._registers[rl])
 
     def push_psw(self, *args):
         """
@@ -932,9 +1351,8 @@ class Machine8080:
         (SP) <- (SP)-2
         :param args:
         """
-        self.write_memory(self._sp - 1, self._registers[Registers.A])
-        self.write_memory(self._sp - 2, self._flags.flags)
-        self._sp -= 2
+        self._sp = (self._sp - 2) & 0xffff
+        self.write_word(self._sp, (self._registers[Registers.A] << 8) | self._flags.flags)
 
     def pop_pair(self, opcode, *args):
         """
@@ -947,8 +1365,10 @@ class Machine8080:
         :param args:
         """
         hi, lo = self._registers.get_pairs((opcode >> 4) & 0x3)
-        self._registers[lo], self._registers[hi] = self.read_memory(self._sp, 2)
-        self._sp += 2
+        val = self.read_word(self._sp)
+        self._registers[lo] = val & 0xff
+        self._registers[hi] = val >> 8
+        self._sp = (self._sp + 2) & 0xffff
 
     def pop_psw(self, *args):
         """
@@ -957,34 +1377,28 @@ class Machine8080:
         (sp)  <- (sp+2)
         :param args:
         """
-        self._flags.flags, self._registers[Registers.A] = self.read_memory(self._sp, 2)
-        self._sp += 2
+        val = self.read_word(self._sp)
+        self._flags.flags = val & 0xff
+        self._registers[Registers.A] = val >> 8
+        self._sp = (self._sp + 2) & 0xffff
 
     def xthl(self, *args):
         """"
         (L)  <->  (SP)
         (H)  <->  (SP)+1
         """
-        logging.info("XTHL")
-        l, h = self.read_memory(self._sp, 2)
-        tmp = self._registers[Registers.L]
-        self._registers[Registers.L] = l
-        self.write_memory(self._sp, tmp)
-
-        tmp = self._registers[Registers.H]
-        self._registers[Registers.H] = h
-        self.write_memory(self._sp+1, tmp)
+        val = self.read_word(self._sp)
+        self.write_word(self._sp, self._registers.get_pair(Registers.H))
+        self._registers.set_pair(Registers.H, val)
 
     def sphl(self, *args):
         """
         (SP) <- (H)(L)
         :param args:
         """
-        logging.info("SPHL")
         self._sp = (self._registers[Registers.H] << 8) | self._registers[Registers.L]
 
     def halt(self, *args):
-        logging.info("HALT")
         raise HaltException()
 
     def rlc(self, *args):
@@ -993,18 +1407,14 @@ class Machine8080:
         (CY) <- (A7)
         :return:
         """
-        logging.info("RLC")
         val = self._registers[Registers.A]
-        logging.debug(f'Current value of A: {val:02X}')
         bit = (val >> 7) & 0x1
-        logging.debug(f'Current value of bit: {bit:02X}')
         if bit == 0:
             self._flags.clear(Flags.CARRY)
         else:
             self._flags.set(Flags.CARRY)
         val = (val << 1) & 0xff
         val |= bit
-        logging.debug(f'New Value of A: {val:02X}')
         self._registers[Registers.A] = val
 
     def ral(self, *args):
@@ -1014,7 +1424,6 @@ class Machine8080:
         Carry bit goes to A0, A7 goes to Carry, everything else shifts left
         :param args:
         """
-        logging.info("RAL")
         cy = self._flags[Flags.CARRY]
         A = self._registers[Registers.A]
         self._flags[Flags.CARRY] = (A >> 7)&0x1
@@ -1029,7 +1438,6 @@ class Machine8080:
         (CY) <- (A0)
         :param args:
         """
-        logging.info("RRC")
         A = self._registers[Registers.A]
         bit = A & 0x01
         A = (A >> 1) & 0xff
@@ -1044,33 +1452,19 @@ class Machine8080:
         A7 <- CY
         :param args:
         """
-        logging.info(f'RAR')
         cy = self._flags[Flags.CARRY]
         A = self._registers[Registers.A]
-        logging.debug("A & 0x01 = {0}".format(A&0x01))
         self._flags[Flags.CARRY] = A & 0x01
         A = ((A >> 1) & 0xff) | (cy << 7)
         self._registers[Registers.A] = A
 
-    def _internal_sub(self, val):
-        """Subtract val from A and set flags accordingly.
-        :return: A - val
+    def _internal_sub(self, val, borrow=0):
+        """Subtract val and the borrow from A and set flags accordingly.
+        :return: A - val - borrow
         """
-        val = byte_to_signed_int(val)
-        A = byte_to_signed_int(self._registers[Registers.A])
-
-        self._flags.clear_all()
-        if A < val:
-            self._flags.set(Flags.CARRY)
-            self._flags.set(Flags.SIGN)
-        if (A&0x0f) < (val&0x0f):
-            self._flags.set(Flags.AUX_CARRY)
-        A -= val
-        if A == 0:
-            self._flags.set(Flags.ZERO)
-        b = int_to_signed_byte(A)
-        self._flags.calculate_parity(b)
-        return b
+        A = self._registers[Registers.A]
+        self._flags.set_sub_flags(A, val, borrow)
+        return (A - val - borrow) & 0xff
 
     def cmp(self, opcode, *args):
         """
@@ -1083,11 +1477,10 @@ class Machine8080:
         :param opcode:
         :param args:
         """
-        logging.info(f'CMP {opcode:02X}')
         reg = self._registers.get_register_from_opcode(opcode, 0)
         if reg == Registers.M:
-            address = self._registers.get_address_from_pair(Registers.H)
-            val, *_ = self.read_memory(address, 1)
+            address = self._registers.get_pair(Registers.H)
+            val = self.read_byte(address)
         else:
             val = self._registers[reg]
         self._internal_sub(val)
@@ -1096,7 +1489,6 @@ class Machine8080:
         """The operand is subtracted from the accumulator.  The flags
         are set appropriately.
         """
-        logging.info(f'CPI {operands[0]:02X}')
         self._internal_sub(operands[0])
 
     def inx(self, opcode, *arg):
@@ -1105,15 +1497,12 @@ class Machine8080:
 
         instruction: 00RP0011
         """
-        logging.info(f'INX {opcode:02X}')
         pair = (opcode >> 4) & 0x3
         if pair == 3:
             self._sp = (self._sp + 1) & 0xffff
         else:
-            pair = self._registers.get_pairs(pair)
-            val = self._registers.get_value_from_pair(pair)
-            val = (val + 1) & 0xffff
-            self._registers.set_value_pair(pair, val)
+            hi = pair << 1
+            self._registers.set_pair(hi, (self._registers.get_pair(hi) + 1) & 0xffff)
 
     def dcx(self, opcode, *arg):
         """
@@ -1121,16 +1510,12 @@ class Machine8080:
         
         instruction format 00RP1011
         """
-        logging.info(f'DCX {opcode:02X}')
         pair = (opcode >> 4) & 0x3
         if pair == 3:
             self._sp = (self._sp - 1) & 0xffff
         else:
-            pair = self._registers.get_pairs(pair)
-            val = self._registers.get_value_from_pair(pair)
-            logging.debug(f'val = {val:04X} val-1 = {(val-1)&0xffff:04X}')
-            val = (val - 1) & 0xffff
-            self._registers.set_value_pair(pair, val)            
+            hi = pair << 1
+            self._registers.set_pair(hi, (self._registers.get_pair(hi) - 1) & 0xffff)
 
     def _set_register_value(self, reg, val):
         """Saves the given value in the specified register.
@@ -1141,8 +1526,8 @@ class Machine8080:
         :param val: Value to save.
         """
         if reg == Registers.M:
-            addr = self._registers.get_address_from_pair(Registers.H)
-            self.write_memory(addr, val)
+            addr = self._registers.get_pair(Registers.H)
+            self.write_byte(addr, val)
         else:
             self._registers[reg] = val
 
@@ -1154,25 +1539,15 @@ class Machine8080:
 
         Flags affected: Z, S, P, AC
         """
-        logging.info(f'INR {opcode:02X}')
         reg = Registers.get_register_from_opcode(opcode, 3)
         if reg == Registers.M:
-            addr = self._registers.get_address_from_pair(Registers.H)
-            val = self.read_memory(addr, 1)[0]
+            addr = self._registers.get_pair(Registers.H)
+            val = self.read_byte(addr)
         else:
             val = self._registers[reg]
 
-        if (val & 0x0f) == 0x0f:
-            self._flags[Flags.AUX_CARRY] = 1
-        else:
-            self._flags[Flags.AUX_CARRY] = 0
-
-        val = (val + 1) & 0xff
-        self._flags.calculate_parity(val)
-        self._flags.set_zero(val)
-        self._flags.set_sign(val)
-
-        self._set_register_value(reg, val)
+        self._flags.set_inr_flags(val)
+        self._set_register_value(reg, (val + 1) & 0xff)
 
     def dcr(self, opcode, *args):
         """
@@ -1181,23 +1556,15 @@ class Machine8080:
         Instruction format: 00DDD101
         Flags: Z, S, P, AC
         """
-        logging.info(f'DCR {opcode:02X}')
         reg = Registers.get_register_from_opcode(opcode, 3)
         if reg == Registers.M:
-            addr = self._registers.get_address_from_pair(Registers.H)
-            val = self.read_memory(addr, 1)[0]
+            addr = self._registers.get_pair(Registers.H)
+            val = self.read_byte(addr)
         else:
             val = self._registers[reg]
 
-        self._flags[Flags.AUX_CARRY] = 0
-        if val & 0x0f == 0x00:
-            self._flags[Flags.AUX_CARRY] = 1
-
-        val = (val - 1) & 0xff
-        self._flags.calculate_parity(val)
-        self._flags.set_zero(val)
-        self._flags.set_sign(val)
-        self._set_register_value(reg, val)
+        self._flags.set_dcr_flags(val)
+        self._set_register_value(reg, (val - 1) & 0xff)
 
     def dad(self, opcode, *args):
         """
@@ -1209,7 +1576,6 @@ class Machine8080:
         
         Only Carry bit is set.
         """
-        logging.info(f'DAD {opcode:02X}')
         pair = (opcode >> 4) & 0x3
         pair = self._registers.get_pairs(pair) 
         hl = self._registers.get_pairs(0x02)
@@ -1217,9 +1583,7 @@ class Machine8080:
         hl_val = self._registers.get_value_from_pair(hl)
         val = self._registers.get_value_from_pair(pair)
 
-        logging.debug(f'HL value: {hl_val:04X}  Value {val:04X}')
         hl_val += val
-        logging.debug(f'New total: {hl_val:04X}')
 
         self._flags[Flags.CARRY] = 0
         if hl_val > 0xffff:
@@ -1236,10 +1600,8 @@ class Machine8080:
 
         Instruction format:  11NNN111
         """
-        logging.info(f'RST {opcode:02X}')
-        self.write_memory(self._sp - 1, (self._pc  >> 8) & 0xff)
-        self.write_memory(self._sp - 2, self._pc & 0xff)
-        self._sp -= 2
+        self._sp = (self._sp - 2) & 0xffff
+        self.write_word(self._sp, self._pc)
         self._pc = 8 * ((opcode >> 3)&0x7)
 
     def adi(self, opcode, operands):
@@ -1248,22 +1610,7 @@ class Machine8080:
 
         Flags: Z, S, P, CY, AC
         """
-        logging.info(f'ADI {operands[0]:02X}')
-        self._flags[Flags.CARRY] = 0
-        self._flags[Flags.AUX_CARRY] = 0
-
-        A = self._registers[Registers.A]
-        if (A & 0xf) + (operands[0]&0xf) > 0xf:
-            self._flags[Flags.AUX_CARRY] = 1
-        if A + operands[0] > 0xff:
-            self._flags[Flags.CARRY] = 1
-
-        A = (A + operands[0]) & 0xff
-
-        self._flags.calculate_parity(A)
-        self._flags.set_zero(A)
-        self._flags.set_sign(A)
-        self._registers[Registers.A] = A
+        self._add_accumulator(operands[0])
 
     def add(self, opcode, *args):
         """
@@ -1272,28 +1619,13 @@ class Machine8080:
         Instruction format: 10000SSS
         Flags: Z, S, P, CY, AC
         """
-        logging.info(f'ADD {opcode:02X}')
-        self._flags[Flags.CARRY] = 0
-        self._flags[Flags.AUX_CARRY] = 0
-
         reg = Registers.get_register_from_opcode(opcode, 0)
         if reg == Registers.M:
-            addr = self._registers.get_address_from_pair(Registers.H)
-            val = self.read_memory(addr, 1)[0]
+            addr = self._registers.get_pair(Registers.H)
+            val = self.read_byte(addr)
         else:
             val = self._registers[reg]
-
-        A = self._registers[Registers.A]
-        if (A&0xf) + (val&0xf) > 0xf:
-            self._flags[Flags.AUX_CARRY] = 1
-        if A + val > 0xff:
-            self._flags[Flags.CARRY] = 1
-
-        A = (A + val) & 0xff
-        self._flags.set_zero(A)
-        self._flags.calculate_parity(A)
-        self._flags.set_sign(A)
-        self._registers[Registers.A] = A
+        self._add_accumulator(val)
 
     def _add_accumulator(self, val):
         """Add accumulator with val.
@@ -1301,21 +1633,8 @@ class Machine8080:
         Sets Z, S, P, CY, AC as appropriate.
         """
         A = self._registers[Registers.A]
-        if (A&0xf) + (val&0xf) > 0xf:
-            self._flags[Flags.AUX_CARRY] = 1
-        else:
-            self._flags[Flags.AUX_CARRY] = 0
-
-        if A + val > 0xff:
-            self._flags[Flags.CARRY] = 1
-        else:
-            self._flags[Flags.CARRY] = 0
-
-        A = (A + val)&0xff
-        self._flags.set_zero(A)
-        self._flags.calculate_parity(A)
-        self._flags.set_sign(A)
-        self._registers[Registers.A] = A
+        self._flags.set_add_flags(A, val)
+        self._registers[Registers.A] = (A + val) & 0xff
 
     def adc(self, opcode, *args):
         """Add with Carry
@@ -1328,13 +1647,12 @@ class Machine8080:
         
         Flags: Z, S, P, CY, AC
         """
-        logging.info(f'ADC {opcode:02X}')
         CY = self._flags[Flags.CARRY]
 
         reg = self._registers.get_register_from_opcode(opcode, 0)
         if reg == Registers.M:
-            addr = self._registers.get_address_from_pair(Registers.H)
-            val = self.read_memory(addr, 1)[0]
+            addr = self._registers.get_pair(Registers.H)
+            val = self.read_byte(addr)
         else:
             val = self._registers[reg]
            
@@ -1347,14 +1665,12 @@ class Machine8080:
 
         Flags: Z, S, P, CY, AC
         """
-        logging.info(f'ACI {operands[0]:02X}')
         val = operands[0] + self._flags[Flags.CARRY]
         self._add_accumulator(val)
     
     def out(self, opcode, port):
         """Puts contents of accumulator onto IO bus at given port.
         """
-        logging.info(f'OUT {port[0]:02X}')
         self._io.write(port[0], self._registers[Registers.A])
 
     def input(self, opcode, port):
@@ -1362,7 +1678,6 @@ class Machine8080:
 
         We can't call this "IN" because that's a keyword.
         """
-        logging.info(f'IN {port[0]:02X}')
         self._registers[Registers.A] = self._io.read(port[0])
     
     def sub(self, opcode, *args):
@@ -1371,11 +1686,10 @@ class Machine8080:
         Instruction format:  10010SSS
         Flags: Z, S, P, CY, AC
         """
-        logging.info(f'SUB {opcode:02X}')
         reg = Registers.get_register_from_opcode(opcode, 0)
         if reg == Registers.M:
-            addr = self._registers.get_address_from_pair(Registers.H)
-            val = self.read_memory(addr, 1)[0]
+            addr = self._registers.get_pair(Registers.H)
+            val = self.read_byte(addr)
         else:
             val = self._registers[reg]
         self._registers[Registers.A] = self._internal_sub(val)
@@ -1383,7 +1697,6 @@ class Machine8080:
     def sui(self, opcode, operands):
         """
         """
-        logging.info(f'SUI {operands[0]:02X}')
         self._registers[Registers.A] = self._internal_sub(operands[0])
 
     def sbb(self, opcode, *args):
@@ -1392,35 +1705,29 @@ class Machine8080:
         (A) <- (A) - (r) - CY
         instruction 10011SSS
         """
-        logging.info(f'SBB {opcode:02X}')
         reg = Registers.get_register_from_opcode(opcode, 0)
         if reg == Registers.M:
-            addr = self._registers.get_address_from_pair(Registers.H)
-            val = self.read_memory(addr, 1)[0]
+            addr = self._registers.get_pair(Registers.H)
+            val = self.read_byte(addr)
         else:
             val = self._registers[reg]
-        val -= self._flags[Flags.CARRY]
-        self._registers[Registers.A] = self._internal_sub(val)
+        self._registers[Registers.A] = self._internal_sub(val, self._flags[Flags.CARRY])
 
     def sbi(self, opcode, operands):
         """Subtract immediate with borrow (carry)
 
         (A) <- (A) - operand - CY
         """
-        logging.info(f'SBI {operands[0]:02X}')
-        val = operands[0] - self._flags[Flags.CARRY]
-        self._registers[Registers.A] = self._internal_sub(val)
+        self._registers[Registers.A] = self._internal_sub(operands[0], self._flags[Flags.CARRY])
 
     def ei(self, *args):
         """Enable interupts
         """
-        logging.info("EI")
         self._enable_interrupts(True)
 
     def di(self, *args):
         """Enable interupts
         """
-        logging.info("DI")
         self._enable_interrupts(False)
 
     def daa(self, *args):
@@ -1441,7 +1748,6 @@ class Machine8080:
 
         All flags are affected.
         """
-        logging.info("DAA")
         val = self._registers[Registers.A]
         least = val & 0xf
         if least > 9 or self._flags[Flags.AUX_CARRY] == 1:
@@ -1460,9 +1766,7 @@ class Machine8080:
                 self._flags[Flags.CARRY] = 0
 
         val &= 0xff
-        self._flags.calculate_parity(val)
-        self._flags.set_zero(val)
-        self._flags.set_sign(val)
+        self._flags.set_szp_flags(val)
         self._registers[Registers.A] = val
 
 
@@ -0,0 +1,251 @@
+"""
+Memory map: which parts of the 64 KB address space are RAM, ROM, mirrors of
+other regions, or belong to a device.
+
+Memory is still one bytearray.  Machine8080 keeps a flags byte for each
+256-byte page; a write to a page with no flags set (ordinary RAM holding no
+code) is stored straight into the bytearray, and anything else takes the
+slow path:
+
+    CODE_PAGE     -- the page holds decoded instructions or compiled blocks
+                     that a write has to invalidate
+    WATCHED_PAGE  -- writes are recorded by Machine8080.track_writes()
+    MAPPED_PAGE   -- the page is ROM, device memory or a mirror, and its
+                     writes go through the MemoryMap tables
+
+ROM pages ignore writes.  Only the mirror's pages are mapped: reads and
+writes there are moved to the target page, so the target stays on the
+direct path when it's RAM.  A mirror of ROM or device memory also takes
+on its target's writer and reader.  Mirror and device pages are the only
+ones looked up on reads, through device_pages.
+
+Instructions are fetched straight from the bytearray, so code can't run
+from a mirror of RAM.  sync() copies each mirror's target into it when
+memory is loaded, which keeps mirrors of ROM runnable.
+
+The tables are rebuilt from the list of regions after every declaration,
+so the order regions are declared in only matters where they overlap.
+
+copy_on_write() gives forked machines their memory: private mmaps of one
+shared copy, so the operating system shares every page a fork hasn't
+written to and copies a page the first time the fork writes to it.
+"""
+from collections import namedtuple
+import errno
+import mmap
+import os
+import sys
+import tempfile
+
+MEMORY_SIZE = 0x10000
+PAGE_SHIFT = 8
+PAGE_SIZE = 1 << PAGE_SHIFT
+PAGE_COUNT = MEMORY_SIZE >> PAGE_SHIFT
+
+# page flag bits
+CODE_PAGE = 0x01
+WATCHED_PAGE = 0x02
+MAPPED_PAGE = 0x04
+
+RAM = "ram"
+ROM = "rom"
+MIRROR = "mirror"
+DEVICE = "device"
+
+# copy_on_write() mappings don't need to hold on to their file descriptor
+_MMAP_OPTIONS = {"trackfd": False} if sys.version_info >= (3, 13) else {}
+_OUT_OF_FILES = (errno.EMFILE, errno.ENFILE)
+
+Region = namedtuple('Region', ['kind', 'start', 'size', 'target', 'read', 'write'])
+
+
+def _ignore_write(address, val):
+    pass
+
+
+def _moved(function, delta):
+    """Returns function with its address argument moved by delta bytes, so a
+    mirror's page can call its target's reader or writer.
+    """
+    if not delta:
+        return function
+    return lambda address, *args: function(address + delta, *args)
+
+
+class MemoryMap:
+    def __init__(self):
+        self.regions = []
+        self.mapped_pages = bytearray(PAGE_COUNT)  # 1 where writes need the tables below
+        self.device_pages = bytearray(PAGE_COUNT)  # 1 where reads go to a device or mirror
+        self.writers = [None] * PAGE_COUNT  # write(address, val) for ROM and device pages
+        self.readers = [None] * PAGE_COUNT  # read(address) for device pages
+        self.offsets = [0] * PAGE_COUNT     # distance from a mirror page to its target
+        self.sources = list(range(PAGE_COUNT))  # page each page's bytes come from
+
+    @staticmethod
+    def _pages(start, size):
+        if start % PAGE_SIZE or size % PAGE_SIZE or size <= 0 or start + size > MEMORY_SIZE:
+            raise ValueError("regions must be whole pages inside memory: {0:04X}+{1:04X}".format(start, size))
+        return range(start >> PAGE_SHIFT, (start + size) >> PAGE_SHIFT)
+
+    def _declare(self, region):
+        self._pages(region.start, region.size)
+        self.regions.append(region)
+        try:
+            self._build()
+        except ValueError:
+            self.regions.pop()
+            raise
+
+    def _build(self):
+        """Works out the page tables from the regions.
+
+        Where regions overlap the one declared last wins.  Mirrors are
+        resolved against whatever their target ends up being, so a mirror
+        can be declared before or after its target: a mirror of ROM ignores
+        writes, and a mirror of device memory calls the device with the
+        target's addresses.
+        """
+        owners = [None] * PAGE_COUNT
+        for region in self.regions:
+            for page in self._pages(region.start, region.size):
+                owners[page] = region
+        mapped = bytearray(PAGE_COUNT)
+        devices = bytearray(PAGE_COUNT)
+        writers = [None] * PAGE_COUNT
+        readers = [None] * PAGE_COUNT
+        offsets = [0] * PAGE_COUNT
+        sources = [self._source(owners, page) for page in range(PAGE_COUNT)]
+        for page, source in enumerate(sources):
+            region = owners[source]
+            delta = (source - page) << PAGE_SHIFT
+            if delta:
+                # reads and writes are moved to the target page
+                mapped[page] = 1
+                devices[page] = 1
+                offsets[page] = delta
+            if region is not None and region.kind == ROM:
+                mapped[page] = 1
+                writers[page] = _ignore_write
+            elif region is not None and region.kind == DEVICE:
+                mapped[page] = 1
+                writers[page] = _moved(region.write if region.write is not None else _ignore_write, delta)
+                if region.read is not None:
+                    devices[page] = 1
+                    readers[page] = _moved(region.read, delta)
+        # in place: machines hold on to device_pages
+        self.mapped_pages[:] = mapped
+        self.device_pages[:] = devices
+        self.writers[:] = writers
+        self.readers[:] = readers
+        self.offsets[:] = offsets
+        self.sources[:] = sources
+
+    @staticmethod
+    def _source(owners, page):
+        """Follows mirrors from page to the page its bytes belong to.
+
+        :raises ValueError: if the mirrors form a loop
+        """
+        seen = set()
+        while owners[page] is not None and owners[page].kind == MIRROR:
+            if page in seen:
+                raise ValueError("mirrors loop back to {0:04X}".format(page << PAGE_SHIFT))
+            seen.add(page)
+            region = owners[page]
+            page += (region.target - region.start) >> PAGE_SHIFT
+        return page
+
+    def ram(self, start, size):
+        """Declares ordinary RAM.  This is what memory is by default; it's
+        only needed to document a map or to undo another declaration.
+        """
+        self._declare(Region(RAM, start, size, None, None, None))
+
+    def rom(self, start, size):
+        """Declares ROM.  Writes to it are ignored.
+        """
+        self._declare(Region(ROM, start, size, None, None, None))
+
+    def mirror(self, start, size, target):
+        """Declares start..start+size as a mirror of the region at target: the
+        same bytes appear at both addresses.  If the target is ROM the mirror
+        ignores writes too, and if it's device memory the mirror's reads and
+        writes go to the device at the target's addresses.
+
+        :raises ValueError: if the mirror would end up mirroring itself
+        """
+        self._pages(target, size)
+        self._declare(Region(MIRROR, start, size, target, None, None))
+
+    def device(self, start, size, read=None, write=None):
+        """Declares memory that belongs to a device.
+
+        :param read: called as read(address) to read a byte; if None reads see
+                     the bytearray as usual
+        :param write: called as write(address, val); if None writes are ignored
+        """
+        self._declare(Region(DEVICE, start, size, None, read, write))
+
+    def sync(self, memory):
+        """Copies each mirrored page's target into the mirror.  Called when
+        new contents are loaded into memory.
+        """
+        for page, source in enumerate(self.sources):
+            if source != page:
+                memory[page << PAGE_SHIFT:(page + 1) << PAGE_SHIFT] = \
+                    memory[source << PAGE_SHIFT:(source + 1) << PAGE_SHIFT]
+
+
+def copy_on_write(memory, count=1):
+    """Returns count copies of memory that share storage until written.
+
+    The contents are written once to an anonymous file, and each copy is a
+    private (copy-on-write) mapping of it.  Unwritten pages are shared by
+    every copy; a write copies just the page it lands in, so each copy costs
+    memory in proportion to the pages it changes.  Pages are the operating
+    system's (4 KB on most systems), not PAGE_SIZE.  The copies support the
+    same indexing, slicing and buffer interface as a bytearray.
+
+    Before Python 3.13 every mapping keeps a duplicate of the file
+    descriptor open.  If the process runs out of descriptors the remaining
+    copies are plain bytearrays, so a large fork still succeeds but shares
+    less.
+
+    :param memory: bytes-like object to copy
+    :param count: number of copies
+    :return: list of mmap objects (or bytearrays)
+    """
+    try:
+        if hasattr(os, "memfd_create"):
+            fp = os.fdopen(os.memfd_create("8080-memory"), "w+b")
+        else:
+            fp = tempfile.TemporaryFile()
+    except OSError as e:
+        if e.errno not in _OUT_OF_FILES:
+            raise
+        return [bytearray(memory) for _ in range(count)]
+    copies = []
+    with fp:
+        fp.write(memory)
+        fp.flush()
+        while len(copies) < count:
+            try:
+                copies.append(mmap.mmap(fp.fileno(), len(memory), access=mmap.ACCESS_COPY, **_MMAP_OPTIONS))
+            except OSError as e:
+                if e.errno not in _OUT_OF_FILES:
+                    raise
+                break
+    copies += [bytearray(memory) for _ in range(count - len(copies))]
+    return copies
+
+
+def invaders_map():
+    """Returns the Space Invaders memory map: 8 KB of ROM, 1 KB of work RAM
+    and 7 KB of video RAM, with the RAM mirrored at 4000.
+    """
+    memory_map = MemoryMap()
+    memory_map.rom(0x0000, 0x2000)
+    memory_map.ram(0x2000, 0x2000)
+    memory_map.mirror(0x4000, 0x2000, 0x2000)
+    return memory_map
@@ -0,0 +1,370 @@
+"""
+Execution profilers for Machine8080.
+
+OpcodeProfiler profiles the emulator: it times every instruction by opcode.
+GuestProfiler profiles the program running on it: where the PC spends its
+time and which subroutines that time belongs to.
+
+OpcodeProfiler is given to Machine8080 when it's built, like a tracer (see
+tracing.py), and wraps the entries of the opcode table, so a machine
+without one pays nothing.  Each wrapped handler reads perf_counter_ns()
+before and after the real handler and adds to preallocated arrays indexed
+by opcode:
+
+    counts    -- executions
+    total_ns  -- nanoseconds spent in the handler
+    histogram -- executions per latency bucket, HISTOGRAM_BUCKETS per opcode
+
+The histogram buckets are log-linear: four buckets for every power of two,
+so a percentile read from it is within about 12% of the true value.
+
+The time measured includes the wrapper's own overhead (a few hundred
+nanoseconds), which is the same for every opcode, so compare opcodes by
+their share rather than reading the means as absolute handler costs.
+
+GuestProfiler keeps a 64K array of counts indexed by PC.  By default it
+counts every instruction executed; given a sample_interval it instead
+schedules an event that counts the PC once every that many cycles, and
+leaves every handler but the calls and returns unwrapped, so compiled
+blocks still inline them.
+
+Either way it follows CALL, RST (and interrupts) and RET to keep a guest
+call stack, and charges the time spent to the stack it was spent in:
+cycles when counting every instruction, samples when sampling.  A call
+pushes a frame for the routine called, a return pops back to the frame
+whose return address it took from the stack, and a return that matches no
+frame (a computed jump through PUSH and RET) is ignored.  A call made with
+SP at or above a frame's drops that frame, since the program has abandoned
+its stack, so code that resets SP doesn't grow the stack forever.
+
+The charges are kept per stack, which gives both the per-routine report
+and the collapsed stacks that flame graph tools read, one line per stack:
+
+    start;0A3C;1A5F 1234
+"""
+from array import array
+from collections import namedtuple
+import functools
+import math
+from time import perf_counter_ns
+
+OPCODE_COUNT = 256
+MEMORY_SIZE = 0x10000
+# log-linear buckets: 4 per power of two up to 2**41 ns (about 36 minutes)
+SUB_BUCKET_BITS = 2
+MAX_BITS = 41
+HISTOGRAM_BUCKETS = (MAX_BITS + 1) << SUB_BUCKET_BITS
+
+OpcodeStats = namedtuple('OpcodeStats', ['opcode', 'mnemonic', 'count', 'total_ns', 'mean_ns',
+                                         'p50_ns', 'p99_ns', 'share'])
+HotSpot = namedtuple('HotSpot', ['address', 'count', 'share'])
+RoutineStats = namedtuple('RoutineStats', ['address', 'name', 'calls', 'inclusive', 'exclusive', 'share'])
+
+# CALL, conditional calls and RST
+CALL_OPCODES = frozenset([0xcd, 0xc4, 0xcc, 0xd4, 0xdc, 0xe4, 0xec, 0xf4, 0xfc,
+                          0xc7, 0xcf, 0xd7, 0xdf, 0xe7, 0xef, 0xf7, 0xff])
+# RET and conditional returns
+RETURN_OPCODES = frozenset([0xc9, 0xc0, 0xc8, 0xd0, 0xd8, 0xe0, 0xe8, 0xf0, 0xf8])
+
+
+def _bucket(ns):
+    """Returns the histogram bucket for a duration.
+    """
+    bits = ns.bit_length()
+    if bits <= SUB_BUCKET_BITS + 1:
+        return ns
+    if bits > MAX_BITS:
+        return HISTOGRAM_BUCKETS - 1
+    return (bits << SUB_BUCKET_BITS) | ((ns >> (bits - SUB_BUCKET_BITS - 1)) & ((1 << SUB_BUCKET_BITS) - 1))
+
+
+def _bucket_value(bucket):
+    """Returns the middle of the durations that fall in bucket.
+    """
+    bits = bucket >> SUB_BUCKET_BITS
+    if bits <= SUB_BUCKET_BITS + 1:
+        return bucket
+    shift = bits - SUB_BUCKET_BITS - 1
+    low = ((1 << SUB_BUCKET_BITS) | (bucket & ((1 << SUB_BUCKET_BITS) - 1))) << shift
+    return low + ((1 << shift) >> 1)
+
+
+class OpcodeProfiler:
+    def __init__(self):
+        self.counts = array('Q', [0]) * OPCODE_COUNT
+        self.total_ns = array('Q', [0]) * OPCODE_COUNT
+        self.histogram = array('Q', [0]) * (OPCODE_COUNT * HISTOGRAM_BUCKETS)
+        self._mnemonics = [""] * OPCODE_COUNT
+
+    def wrap(self, machine, op):
+        """Returns a handler that times op's handler.
+
+        :param machine: Machine8080 the handler belongs to
+        :param op: entry of the machine's opcode table
+        """
+        handler = op.handler
+        index = op.opcode
+        base = index * HISTOGRAM_BUCKETS
+        counts = self.counts
+        total_ns = self.total_ns
+        histogram = self.histogram
+        self._mnemonics[index] = op.mnemonic
+
+        @functools.wraps(handler)
+        def profiled(opcode, operands=()):
+            start = perf_counter_ns()
+            try:
+                return handler(opcode, operands)
+            finally:
+                elapsed = perf_counter_ns() - start
+                counts[index] += 1
+                total_ns[index] += elapsed
+                histogram[base + _bucket(elapsed)] += 1
+        return profiled
+
+    def reset(self):
+        """Zeroes every counter.
+        """
+        # in place: the wrappers hold these arrays
+        for counters in (self.counts, self.total_ns, self.histogram):
+            counters[:] = array('Q', [0]) * len(counters)
+
+    def percentile(self, opcode, fraction):
+        """Returns the duration in nanoseconds that the given fraction of the
+        opcode's executions took no longer than (to the histogram's
+        resolution), or 0 if it never ran.
+        """
+        count = self.counts[opcode]
+        if not count:
+            return 0
+        wanted = max(1, math.ceil(count * fraction))
+        base = opcode * HISTOGRAM_BUCKETS
+        seen = 0
+        for bucket in range(HISTOGRAM_BUCKETS):
+            seen += self.histogram[base + bucket]
+            if seen >= wanted:
+                return _bucket_value(bucket)
+        return _bucket_value(HISTOGRAM_BUCKETS - 1)
+
+    def stats(self):
+        """Returns an OpcodeStats for every opcode that ran, most time first.
+        """
+        overall = sum(self.total_ns) or 1
+        stats = [OpcodeStats(opcode, self._mnemonics[opcode], self.counts[opcode], self.total_ns[opcode],
+                             self.total_ns[opcode] / self.counts[opcode],
+                             self.percentile(opcode, 0.5), self.percentile(opcode, 0.99),
+                             self.total_ns[opcode] / overall)
+                 for opcode in range(OPCODE_COUNT) if self.counts[opcode]]
+        stats.sort(key=lambda s: s.total_ns, reverse=True)
+        return stats
+
+    def report(self, limit=None):
+        """Returns the stats as a table, one opcode per line.
+
+        :param limit: most opcodes to include
+        """
+        lines = [f'{"op":<3} {"mnemonic":<10} {"count":>10} {"mean ns":>9} {"p50 ns":>8} {"p99 ns":>8} {"share":>7}']
+        for s in self.stats()[:limit]:
+            lines.append(f'{s.opcode:02X}  {s.mnemonic:<10} {s.count:10d} {s.mean_ns:9.0f} '
+                         f'{s.p50_ns:8d} {s.p99_ns:8d} {s.share * 100:6.1f}%')
+        return "\n".join(lines)
+
+
+class GuestProfiler:
+    def __init__(self, sample_interval=None, symbols=None):
+        """
+        :param sample_interval: if given, count the PC once every this many
+                                cycles instead of at every instruction.
+                                Compiled blocks are only compiled between
+                                samples that are more than
+                                blocks.MAX_BLOCK_CYCLES apart.
+        :param symbols: dict of routine names by address, used in reports
+                        instead of the address
+        """
+        self.sample_interval = sample_interval
+        self.symbols = symbols if symbols is not None else {}
+        self.pc_counts = array('Q', [0]) * MEMORY_SIZE
+        self.calls = array('Q', [0]) * MEMORY_SIZE
+        # routine addresses, outermost first -> cycles or samples.  Cycles are
+        # charged to a stack when it's left, and by the reporting methods.
+        self.stacks = {}
+        self._stack = ()
+        self._frame_sps = []  # SP just after each frame's call pushed its return address
+        self._charged_at = 0  # cycle count the current stack was last charged up to
+        self._machine = None
+        self._event = None
+
+    def wrap(self, machine, op):
+        """Returns a handler that counts op's instruction and follows the
+        call stack, or op's own handler if there's nothing to do for it.
+
+        :param machine: Machine8080 the handler belongs to
+        :param op: entry of the machine's opcode table
+        """
+        if self._machine is not machine:
+            self._machine = machine
+            self._charged_at = machine._cycles
+            if self.sample_interval is not None:
+                self._event = machine.schedule(machine._cycles + self.sample_interval, self._sample)
+        handler = op.handler
+        length = op.length
+        pc_counts = None if self.sample_interval is not None else self.pc_counts
+
+        if op.opcode in CALL_OPCODES:
+            enter = self._enter
+
+            @functools.wraps(handler)
+            def profiled(opcode, operands=()):
+                sp = machine._sp
+                if pc_counts is not None and operands is not None:
+                    pc_counts[(machine._pc - length) & 0xffff] += 1
+                handler(opcode, operands)
+                if machine._sp != sp:
+                    enter(machine._pc, machine._sp)
+        elif op.opcode in RETURN_OPCODES:
+            leave = self._leave
+
+            @functools.wraps(handler)
+            def profiled(opcode, operands=()):
+                sp = machine._sp
+                if pc_counts is not None:
+                    pc_counts[(machine._pc - length) & 0xffff] += 1
+                handler(opcode, operands)
+                if machine._sp != sp:
+                    leave(sp)
+        elif pc_counts is not None:
+            @functools.wraps(handler)
+            def profiled(opcode, operands=()):
+                pc_counts[(machine._pc - length) & 0xffff] += 1
+                return handler(opcode, operands)
+        else:
+            return handler
+        return profiled
+
+    def _charge(self):
+        """Charges the cycles since the last charge to the current stack.
+        """
+        if self.sample_interval is None and self._machine is not None:
+            cycles = self._machine._cycles
+            if cycles != self._charged_at:
+                self.stacks[self._stack] = self.stacks.get(self._stack, 0) + cycles - self._charged_at
+                self._charged_at = cycles
+
+    def _enter(self, routine, sp):
+        self._charge()
+        frame_sps = self._frame_sps
+        depth = len(frame_sps)
+        while depth and frame_sps[depth - 1] <= sp:
+            depth -= 1
+        del frame_sps[depth:]
+        frame_sps.append(sp)
+        self._stack = self._stack[:depth] + (routine,)
+        self.calls[routine] += 1
+
+    def _leave(self, sp):
+        frame_sps = self._frame_sps
+        for depth in range(len(frame_sps) - 1, -1, -1):
+            if frame_sps[depth] == sp:
+                self._charge()
+                del frame_sps[depth:]
+                self._stack = self._stack[:depth]
+                return
+
+    def _sample(self, cycle):
+        machine = self._machine
+        # a machine that ran off the end of memory idles with the PC at 0x10000
+        self.pc_counts[machine._pc & 0xffff] += 1
+        self.stacks[self._stack] = self.stacks.get(self._stack, 0) + 1
+        self._event = machine.schedule(cycle + self.sample_interval, self._sample)
+
+    def stop(self):
+        """Stops sampling.  Everything counted so far is kept.
+        """
+        if self._event is not None:
+            self._machine.cancel(self._event)
+            self._event = None
+
+    def reset(self):
+        """Zeroes every count.  The call stack being followed is kept.
+        """
+        self._charge()
+        # in place: the wrappers hold these arrays
+        for counters in (self.pc_counts, self.calls):
+            counters[:] = array('Q', [0]) * MEMORY_SIZE
+        self.stacks = {}
+
+    def name(self, address):
+        """Returns the routine's name from symbols, or its address in hex.
+        """
+        return self.symbols.get(address, "{0:04X}".format(address))
+
+    def hot_spots(self, limit=None):
+        """Returns a HotSpot for every address counted, most counted first.
+
+        :param limit: most addresses to return
+        """
+        total = sum(self.pc_counts) or 1
+        counted = [(count, address) for address, count in enumerate(self.pc_counts) if count]
+        counted.sort(key=lambda c: (-c[0], c[1]))
+        return [HotSpot(address, count, count / total) for count, address in counted[:limit]]
+
+    def routines(self):
+        """Returns a RoutineStats for every routine that was called or had
+        time charged to it, most inclusive time first.  Time is in cycles,
+        or samples when sampling.
+        """
+        self._charge()
+        inclusive = {}
+        exclusive = {}
+        total = 0
+        for stack, weight in self.stacks.items():
+            total += weight
+            for routine in set(stack):
+                inclusive[routine] = inclusive.get(routine, 0) + weight
+            if stack:
+                exclusive[stack[-1]] = exclusive.get(stack[-1], 0) + weight
+        total = total or 1
+        called = {address for address, count in enumerate(self.calls) if count}
+        stats = [RoutineStats(address, self.name(address), self.calls[address], inclusive.get(address, 0),
+                              exclusive.get(address, 0), inclusive.get(address, 0) / total)
+                 for address in called | set(inclusive)]
+        stats.sort(key=lambda s: (-s.inclusive, s.address))
+        return stats
+
+    def collapsed(self):
+        """Returns the charged stacks in the collapsed format flame graph
+        tools read: one "start;caller;callee weight" line per stack.
+        """
+        self._charge()
+        lines = []
+        for stack, weight in sorted(self.stacks.items()):
+            if weight:
+                lines.append(";".join(["start"] + [self.name(r) for r in stack]) + " {0}".format(weight))
+        return lines
+
+    def write_collapsed(self, path):
+        """Writes collapsed() to a file.
+
+        :param path: path of the file, or an open text file
+        """
+        if hasattr(path, "write"):
+            path.write("\n".join(self.collapsed()) + "\n")
+            return
+        with open(path, "w") as fp:
+            self.write_collapsed(fp)
+
+    def report(self, limit=20):
+        """Returns the hot spots and the routines as tables.
+
+        :param limit: most lines in each table
+        """
+        unit = "samples" if self.sample_interval is not None else "count"
+        lines = [f'{"address":<8} {unit:>12} {"share":>7}']
+        for spot in self.hot_spots(limit):
+            lines.append(f'{spot.address:04X}     {spot.count:12d} {spot.share * 100:6.1f}%')
+        unit = "samples" if self.sample_interval is not None else "cycles"
+        lines.append("")
+        lines.append(f'{"routine":<16} {"calls":>8} {"inclusive " + unit:>18} {"exclusive " + unit:>18} {"share":>7}')
+        for r in self.routines()[:limit]:
+            lines.append(f'{r.name:<16} {r.calls:8d} {r.inclusive:18d} {r.exclusive:18d} {r.share * 100:6.1f}%')
+        return "\n".join(lines)
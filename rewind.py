@@ -0,0 +1,171 @@
+"""
+Rewind buffer for Machine8080.
+
+While running, the machine's state is captured every `interval` cycles.
+Every `keyframe_interval`th capture is a keyframe: the whole snapshot (see
+snapshot.py), zlib-compressed.  The captures between keyframes store only
+the XOR of their snapshot with the previous one, which is almost all zeros
+and compresses to a few hundred bytes.
+
+Going back to a capture decompresses its keyframe and XORs the deltas after
+it back in; going back to a cycle between captures restores the capture
+before it and runs the machine forward to the cycle.  Runs are only
+repeatable if the IO devices behave the same way when replayed.
+
+Captures are kept in a ring bounded by `budget` bytes.  When it's full the
+oldest keyframe is dropped together with its deltas, so memory use stays
+flat however long the machine runs.
+"""
+from collections import deque
+import zlib
+
+from cycles import CLOCK_HZ
+
+
+class Capture:
+    __slots__ = ('cycle', 'keyframe', 'data')
+
+    def __init__(self, cycle, keyframe, data):
+        self.cycle = cycle
+        self.keyframe = keyframe
+        self.data = data
+
+
+class Rewind:
+    def __init__(self, machine, interval=CLOCK_HZ // 60, keyframe_interval=60, budget=8 << 20):
+        """
+        :param machine: Machine8080 to record
+        :param interval: cycles between captures (a 60 Hz frame by default)
+        :param keyframe_interval: captures per keyframe
+        :param budget: most bytes the captures may use
+        """
+        self._machine = machine
+        self.interval = interval
+        self.keyframe_interval = keyframe_interval
+        self.budget = budget
+        self.size = 0
+        self._captures = deque()
+        self._since_keyframe = 0
+        self._previous = None  # uncompressed snapshot of the last capture
+        self._event = None
+
+    def __len__(self):
+        return len(self._captures)
+
+    @property
+    def oldest(self):
+        """Cycle of the earliest capture that can be returned to, or None.
+        """
+        return self._captures[0].cycle if self._captures else None
+
+    def start(self):
+        """Captures the machine now and then every interval cycles while it
+        runs.
+        """
+        self.capture()
+        self._schedule(self._machine.cycles + self.interval)
+
+    def stop(self):
+        """Stops capturing.  The captures already taken are kept.
+        """
+        if self._event is not None:
+            self._machine.cancel(self._event)
+            self._event = None
+
+    def _schedule(self, cycle):
+        self.stop()
+        self._event = self._machine.schedule(cycle, self._tick)
+
+    def _tick(self, cycle):
+        self.capture()
+        self._event = self._machine.schedule(cycle + self.interval, self._tick)
+
+    def capture(self):
+        """Adds the machine's current state to the buffer.
+        """
+        state = bytes(self._machine.snapshot())
+        if self._previous is None or self._since_keyframe + 1 >= self.keyframe_interval:
+            capture = Capture(self._machine.cycles, True, zlib.compress(state, 1))
+            self._since_keyframe = 0
+        else:
+            delta = int.from_bytes(state, 'little') ^ int.from_bytes(self._previous, 'little')
+            capture = Capture(self._machine.cycles, False,
+                              zlib.compress(delta.to_bytes(len(state), 'little'), 1))
+            self._since_keyframe += 1
+        self._previous = state
+        self._captures.append(capture)
+        self.size += len(capture.data)
+        self._trim()
+
+    def _trim(self):
+        """Drops the oldest keyframe and its deltas until the buffer is within
+        budget, always keeping the newest keyframe.
+        """
+        captures = self._captures
+        while self.size > self.budget:
+            end = 1
+            while end < len(captures) and not captures[end].keyframe:
+                end += 1
+            if end == len(captures):
+                break
+            for _ in range(end):
+                self.size -= len(captures.popleft().data)
+
+    def _state_at(self, index):
+        """Rebuilds the uncompressed snapshot of the capture at index.
+        """
+        start = index
+        while not self._captures[start].keyframe:
+            start -= 1
+        state = zlib.decompress(self._captures[start].data)
+        if start == index:
+            return state
+        value = int.from_bytes(state, 'little')
+        for i in range(start + 1, index + 1):
+            value ^= int.from_bytes(zlib.decompress(self._captures[i].data), 'little')
+        return value.to_bytes(len(state), 'little')
+
+    def _restore(self, index):
+        """Restores the capture at index and forgets the captures after it.
+        """
+        state = self._state_at(index)
+        self._machine.restore(state)
+        while len(self._captures) > index + 1:
+            self.size -= len(self._captures.pop().data)
+        self._previous = state
+        self._since_keyframe = 0
+        for capture in reversed(self._captures):
+            if capture.keyframe:
+                break
+            self._since_keyframe += 1
+        if self._event is not None:
+            self._schedule(self._machine.cycles + self.interval)
+
+    def step_back(self, count=1):
+        """Goes back count captures from the latest one.
+
+        :return: the cycle count the machine is back at
+        :raises IndexError: if there aren't that many captures
+        """
+        if not 0 <= count < len(self._captures):
+            raise IndexError("only {0} captures to step back through".format(len(self._captures) - 1))
+        self._restore(len(self._captures) - 1 - count)
+        return self._machine.cycles
+
+    def rewind_to(self, cycle):
+        """Puts the machine back to where it was at cycle: restores the last
+        capture at or before it, then runs forward to it.
+
+        :return: the cycle count the machine is at, which can be a few cycles
+                 past cycle if an instruction straddles it
+        :raises IndexError: if cycle is before the oldest capture
+        """
+        index = len(self._captures) - 1
+        while index >= 0 and self._captures[index].cycle > cycle:
+            index -= 1
+        if index < 0:
+            raise IndexError("cycle {0} is before the oldest capture".format(cycle))
+        self._restore(index)
+        if cycle > self._machine.cycles:
+            self._machine.run(cycles=cycle - self._machine.cycles)
+        return self._machine.cycles
@@ -0,0 +1,72 @@
+"""
+Event scheduler keyed on the machine's cycle counter.
+
+Devices register callbacks at absolute cycle counts (video interrupts,
+timers, sound).  Machine8080.run() executes straight up to the earliest
+event, fires every event that's due and carries on, so nothing is polled
+per instruction.
+
+Events are kept in a min-heap of [cycle, sequence, callback] entries.  The
+sequence number keeps events scheduled for the same cycle in the order they
+were added.  Cancelled events stay in the heap with no callback and are
+dropped when they reach the top.
+"""
+import heapq
+import itertools
+
+NEVER = float('inf')
+
+
+class Scheduler:
+    def __init__(self):
+        self._events = []
+        self._sequence = itertools.count()
+
+    def __len__(self):
+        return sum(1 for event in self._events if event[2] is not None)
+
+    def schedule(self, cycle, callback):
+        """Calls callback(cycle) once the cycle counter reaches cycle.
+
+        :param cycle: absolute cycle count the event is due at
+        :param callback: called with the cycle the event was scheduled for
+        :return: handle that can be passed to cancel()
+        """
+        event = [cycle, next(self._sequence), callback]
+        heapq.heappush(self._events, event)
+        return event
+
+    def cancel(self, event):
+        """Stops a scheduled event from firing.
+        """
+        event[2] = None
+
+    def clear(self):
+        """Drops every scheduled event.
+        """
+        self._events.clear()
+
+    @property
+    def next_deadline(self):
+        """Cycle count of the earliest event, or NEVER if there isn't one.
+        """
+        events = self._events
+        while events and events[0][2] is None:
+            heapq.heappop(events)
+        return events[0][0] if events else NEVER
+
+    def run_due(self, now):
+        """Fires, in order, every event due at or before now, including events
+        that callbacks schedule for then.
+
+        :param now: current cycle count
+        :return: number of events fired
+        """
+        events = self._events
+        fired = 0
+        while events and events[0][0] <= now:
+            cycle, _, callback = heapq.heappop(events)
+            if callback is not None:
+                callback(cycle)
+                fired += 1
+        return fired
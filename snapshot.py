@@ -0,0 +1,142 @@
+"""
+Save states for Machine8080.
+
+A snapshot is a versioned binary blob:
+
+    header  -- magic b'8080', format version, compression method
+    payload -- STATE (registers, flags, PC, SP, cycle count and interrupt
+               state), the 256 latched IO port values and the 64 KB of
+               memory, compressed with zlib or lzma if asked for
+
+The payload is built in one preallocated buffer with struct.pack_into and a
+single slice copy of memory, and restored the same way.
+
+Scheduled events and devices attached to the IO bus hold Python callbacks
+and are not saved; whoever restores a machine sets them up again.
+"""
+import lzma
+import struct
+import zlib
+
+MAGIC = b'8080'
+VERSION = 1
+
+NONE = 0
+ZLIB = 1
+LZMA = 2
+_COMPRESSION = {None: NONE, "zlib": ZLIB, "lzma": LZMA}
+
+HEADER = struct.Struct('<4sBB')
+# registers, flags, pc, sp, cycles, interrupts enabled, EI delay, pending
+# interrupt vector (-1 for none), halted, interrupt raised at, interrupt
+# latency, interrupts serviced
+STATE = struct.Struct('<8sBIHQBBbBQQQ')
+PORTS_SIZE = 256
+MEMORY_SIZE = 0x10000
+PAYLOAD_SIZE = STATE.size + PORTS_SIZE + MEMORY_SIZE
+
+
+class SnapshotException(Exception):
+    def __init__(self, msg):
+        self._msg = msg
+
+    def __str__(self):
+        return self._msg
+
+
+def save(machine, compression=None):
+    """Returns a snapshot of the machine's state.
+
+    :param machine: Machine8080 to save
+    :param compression: None, "zlib" or "lzma"
+    :return: the snapshot as a bytearray
+    """
+    if compression not in _COMPRESSION:
+        raise SnapshotException("Unknown compression {0!r}".format(compression))
+    method = _COMPRESSION[compression]
+    blob = bytearray(HEADER.size + PAYLOAD_SIZE)
+    HEADER.pack_into(blob, 0, MAGIC, VERSION, method)
+    _pack_state(machine, blob, HEADER.size)
+    offset = HEADER.size + STATE.size + PORTS_SIZE
+    blob[offset:] = machine._memory
+    if method == ZLIB:
+        return blob[:HEADER.size] + zlib.compress(memoryview(blob)[HEADER.size:], 1)
+    if method == LZMA:
+        return blob[:HEADER.size] + lzma.compress(memoryview(blob)[HEADER.size:])
+    return blob
+
+
+def restore(machine, snapshot):
+    """Puts the machine back in the state saved in snapshot.
+
+    :param machine: Machine8080 to restore
+    :param snapshot: bytes-like object returned by save()
+    :raises SnapshotException: if snapshot isn't a snapshot this version can read
+    """
+    view = memoryview(snapshot)
+    if len(view) < HEADER.size:
+        raise SnapshotException("Snapshot is truncated")
+    magic, version, method = HEADER.unpack_from(view)
+    if magic != MAGIC:
+        raise SnapshotException("Not a snapshot")
+    if version != VERSION:
+        raise SnapshotException("Unsupported snapshot version {0}".format(version))
+    payload = view[HEADER.size:]
+    try:
+        if method == ZLIB:
+            payload = memoryview(zlib.decompress(payload))
+        elif method == LZMA:
+            payload = memoryview(lzma.decompress(payload))
+        elif method != NONE:
+            raise SnapshotException("Unknown compression method {0}".format(method))
+    except (zlib.error, lzma.LZMAError) as e:
+        raise SnapshotException("Corrupt snapshot: {0}".format(e))
+    if len(payload) != PAYLOAD_SIZE:
+        raise SnapshotException("Snapshot is {0} bytes, expected {1}".format(len(payload), PAYLOAD_SIZE))
+
+    _unpack_state(machine, payload, 0)
+    machine._replace_memory(payload[STATE.size + PORTS_SIZE:])
+
+
+def copy_state(source, target):
+    """Copies everything a snapshot holds except memory from one machine to
+    another.
+    """
+    buffer = bytearray(STATE.size + PORTS_SIZE)
+    _pack_state(source, buffer, 0)
+    _unpack_state(target, buffer, 0)
+
+
+def _pack_state(machine, buffer, offset):
+    """Packs STATE and the IO port latches into buffer at offset.
+    """
+    pending = machine._pending_interrupt
+    STATE.pack_into(buffer, offset,
+                    bytes(machine._registers), machine._flags.flags, machine._pc, machine._sp,
+                    machine._cycles, machine._interrupts, machine._ei_delay,
+                    -1 if pending is None else pending, machine._halted,
+                    machine._interrupt_raised_at, machine.interrupt_latency,
+                    machine.interrupts_serviced)
+    offset += STATE.size
+    buffer[offset:offset + PORTS_SIZE] = machine._io.latched
+
+
+def _unpack_state(machine, buffer, offset):
+    """Sets the machine's state from what _pack_state() put in buffer.
+    """
+    (registers, flags, pc, sp, cycles, interrupts, ei_delay, pending, halted,
+     raised_at, latency, serviced) = STATE.unpack_from(buffer, offset)
+    machine._registers.restore(registers)
+    machine._flags.flags = flags
+    machine._pc = pc
+    machine._sp = sp
+    machine._cycles = cycles
+    machine._interrupts = bool(interrupts)
+    machine._ei_delay = bool(ei_delay)
+    machine._pending_interrupt = None if pending < 0 else pending
+    machine._halted = bool(halted)
+    machine._interrupt_raised_at = raised_at
+    machine.interrupt_latency = latency
+    machine.interrupts_serviced = serviced
+    offset += STATE.size
+    machine._io.latched[:] = buffer[offset:offset + PORTS_SIZE]
@@ -0,0 +1,176 @@
+from unittest import TestCase
+import logging
+
+from machine import Machine8080, OutOfMemoryException
+from blocks import MAX_BLOCK_INSTRUCTIONS
+from cpu import Registers
+from memory import CODE_PAGE
+from tests.test_dispatch import PROGRAM, load_program, machine_state
+
+
+class TestBlockCompiler(TestCase):
+    def setUp(self):
+        self.machine = Machine8080(compile_blocks=True)
+        logging.basicConfig(level=logging.WARNING)
+
+    def test_run_matches_execute(self):
+        reference = Machine8080()
+        load_program(reference, PROGRAM)
+        reference.execute()
+
+        load_program(self.machine, PROGRAM)
+        self.machine.run()
+        self.assertEqual(machine_state(self.machine), machine_state(reference))
+
+    def test_blocks_end_at_control_flow(self):
+        load_program(self.machine, PROGRAM)
+        self.machine.run()
+        blocks = self.machine._blocks.blocks
+        # LXI SP / LXI H / MVI B / MVI A ... up to the CALL at 000F
+        self.assertEqual(blocks[0x0000].end, 0x0012)
+        # loop body starts at 000A and ends with the same CALL
+        self.assertEqual(blocks[0x000a].instructions, 5)
+        # subroutine ends at the RET
+        self.assertEqual(blocks[0x0020].end, 0x0028)
+
+    def test_cache_counters(self):
+        load_program(self.machine, PROGRAM)
+        self.machine.run()
+        stats = self.machine._blocks.stats()
+        self.assertEqual(stats["size"], len(self.machine._blocks.blocks))
+        self.assertEqual(stats["misses"], stats["size"])
+        self.assertGreater(stats["hits"], 0)
+
+        self.machine._blocks.clear()
+        self.assertEqual(self.machine._blocks.size, 0)
+
+    def test_long_blocks_are_split(self):
+        load_program(self.machine, {0x0000: [0x00] * (MAX_BLOCK_INSTRUCTIONS + 10) + [0x76]})
+        self.machine.run()
+        self.assertEqual(self.machine._blocks.blocks[0].instructions, MAX_BLOCK_INSTRUCTIONS)
+        self.assertEqual(self.machine._pc, MAX_BLOCK_INSTRUCTIONS + 11)
+
+    def test_alu_instructions_match_execute(self):
+        program = [0x31, 0x00, 0x24]                                   # LXI SP, 2400
+        for value in (0x00, 0x0f, 0x7f, 0x80, 0xff):
+            for opcode in range(0x80, 0xc0):
+                if opcode & 0x07 == 6:
+                    continue
+                program += [0x3e, 0x5a, 0x06, value, 0x0e, 0x01,       # MVI A, MVI B, MVI C
+                            0x37, opcode,                              # STC, ALU r
+                            0x04, 0x0d, 0x3f, 0x2f, 0xf5, 0xe1]        # INR B, DCR C, CMC, CMA, PUSH PSW, POP H
+            for opcode in range(0xc6, 0x100, 8):
+                program += [0x3e, 0x5a, 0x37, opcode, value, 0xf5, 0xe1]   # MVI A, STC, ALU imm, PUSH PSW, POP H
+        program.append(0x76)
+        reference = Machine8080()
+        load_program(reference, {0x0000: program})
+        reference.execute()
+
+        load_program(self.machine, {0x0000: program})
+        self.machine.run()
+        self.assertEqual(machine_state(self.machine), machine_state(reference))
+
+    def test_exception_leaves_pc_and_cycles_consistent(self):
+        program = {0x0000: [0x00, 0x00,          # NOP, NOP
+                            0xdb, 0x05,          # IN 05 (the device raises)
+                            0x76]}               # HLT
+
+        def broken(port):
+            raise OutOfMemoryException()
+
+        predecoded = Machine8080()
+        load_program(predecoded, program)
+        predecoded.io.map(5, read=broken)
+        with self.assertRaises(OutOfMemoryException):
+            predecoded.run()
+
+        load_program(self.machine, program)
+        self.machine.io.map(5, read=broken)
+        with self.assertRaises(OutOfMemoryException):
+            self.machine.run()
+        self.assertEqual(self.machine._pc, predecoded._pc)
+        self.assertEqual(self.machine.cycles, predecoded.cycles)
+
+    def test_blocks_only_compiled_when_run(self):
+        load_program(self.machine, PROGRAM)
+        self.machine.run(cycles=1)
+        self.assertEqual(self.machine._blocks.size, 0)
+        self.assertEqual(self.machine._blocks.hits, 0)
+
+    def test_run_stops_at_end_of_memory(self):
+        load_program(self.machine, {})
+        self.machine._pc = 0xfff0
+        self.machine.run()
+        self.assertEqual(self.machine._pc, 0x10000)
+
+
+# patches the operand of its own MVI B on every pass through the loop
+SELF_MODIFYING = {
+    0x0000: [0x0e, 0x03,         # MVI C, 03
+             0x06, 0x00,         # MVI B, 00   <- operand at 0003 is patched
+             0x78,               # MOV A, B
+             0xc6, 0x07,         # ADI 07
+             0x32, 0x03, 0x00,   # STA 0003
+             0x0d,               # DCR C
+             0xc2, 0x02, 0x00,   # JNZ 0002
+             0x76],              # HLT
+}
+
+
+class TestSelfModifyingCode(TestCase):
+    def setUp(self):
+        logging.basicConfig(level=logging.WARNING)
+        self.reference = Machine8080()
+        load_program(self.reference, SELF_MODIFYING)
+        self.reference.execute()
+
+    def test_predecoded(self):
+        machine = Machine8080()
+        load_program(machine, SELF_MODIFYING)
+        machine.run()
+        self.assertEqual(machine_state(machine), machine_state(self.reference))
+        self.assertGreater(machine._decoded.invalidations, 0)
+
+    def test_compiled(self):
+        machine = Machine8080(compile_blocks=True)
+        load_program(machine, SELF_MODIFYING)
+        machine.run()
+        self.assertEqual(machine_state(machine), machine_state(self.reference))
+        self.assertGreater(machine._blocks.invalidations, 0)
+
+    def test_block_patching_itself(self):
+        program = {0x0000: [0x3e, 0x42,          # MVI A, 42
+                            0x32, 0x06, 0x00,    # STA 0006
+                            0x06, 0x00,          # MVI B, 00   <- operand patched to 42
+                            0x76]}               # HLT
+        for compile_blocks in (False, True):
+            machine = Machine8080(compile_blocks=compile_blocks)
+            load_program(machine, program)
+            machine.run()
+            self.assertEqual(machine._registers[Registers.B], 0x42)
+
+    def test_only_overlapping_entries_are_invalidated(self):
+        machine = Machine8080(compile_blocks=True)
+        load_program(machine, SELF_MODIFYING)
+        machine.run()
+        decoded = machine._decoded
+        # 0002 (MVI B) overlaps 0003; 0000 (MVI C) and 0004 (MOV A,B) don't
+        machine.write_memory(0x0003, 0x11)
+        self.assertIsNone(decoded.handlers[0x0002])
+        self.assertIsNotNone(decoded.handlers[0x0000])
+        self.assertIsNotNone(decoded.handlers[0x0004])
+        # the blocks at 0000 and 0002 both contain 0003, the HLT block doesn't
+        self.assertNotIn(0x0000, machine._blocks.blocks)
+        self.assertNotIn(0x0002, machine._blocks.blocks)
+        self.assertIn(0x000e, machine._blocks.blocks)
+
+    def test_data_writes_leave_code_alone(self):
+        machine = Machine8080(compile_blocks=True)
+        load_program(machine, SELF_MODIFYING)
+        machine.run()
+        self.assertEqual(machine._page_flags[0x20] & CODE_PAGE, 0)
+        invalidations = machine._decoded.invalidations
+        blocks = machine._blocks.size
+        machine.write_memory(0x2000, 0xff)
+        self.assertEqual(machine._decoded.invalidations, invalidations)
+        self.assertEqual(machine._blocks.size, blocks)
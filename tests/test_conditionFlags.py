@@ -1,6 +1,6 @@
 from unittest import TestCase
 
-from cpu import Flags
+from cpu import Flags, SZP_FLAGS, ADD_FLAGS, SUB_FLAGS, INR_FLAGS, DCR_FLAGS
 
 
 class TestConditionFlags(TestCase):
@@ -25,3 +25,59 @@ class TestConditionFlags(TestCase):
         for b, res in [(0x00, 1), (0x01, 0), (0x02, 0), (0x03, 1), (0xe3, 0), (0xf3, 1)]: # 0xe3 == 1110 0011
             self.flags.calculate_parity(b)
             self.assertTrue(self.flags[Flags.PARITY] == res, f'Incorrect parity for {b}: expected {res}')
+
+
+class TestFlagTables(TestCase):
+    def setUp(self):
+        self.flags = Flags()
+
+    def szp(self, res):
+        self.flags.flags = 2
+        self.flags.calculate_parity(res)
+        self.flags.set_zero(res)
+        self.flags.set_sign(res)
+        return self.flags.flags & ~2
+
+    def test_szp_table(self):
+        for b in range(256):
+            self.assertEqual(SZP_FLAGS[b], self.szp(b))
+
+    def test_add_table(self):
+        szp_mask = (1 << Flags.SIGN) | (1 << Flags.ZERO) | (1 << Flags.PARITY)
+        for a in range(256):
+            for val in (0, 1, 0x0f, 0x7f, 0x80, 0xff, 0x100):
+                bits = ADD_FLAGS[(a << 9) | val]
+                self.assertEqual(bits & szp_mask, self.szp((a + val) & 0xff))
+                self.assertEqual(bits >> Flags.CARRY & 1, int(a + val > 0xff))
+                self.assertEqual(bits >> Flags.AUX_CARRY & 1, int((a & 0xf) + (val & 0xf) > 0xf))
+
+    def test_sub_table(self):
+        self.assertEqual(SUB_FLAGS[(5 << 9) | 5], 1 << Flags.ZERO | 1 << Flags.PARITY)
+        # 0x10 - 0x01 borrows out of the low nibble only
+        self.assertEqual(SUB_FLAGS[(0x10 << 9) | 0x01], 1 << Flags.AUX_CARRY | 1 << Flags.PARITY)
+        # compared as signed bytes: 0x80 (-128) < 0x01
+        self.assertTrue(SUB_FLAGS[(0x80 << 9) | 0x01] & (1 << Flags.CARRY))
+        # SBB with the carry set subtracts the borrow as well: 0x01 - 0x00 - 1
+        self.assertEqual(SUB_FLAGS[(0x01 << 9) | (1 << 8) | 0x00], 1 << Flags.ZERO | 1 << Flags.PARITY)
+        # 0x10 - 0x0f - 1 borrows out of the low nibble
+        self.assertTrue(SUB_FLAGS[(0x10 << 9) | (1 << 8) | 0x0f] & (1 << Flags.AUX_CARRY))
+
+    def test_increment_tables(self):
+        for b in range(256):
+            self.assertEqual(INR_FLAGS[b] & ~(1 << Flags.AUX_CARRY), self.szp((b + 1) & 0xff))
+            self.assertEqual(DCR_FLAGS[b] & ~(1 << Flags.AUX_CARRY), self.szp((b - 1) & 0xff))
+        self.assertTrue(INR_FLAGS[0x0f] & (1 << Flags.AUX_CARRY))
+        self.assertTrue(DCR_FLAGS[0x10] & (1 << Flags.AUX_CARRY))
+
+    def test_set_flags_keeps_unaffected_bits(self):
+        self.flags.set(Flags.CARRY)
+        self.flags.set_inr_flags(0xff)
+        self.assertEqual(self.flags[Flags.CARRY], 1)
+        self.assertEqual(self.flags[Flags.ZERO], 1)
+
+        self.flags.set(Flags.AUX_CARRY)
+        self.flags.set_szp_flags(0x80)
+        self.assertEqual(self.flags[Flags.CARRY], 1)
+        self.assertEqual(self.flags[Flags.AUX_CARRY], 1)
+        self.assertEqual(self.flags[Flags.ZERO], 0)
+        self.assertEqual(self.flags[Flags.SIGN], 1)
@@ -0,0 +1,73 @@
+from unittest import TestCase
+import logging
+
+from machine import Machine8080
+from cycles import CYCLES, CALL_TAKEN_EXTRA, RET_TAKEN_EXTRA
+from tests.test_dispatch import PROGRAM, load_program, machine_state
+
+
+class TestCycleTable(TestCase):
+    def test_table(self):
+        self.assertEqual(len(CYCLES), 256)
+        self.assertEqual(CYCLES[0x00], 4)     # NOP
+        self.assertEqual(CYCLES[0x7e], 7)     # MOV A, M
+        self.assertEqual(CYCLES[0xcd], 17)    # CALL
+        self.assertEqual(CYCLES[0xc4], 11)    # CNZ not taken
+        self.assertEqual(CYCLES[0xc0], 5)     # RNZ not taken
+        self.assertEqual(CYCLES[0xe3], 18)    # XTHL
+
+
+class TestCycleCounting(TestCase):
+    def setUp(self):
+        logging.basicConfig(level=logging.WARNING)
+        self.reference = Machine8080()
+        load_program(self.reference, PROGRAM)
+        self.reference.execute()
+
+    def test_run_counts_cycles(self):
+        for compile_blocks in (False, True):
+            machine = Machine8080(compile_blocks=compile_blocks)
+            load_program(machine, PROGRAM)
+            self.assertEqual(machine.run(), self.reference.cycles)
+            self.assertEqual(machine.cycles, self.reference.cycles)
+
+    def test_conditional_call_and_return(self):
+        machine = Machine8080()
+        load_program(machine, {0x0000: [0x31, 0x00, 0x24,   # LXI SP, 2400
+                                        0xaf,               # XRA A      Z set
+                                        0xc4, 0x10, 0x00,   # CNZ 0010   not taken
+                                        0xcc, 0x10, 0x00,   # CZ 0010    taken
+                                        0x76],              # HLT
+                               0x0010: [0xc0,               # RNZ        not taken
+                                        0xc8]})             # RZ         taken
+        expected = 10 + 4 + 11 + (11 + CALL_TAKEN_EXTRA) + 5 + (5 + RET_TAKEN_EXTRA) + 7
+        self.assertEqual(machine.run(), expected)
+
+    def test_budget_stops_on_instruction_boundary(self):
+        machine = Machine8080()
+        load_program(machine, {0x0000: [0x00] * 100})
+        self.assertEqual(machine.run(cycles=10), 12)
+        self.assertEqual(machine._pc, 3)
+        self.assertEqual(machine.run(cycles=8), 8)
+        self.assertEqual(machine._pc, 5)
+
+    def test_blocks_stop_where_predecoded_stops(self):
+        for budget in (1, 17, 50, 123, 400, 1000):
+            predecoded = Machine8080()
+            load_program(predecoded, PROGRAM)
+            compiled = Machine8080(compile_blocks=True)
+            load_program(compiled, PROGRAM)
+            while not predecoded.halted:
+                predecoded.run(cycles=budget)
+                compiled.run(cycles=budget)
+                self.assertEqual(compiled.cycles, predecoded.cycles)
+                self.assertEqual(machine_state(compiled), machine_state(predecoded))
+            self.assertTrue(compiled.halted)
+            self.assertEqual(machine_state(compiled), machine_state(self.reference))
+
+    def test_halted_machine_idles(self):
+        machine = Machine8080()
+        load_program(machine, {0x0000: [0x76]})
+        self.assertEqual(machine.run(cycles=100), 100)
+        self.assertTrue(machine.halted)
+        self.assertEqual(machine._pc, 1)
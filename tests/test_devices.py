@@ -0,0 +1,41 @@
+from unittest import TestCase
+import logging
+
+from machine import Machine8080
+from cpu import Registers
+from devices import ShiftRegister
+from iobus import IOBus
+from tests.test_dispatch import load_program
+
+
+class TestShiftRegister(TestCase):
+    def setUp(self):
+        self.bus = IOBus()
+        self.shifter = ShiftRegister()
+        self.shifter.attach(self.bus)
+
+    def test_shift(self):
+        self.bus.write(4, 0xab)
+        self.bus.write(4, 0xcd)       # register is now CDAB
+        self.assertEqual(self.bus.read(3), 0xcd)
+        self.bus.write(2, 4)
+        self.assertEqual(self.bus.read(3), 0xda)
+        self.bus.write(2, 7)
+        self.assertEqual(self.bus.read(3), 0xd5)
+
+    def test_offset_is_three_bits(self):
+        self.bus.write(4, 0xff)
+        self.bus.write(2, 0x09)
+        self.assertEqual(self.shifter.offset, 1)
+
+    def test_from_the_cpu(self):
+        machine = Machine8080()
+        self.shifter.attach(machine.io)
+        load_program(machine, {0x0000: [0x3e, 0x0f, 0xd3, 0x04,    # MVI A, 0F; OUT 4
+                                        0x3e, 0xf0, 0xd3, 0x04,    # MVI A, F0; OUT 4
+                                        0x3e, 0x02, 0xd3, 0x02,    # MVI A, 02; OUT 2
+                                        0xdb, 0x03,                # IN 3
+                                        0x76]})                    # HLT
+        logging.basicConfig(level=logging.WARNING)
+        machine.run()
+        self.assertEqual(machine._registers[Registers.A], 0xc0)    # F00F << 2 -> C03C
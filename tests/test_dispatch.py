@@ -0,0 +1,107 @@
+from unittest import TestCase
+import logging
+
+from machine import Machine8080
+from cpu import Registers
+
+# small program that loops over a buffer using calls, the stack, and the ALU
+PROGRAM = {
+    0x0000: [0x31, 0x00, 0x24,   # LXI SP, 2400
+             0x21, 0x00, 0x20,   # LXI H, 2000
+             0x06, 0x10,         # MVI B, 10
+             0x3e, 0x01,         # MVI A, 01
+             0x77,               # MOV M, A
+             0x23,               # INX H
+             0x87,               # ADD A
+             0xce, 0x03,         # ACI 03
+             0xcd, 0x20, 0x00,   # CALL 0020
+             0x05,               # DCR B
+             0xc2, 0x0a, 0x00,   # JNZ 000A
+             0xf5,               # PUSH PSW
+             0xe1,               # POP H
+             0x76],              # HLT
+    0x0020: [0xe5,               # PUSH H
+             0xd6, 0x07,         # SUI 07
+             0xe6, 0x7f,         # ANI 7F
+             0x2f,               # CMA
+             0xe1,               # POP H
+             0xc9],              # RET
+}
+
+
+def load_program(machine, program):
+    machine._memory = bytearray(0x10000)
+    for address, code in program.items():
+        machine._memory[address:address + len(code)] = bytes(code)
+
+
+def machine_state(machine):
+    regs = [machine._registers[r] for r in (Registers.B, Registers.C, Registers.D, Registers.E,
+                                            Registers.H, Registers.L, Registers.A)]
+    return machine._pc, machine._sp, machine._flags.flags, regs, bytes(machine._memory)
+
+
+class TestPredecodedDispatch(TestCase):
+    def setUp(self):
+        logging.basicConfig(level=logging.WARNING)
+
+    def test_run_matches_execute(self):
+        reference = Machine8080()
+        load_program(reference, PROGRAM)
+        reference.execute()
+
+        machine = Machine8080()
+        load_program(machine, PROGRAM)
+        machine.run()
+        self.assertEqual(machine_state(machine), machine_state(reference))
+
+    def test_step_matches_execute_on_rom(self):
+        reference = Machine8080()
+        reference.load("rom")
+        machine = Machine8080()
+        machine.load("rom")
+
+        instructions = reference.next_instruction()
+        for _ in range(2000):
+            inst, operands = next(instructions, (None, None))
+            if inst is None:
+                break
+            inst.handler(inst.opcode, operands)
+            machine.step()
+            self.assertEqual(machine_state(machine), machine_state(reference))
+
+    def test_tables_allocated_on_first_run(self):
+        machine = Machine8080()
+        load_program(machine, PROGRAM)
+        machine.write_memory(0x2000, 0x01)
+        self.assertIsNone(machine._decoded.handlers)
+        machine.step()
+        self.assertEqual(len(machine._decoded.handlers), 0x10002)
+
+    def test_step_stops_at_halt(self):
+        machine = Machine8080()
+        load_program(machine, {0x0000: [0x00, 0x00, 0x76, 0x00]})
+        self.assertEqual(machine.step(10), 3)
+        self.assertEqual(machine._pc, 3)
+
+    def test_run_stops_at_end_of_memory(self):
+        machine = Machine8080()
+        load_program(machine, {0xfff0: [0x00]})
+        machine._pc = 0xfff0
+        machine.run()
+        self.assertEqual(machine._pc, 0x10000)
+
+    def test_subtract_borrow_runs(self):
+        program = {0x0000: [0x3e, 0x80,   # MVI A, 80
+                            0x37,         # STC
+                            0xde, 0x00,   # SBI 00
+                            0x76]}        # HLT
+        reference = Machine8080()
+        load_program(reference, program)
+        reference.execute()
+
+        machine = Machine8080()
+        load_program(machine, program)
+        machine.run()
+        self.assertEqual(machine_state(machine), machine_state(reference))
+        self.assertEqual(machine._registers[Registers.A], 0x7f)
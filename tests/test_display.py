@@ -0,0 +1,93 @@
+from unittest import TestCase, skipUnless
+import io
+
+from machine import Machine8080
+from tests.test_dispatch import load_program
+
+try:
+    from display import Display, VIDEO_RAM, WIDTH, HEIGHT
+except ImportError:  # display needs numpy
+    Display = None
+
+
+@skipUnless(Display, "display needs numpy")
+class TestDisplay(TestCase):
+    def setUp(self):
+        self.machine = Machine8080()
+        load_program(self.machine, {})
+        self.display = Display(self.machine)
+
+    def test_blank(self):
+        frame = self.display.render()
+        self.assertEqual(frame.shape, (HEIGHT, WIDTH))
+        self.assertFalse(frame.any())
+
+    def test_rotation(self):
+        # first byte, lowest bit: left column, bottom row
+        self.machine._memory[VIDEO_RAM] = 0x01
+        # last byte, highest bit: right column, top row
+        self.machine._memory[VIDEO_RAM + 0x1bff] = 0x80
+        # second row of memory, bit 1 of its first byte: second column, one up from the bottom
+        self.machine._memory[VIDEO_RAM + 32] = 0x02
+        frame = self.display.render()
+        self.assertEqual(frame[HEIGHT - 1, 0], 1)
+        self.assertEqual(frame[0, WIDTH - 1], 1)
+        self.assertEqual(frame[HEIGHT - 2, 1], 1)
+        self.assertEqual(frame.sum(), 3)
+
+    def test_memory_is_not_copied(self):
+        self.display.render()
+        self.machine.write_memory(VIDEO_RAM + 100, 0xff)
+        self.assertEqual(self.display.render().sum(), 8)
+
+    def test_only_written_rows_are_redrawn(self):
+        self.display.render()
+        # bypasses write_memory, so the row isn't marked
+        self.machine._memory[VIDEO_RAM] = 0xff
+        self.machine.write_memory(VIDEO_RAM + 64, 0x01)
+        frame = self.display.render()
+        self.assertEqual(frame.sum(), 1)
+        self.assertEqual(frame[HEIGHT - 1, 2], 1)
+        self.display.invalidate()
+        self.assertEqual(self.display.render().sum(), 9)
+
+    def test_rgb_follows_written_rows(self):
+        self.display.render_rgb()
+        self.machine.write_memory(VIDEO_RAM + 32, 0x01)
+        self.display.render()
+        rgb = self.display.render_rgb()
+        self.assertEqual(rgb[HEIGHT - 1, 1].tolist(), [0xff, 0xff, 0xff])
+        self.assertEqual(int(rgb.sum()), 3 * 0xff)
+
+    def test_track_writes(self):
+        dirty = self.machine.track_writes(VIDEO_RAM, 0x1c00)
+        dirty[:] = bytes(len(dirty))
+        self.machine.write_memory(VIDEO_RAM - 1, 0xff)
+        self.machine.write_memory(VIDEO_RAM + 0x1c00, 0xff)
+        self.assertEqual(dirty.count(1), 0)
+        self.machine.write_memory(VIDEO_RAM + 0x1bff, 0xff)
+        self.assertEqual(dirty.count(1), 1)
+        self.assertEqual(dirty[WIDTH - 1], 1)
+
+    def test_follows_reloaded_memory(self):
+        self.display.render()
+        load_program(self.machine, {VIDEO_RAM: [0x01]})
+        self.assertEqual(self.display.render().sum(), 1)
+
+    def test_ppm(self):
+        self.machine._memory[VIDEO_RAM] = 0x01
+        stream = io.BytesIO()
+        self.display.write_ppm(stream)
+        data = stream.getvalue()
+        header = b'P6\n224 256\n255\n'
+        self.assertTrue(data.startswith(header))
+        pixels = data[len(header):]
+        self.assertEqual(len(pixels), WIDTH * HEIGHT * 3)
+        bottom_left = ((HEIGHT - 1) * WIDTH) * 3
+        self.assertEqual(pixels[bottom_left:bottom_left + 3], b'\xff\xff\xff')
+        self.assertEqual(pixels.count(0xff), 3)
+
+    def test_raw(self):
+        stream = io.BytesIO()
+        self.display.write_raw(stream)
+        self.assertEqual(len(stream.getvalue()), WIDTH * HEIGHT)
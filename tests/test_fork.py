@@ -0,0 +1,93 @@
+from unittest import TestCase, skipUnless
+import tracemalloc
+
+try:
+    import resource
+except ImportError:  # not on Windows
+    resource = None
+
+from machine import Machine8080
+from memory import invaders_map
+from tests.test_dispatch import PROGRAM, load_program, machine_state
+
+
+class TestFork(TestCase):
+    compile_blocks = False
+
+    def setUp(self):
+        self.machine = Machine8080(compile_blocks=self.compile_blocks)
+        load_program(self.machine, PROGRAM)
+
+    def test_fork_continues_like_parent(self):
+        self.machine.run(cycles=200)
+        child, = self.machine.fork()
+        self.assertEqual(machine_state(child), machine_state(self.machine))
+        self.assertEqual(child.cycles, self.machine.cycles)
+        self.machine.run()
+        child.run()
+        self.assertEqual(machine_state(child), machine_state(self.machine))
+        self.assertEqual(child.cycles, self.machine.cycles)
+
+    def test_forks_are_independent(self):
+        first, second = self.machine.fork(2)
+        first.write_memory(0x2000, 0x11)
+        second.write_memory(0x2000, 0x22)
+        self.machine.write_memory(0x2000, 0x33)
+        self.assertEqual(first.read_byte(0x2000), 0x11)
+        self.assertEqual(second.read_byte(0x2000), 0x22)
+        self.assertEqual(self.machine.read_byte(0x2000), 0x33)
+        first._registers[first._registers.B] = 0x44
+        self.assertEqual(second._registers[second._registers.B], 0)
+
+    def test_self_modifying_code_in_fork(self):
+        load_program(self.machine, {0x0000: [0x3e, 0x2a,          # MVI A,2A
+                                             0x32, 0x06, 0x00,    # STA 0006
+                                             0x06, 0x00,          # MVI B,00
+                                             0x76]})              # HLT
+        child, = self.machine.fork()
+        child.run()
+        self.assertEqual(child._registers[child._registers.B], 0x2a)
+        self.assertEqual(self.machine._memory[0x0006], 0x00)
+
+    def test_fork_of_fork(self):
+        child, = self.machine.fork()
+        child.write_memory(0x3000, 0x55)
+        grandchild, = child.fork()
+        self.assertEqual(grandchild.read_byte(0x3000), 0x55)
+        grandchild.write_memory(0x3000, 0x66)
+        self.assertEqual(child.read_byte(0x3000), 0x55)
+
+    def test_fork_allocates_little(self):
+        self.machine.run(cycles=200)
+        tracemalloc.start()
+        self.addCleanup(tracemalloc.stop)
+        children = self.machine.fork(20)
+        allocated, _ = tracemalloc.get_traced_memory()
+        # registers, opcode table and so on; no decode tables or copy of memory
+        self.assertLess(allocated / len(children), 128 * 1024)
+
+    @skipUnless(resource, "needs the resource module")
+    def test_more_forks_than_file_descriptors(self):
+        soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+        resource.setrlimit(resource.RLIMIT_NOFILE, (64, hard))
+        self.addCleanup(resource.setrlimit, resource.RLIMIT_NOFILE, (soft, hard))
+        children = self.machine.fork(200)
+        children[0].write_memory(0x2000, 0x11)
+        children[-1].write_memory(0x2000, 0x22)
+        self.assertEqual(children[0].read_byte(0x2000), 0x11)
+        self.assertEqual(children[-1].read_byte(0x2000), 0x22)
+        self.assertEqual(children[100].read_byte(0x2000), 0x00)
+
+    def test_memory_map_and_snapshot(self):
+        machine = Machine8080(memory_map=invaders_map())
+        machine.load(b'\x76')
+        child, = machine.fork()
+        child.write_memory(0x0000, 0x00)
+        self.assertEqual(child.read_byte(0x0000), 0x76)
+        restored = Machine8080()
+        restored.restore(child.snapshot())
+        self.assertEqual(restored.read_byte(0x0000), 0x76)
+
+
+class TestForkCompiled(TestFork):
+    compile_blocks = True
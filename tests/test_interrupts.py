@@ -0,0 +1,145 @@
+from unittest import TestCase
+import logging
+
+from machine import Machine8080
+from cpu import Registers
+from tests.test_dispatch import load_program
+
+# main program waits in HLT; the RST 1 handler counts interrupts in C
+PROGRAM = {
+    0x0000: [0xc3, 0x40, 0x00],  # JMP 0040
+    0x0008: [0x0c,               # INR C
+             0xfb,               # EI
+             0xc9],              # RET
+    0x0040: [0x31, 0x00, 0x24,   # LXI SP, 2400
+             0xfb,               # EI
+             0x76,               # HLT
+             0x16, 0x01,         # MVI D, 01
+             0x76],              # HLT
+}
+
+
+class TestInterrupts(TestCase):
+    compile_blocks = False
+
+    def setUp(self):
+        logging.basicConfig(level=logging.WARNING)
+        self.machine = Machine8080(compile_blocks=self.compile_blocks)
+        load_program(self.machine, PROGRAM)
+
+    def test_disabled_at_reset(self):
+        load_program(self.machine, {0x0000: [0x04] * 10 + [0x76]})   # INR B ... HLT
+        self.machine.interrupt(1)
+        self.machine.run()
+        self.assertEqual(self.machine._registers[Registers.B], 10)
+        self.assertEqual(self.machine.interrupts_serviced, 0)
+
+    def test_wake_from_halt(self):
+        self.machine.run(cycles=100)
+        self.assertTrue(self.machine.halted)
+        self.assertEqual(self.machine._pc, 0x0045)
+
+        self.machine.interrupt(1)
+        self.machine.run(cycles=100)
+        self.assertEqual(self.machine._registers[Registers.C], 1)
+        self.assertEqual(self.machine._registers[Registers.D], 1)
+        self.assertTrue(self.machine.halted)
+        self.assertEqual(self.machine._pc, 0x0048)
+        self.assertEqual(self.machine.interrupts_serviced, 1)
+
+    def test_halted_with_interrupts_disabled_stays_halted(self):
+        load_program(self.machine, {0x0000: [0xf3, 0x76, 0x04]})      # DI, HLT, INR B
+        self.machine.run(cycles=50)
+        self.machine.interrupt(1)
+        self.machine.run(cycles=50)
+        self.assertTrue(self.machine.halted)
+        self.assertEqual(self.machine._registers[Registers.B], 0)
+
+    def test_instruction_after_ei_runs_first(self):
+        load_program(self.machine, {0x0000: [0x31, 0x00, 0x24,       # LXI SP, 2400
+                                             0xfb,                   # EI
+                                             0x04,                   # INR B
+                                             0x04,                   # INR B
+                                             0x76],                  # HLT
+                                    0x0010: [0x76]})                 # RST 2: HLT
+        self.machine.interrupt(2)
+        self.machine.run(cycles=1000)
+        self.assertEqual(self.machine._registers[Registers.B], 1)
+        self.assertEqual(self.machine._pc, 0x0011)
+        # return address is the second INR B
+        self.assertEqual(self.machine._memory[0x23fe:0x2400], bytes([0x05, 0x00]))
+
+    def test_latency(self):
+        load_program(self.machine, {0x0000: [0x31, 0x00, 0x24,       # LXI SP, 2400
+                                             0x00, 0x00,             # NOP, NOP
+                                             0xfb,                   # EI
+                                             0x00,                   # NOP
+                                             0x76],                  # HLT
+                                    0x0008: [0x76]})
+        self.machine.interrupt(1)
+        self.machine.run(cycles=1000)
+        # LXI, NOP, NOP, EI and the NOP after it run before the interrupt is taken
+        self.assertEqual(self.machine.interrupt_latency, 10 + 4 + 4 + 4 + 4)
+
+    def test_ei_after_ei(self):
+        load_program(self.machine, {0x0000: [0xfb,                   # EI
+                                             0xfb,                   # EI
+                                             0x00,                   # NOP
+                                             0xc3, 0x03, 0x00],      # JMP 0003
+                                    0x0008: [0x76]})                 # RST 1: HLT
+        self.machine.interrupt(1)
+        self.machine.run(cycles=100000)
+        self.assertEqual(self.machine.interrupts_serviced, 1)
+        # EI, EI and the NOP after the second EI run before the interrupt is taken
+        self.assertEqual(self.machine.interrupt_latency, 4 + 4 + 4)
+        self.assertEqual(self.machine._pc, 0x0009)
+
+    def test_interrupt_after_end_of_memory(self):
+        load_program(self.machine, {0x0000: [0x31, 0x00, 0x24,       # LXI SP, 2400
+                                             0xfb,                   # EI
+                                             0xc3, 0xff, 0xff],      # JMP FFFF
+                                    0x0008: [0x76],                  # RST 1: HLT
+                                    0xffff: [0x00]})                 # NOP
+        self.machine.run()
+        self.assertTrue(self.machine.halted)
+        self.machine.interrupt(1)
+        self.machine.run(cycles=100)
+        self.assertEqual(self.machine.interrupts_serviced, 1)
+        self.assertEqual(self.machine._pc, 0x0009)
+        # the PC wrapped to 0000 before it was pushed
+        self.assertEqual(self.machine._memory[0x23fe:0x2400], bytes([0x00, 0x00]))
+
+    def test_interrupt_raised_by_device(self):
+        load_program(self.machine, {0x0000: [0xc3, 0x40, 0x00],    # JMP 0040
+                                    0x0008: [0x76],                # RST 1: HLT
+                                    0x0040: [0x31, 0x00, 0x20,     # LXI SP, 2000
+                                             0xfb,                 # EI
+                                             0x00,                 # NOP
+                                             0xd3, 0x05,           # OUT 05
+                                             0x06, 0x01,           # MVI B, 01
+                                             0x0e, 0x02,           # MVI C, 02
+                                             0x16, 0x03,           # MVI D, 03
+                                             0x76]})               # HLT
+        self.machine.io.map(5, write=lambda port, val: self.machine.interrupt(1))
+        self.machine.run(cycles=20000)
+        # taken straight after the OUT, before the MVIs
+        self.assertEqual([self.machine._registers[r] for r in (Registers.B, Registers.C, Registers.D)],
+                         [0, 0, 0])
+        self.assertEqual(self.machine._memory[0x1ffe:0x2000], bytes([0x47, 0x00]))
+
+    def test_step_services_interrupts(self):
+        self.machine.step(4)        # JMP, LXI, EI, HLT
+        self.assertTrue(self.machine.halted)
+        self.assertEqual(self.machine.step(), 0)
+        self.machine.interrupt(1)
+        self.machine.step()         # INR C
+        self.assertFalse(self.machine.halted)
+        self.assertEqual(self.machine._registers[Registers.C], 1)
+
+    def test_invalid_vector(self):
+        with self.assertRaises(ValueError):
+            self.machine.interrupt(8)
+
+
+class TestInterruptsCompiled(TestInterrupts):
+    compile_blocks = True
@@ -0,0 +1,66 @@
+from unittest import TestCase
+import logging
+
+from machine import Machine8080
+from cpu import Registers
+from iobus import IOBus
+from tests.test_dispatch import load_program
+
+
+class TestIOBus(TestCase):
+    def setUp(self):
+        self.bus = IOBus()
+
+    def test_unmapped_ports_latch(self):
+        self.assertEqual(self.bus.read(7), 0)
+        self.bus.write(7, 0x5a)
+        self.assertEqual(self.bus.read(7), 0x5a)
+        self.assertEqual(self.bus.read(8), 0)
+
+    def test_mapped_handlers(self):
+        written = []
+        self.bus.map(3, read=lambda port: port + 0x10, write=lambda port, val: written.append((port, val)))
+        self.assertEqual(self.bus.read(3), 0x13)
+        self.bus.write(3, 0x99)
+        self.assertEqual(written, [(3, 0x99)])
+        # the latch is untouched by mapped ports
+        self.assertEqual(self.bus.latched[3], 0)
+
+    def test_map_one_side(self):
+        self.bus.map(4, read=lambda port: 0x44)
+        self.bus.write(4, 0x12)
+        self.assertEqual(self.bus.read(4), 0x44)
+        self.assertEqual(self.bus.latched[4], 0x12)
+
+    def test_unmap(self):
+        self.bus.map(5, read=lambda port: 0xff)
+        self.bus.unmap(5)
+        self.assertEqual(self.bus.read(5), 0)
+
+    def test_counts(self):
+        self.bus.read(1)
+        self.bus.read(1)
+        self.bus.write(2, 0)
+        self.assertEqual(self.bus.counts(), {1: (2, 0), 2: (0, 1)})
+        self.bus.reset_counts()
+        self.assertEqual(self.bus.counts(), {})
+
+
+class TestMachineIO(TestCase):
+    def setUp(self):
+        logging.basicConfig(level=logging.WARNING)
+
+    def test_in_and_out_go_through_the_bus(self):
+        for compile_blocks in (False, True):
+            machine = Machine8080(compile_blocks=compile_blocks)
+            load_program(machine, {0x0000: [0x3e, 0x21,     # MVI A, 21
+                                            0xd3, 0x06,     # OUT 06
+                                            0xdb, 0x01,     # IN 01
+                                            0x76]})         # HLT
+            written = []
+            machine.io.map(1, read=lambda port: 0x80)
+            machine.io.map(6, write=lambda port, val: written.append(val))
+            machine.run()
+            self.assertEqual(written, [0x21])
+            self.assertEqual(machine._registers[Registers.A], 0x80)
+            self.assertEqual(machine.io.counts(), {1: (1, 0), 6: (0, 1)})
@@ -0,0 +1,132 @@
+from unittest import TestCase
+import os
+import tempfile
+import zlib
+
+from loader import load_rom, load_rom_set, copy_rom, copy_hex, RomEntry, RomLoadException, INVADERS, MEMORY_SIZE
+from machine import Machine8080
+
+
+class TestLoader(TestCase):
+    def setUp(self):
+        fd, self.path = tempfile.mkstemp()
+        with os.fdopen(fd, "wb") as fp:
+            fp.write(bytes([0xc3, 0x00, 0x18]))
+
+    def tearDown(self):
+        os.remove(self.path)
+
+    def test_file(self):
+        memory = load_rom(self.path)
+        self.assertEqual(len(memory), MEMORY_SIZE)
+        self.assertEqual(memory[:4], bytes([0xc3, 0x00, 0x18, 0x00]))
+        self.assertEqual(memory[3:], bytes(MEMORY_SIZE - 3))
+
+    def test_bytes(self):
+        for image in (b'\x01\x02', bytearray(b'\x01\x02'), memoryview(b'\x00\x01\x02')[1:]):
+            memory = load_rom(image)
+            self.assertEqual(memory[:3], b'\x01\x02\x00')
+
+    def test_empty_file(self):
+        with open(self.path, "wb"):
+            pass
+        self.assertEqual(load_rom(self.path), bytes(MEMORY_SIZE))
+
+    def test_copy_at_address(self):
+        memory = bytearray(MEMORY_SIZE)
+        self.assertEqual(copy_rom(memory, self.path, 0x1800), 3)
+        self.assertEqual(memory[0x1800:0x1803], bytes([0xc3, 0x00, 0x18]))
+
+    def test_full_size_image(self):
+        memory = load_rom(bytes(range(256)) * 256)
+        self.assertEqual(memory[0xffff], 0xff)
+
+    def test_too_big(self):
+        with self.assertRaises(RomLoadException):
+            load_rom(bytes(MEMORY_SIZE + 1))
+        with self.assertRaises(RomLoadException):
+            copy_rom(bytearray(MEMORY_SIZE), self.path, 0xfffe)
+
+    def test_missing_file(self):
+        with self.assertRaises(RomLoadException):
+            load_rom(self.path + ".missing")
+
+    def test_machine_load(self):
+        machine = Machine8080()
+        machine.load(bytes([0x3e, 0x2a, 0x76]))     # MVI A,2A; HLT
+        machine.run()
+        self.assertEqual(machine._registers[machine._registers.A], 0x2a)
+
+
+def hex_record(kind, address, data):
+    record = bytes([len(data), address >> 8, address & 0xff, kind]) + bytes(data)
+    return ":{0}{1:02X}\n".format(record.hex().upper(), -sum(record) & 0xff)
+
+
+class TestRomSet(TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        for i, name in enumerate("hgfe"):
+            with open(os.path.join(self.directory, "invaders." + name), "wb") as fp:
+                fp.write(bytes([i + 1]) * 0x800)
+
+    def tearDown(self):
+        for name in os.listdir(self.directory):
+            os.remove(os.path.join(self.directory, name))
+        os.rmdir(self.directory)
+
+    def test_placement(self):
+        entries = [RomEntry(entry.source, entry.address) for entry in INVADERS]
+        memory = load_rom_set(entries, self.directory)
+        self.assertEqual(memory[:0x2000], b'\x01' * 0x800 + b'\x02' * 0x800 + b'\x03' * 0x800 + b'\x04' * 0x800)
+        self.assertEqual(memory[0x2000:], bytes(MEMORY_SIZE - 0x2000))
+
+    def test_checksum(self):
+        crc = zlib.crc32(b'\x01' * 0x800)
+        load_rom_set([("invaders.h", 0, crc)], self.directory)
+        with self.assertRaises(RomLoadException):
+            load_rom_set([("invaders.g", 0x800, crc)], self.directory)
+        with self.assertRaises(RomLoadException):
+            load_rom_set(INVADERS, self.directory)
+
+    def test_bytes_entries(self):
+        memory = load_rom([RomEntry(b'\xaa', 0x10), RomEntry(b'\xbb\xcc', 0x2000)])
+        self.assertEqual(memory[0x10], 0xaa)
+        self.assertEqual(memory[0x2000:0x2002], b'\xbb\xcc')
+
+    def test_hex_file(self):
+        path = os.path.join(self.directory, "program.hex")
+        with open(path, "w") as fp:
+            fp.write(hex_record(0x00, 0x0000, [0x3e, 0x2a, 0x76]))
+            fp.write(hex_record(0x00, 0x0100, [0x01, 0x02]))
+            fp.write(hex_record(0x01, 0x0000, []))
+            fp.write(hex_record(0x00, 0x0200, [0xff]))     # after end of file
+        memory = bytearray(MEMORY_SIZE)
+        self.assertEqual(copy_rom(memory, path, 0x1000), 5)
+        self.assertEqual(memory[0x1000:0x1003], b'\x3e\x2a\x76')
+        self.assertEqual(memory[0x1100:0x1102], b'\x01\x02')
+        self.assertEqual(memory[0x1200], 0)
+        machine = Machine8080()
+        machine.load(path)
+        machine.run()
+        self.assertEqual(machine._registers[machine._registers.A], 0x2a)
+
+    def test_hex_stream(self):
+        lines = [hex_record(0x02, 0, [0x01, 0x00]),         # segment 0100: base 1000
+                 hex_record(0x00, 0x0020, [0x55]),
+                 hex_record(0x04, 0, [0x00, 0x00]),
+                 hex_record(0x00, 0x0030, [0x66])]
+        memory = bytearray(MEMORY_SIZE)
+        copy_hex(memory, iter(lines))
+        self.assertEqual(memory[0x1020], 0x55)
+        self.assertEqual(memory[0x0030], 0x66)
+
+    def test_bad_hex(self):
+        good = hex_record(0x00, 0, [0x01])
+        for lines in ([good[:-3] + "00\n"],                  # checksum
+                      ["0100000001FE\n"],                    # no colon
+                      [":0200000001FD\n"],                   # too short
+                      [":zz\n"],
+                      [hex_record(0x04, 0, [0x00, 0x01]), good]):   # above 64 KB
+            with self.assertRaises(RomLoadException):
+                copy_hex(bytearray(MEMORY_SIZE), lines)
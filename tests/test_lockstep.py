@@ -0,0 +1,102 @@
+from unittest import TestCase
+
+from machine import Machine8080
+from lockstep import Lockstep, Divergence, Difference, compare, differences, disassemble_at
+from tests.test_dispatch import PROGRAM, load_program
+
+# counts B down from 200 forever, storing it at 3000 each time round
+LOOP = {0x0000: [0x31, 0x00, 0x24,    # LXI SP,2400
+                 0x21, 0x00, 0x30,    # LXI H,3000
+                 0x06, 0xc8,          # MVI B,C8
+                 0x78,                # MOV A,B
+                 0x77,                # MOV M,A
+                 0x05,                # DCR B
+                 0xc2, 0x08, 0x00,    # JNZ 0008
+                 0xc3, 0x06, 0x00]}   # JMP 0006
+
+
+class Bug:
+    """Wraps one opcode's handler so that it does something wrong whenever
+    B holds a given value after it runs.  The trigger depends only on the
+    machine's state, so the bug recurs when the lockstep runner replays.
+    """
+    def __init__(self, opcode, b, effect):
+        self.opcode = opcode
+        self.b = b
+        self.effect = effect
+
+    def wrap(self, machine, op):
+        if op.opcode != self.opcode:
+            return op.handler
+        handler = op.handler
+
+        def buggy(opcode, operands=()):
+            handler(opcode, operands)
+            if machine._registers[0] == self.b:
+                self.effect(machine)
+        return buggy
+
+
+class TestLockstep(TestCase):
+    def machines(self, program, bug=None):
+        reference = Machine8080()
+        candidate = Machine8080(compile_blocks=True, profiler=bug)
+        for machine in (reference, candidate):
+            load_program(machine, program)
+        return reference, candidate
+
+    def test_engines_agree(self):
+        for program in (PROGRAM, LOOP):
+            lockstep = Lockstep(*self.machines(program), interval=500, memory=True)
+            self.assertIsNone(lockstep.run(50000))
+            self.assertGreater(lockstep.checks, 0)
+
+    def test_finds_diverging_instruction(self):
+        def set_carry(machine):
+            machine._flags.flags |= 1
+        reference, candidate = self.machines(LOOP, Bug(0x05, 50, set_carry))
+        divergence = Lockstep(reference, candidate, interval=5000).run(100000)
+        self.assertIsInstance(divergence, Divergence)
+        self.assertEqual(divergence.pc, 0x000a)
+        self.assertEqual(divergence.instruction, "DCR B")
+        self.assertEqual(divergence.differences, [Difference("flags", reference._flags.flags,
+                                                             reference._flags.flags | 1)])
+        # both machines are left just after the instruction
+        self.assertEqual(reference._pc, 0x000b)
+        self.assertEqual(reference.cycles, divergence.cycle + 5)
+        self.assertEqual(reference._registers[0], 200 - 150)
+
+    def test_register_difference(self):
+        def clobber_c(machine):
+            machine._registers[1] ^= 0x80
+        divergence = Lockstep(*self.machines(LOOP, Bug(0x78, 197, clobber_c)), interval=1000).run(10000)
+        self.assertEqual((divergence.pc, divergence.instruction), (0x0008, "MOV A,B"))
+        self.assertEqual(divergence.differences, [Difference("C", 0, 0x80)])
+
+    def test_memory(self):
+        def stray_write(machine):
+            machine.write_byte(0x3100, 0xff)
+        bug = Bug(0x77, 160, stray_write)
+        self.assertIsNone(Lockstep(*self.machines(LOOP, bug), interval=1000).run(20000))
+        divergence = Lockstep(*self.machines(LOOP, bug), interval=1000, memory=True).run(20000)
+        self.assertEqual(divergence.instruction, "MOV M,A")
+        self.assertEqual(divergence.differences, [Difference("memory[3100]", 0, 0xff)])
+
+    def test_halt(self):
+        reference, candidate = self.machines({0x0000: [0x76]})
+        lockstep = Lockstep(reference, candidate, interval=10)
+        self.assertIsNone(lockstep.run(1000000))
+        self.assertEqual(lockstep.checks, 1)
+
+    def test_differences(self):
+        reference, candidate = self.machines(PROGRAM)
+        self.assertEqual(differences(reference, candidate), [])
+        candidate._sp = 0x1234
+        self.assertEqual(differences(reference, candidate), [Difference("sp", 0, 0x1234)])
+        self.assertEqual(disassemble_at(reference, 0x0000), disassemble_at(candidate, 0x0000))
+
+    def test_compare(self):
+        rom = bytearray(0x10000)
+        for address, code in LOOP.items():
+            rom[address:address + len(code)] = bytes(code)
+        self.assertIsNone(compare(rom, cycles=20000, interval=700))
@@ -19,6 +19,36 @@ class TestMachine8080(TestCase):
             self.machine.read_memory(0xfff0, 100)
         membytes = self.machine.read_memory(0, 4)
         self.assertEqual(membytes, [0x00, 0x00, 0x00, 0xc3])
+        self.machine._memory[0xffff] = 0x5a
+        self.assertEqual(self.machine.read_memory(0xffff, 1), [0x5a])
+        self.assertEqual(self.machine.read_memory(0xfff0, 16)[-1], 0x5a)
+        with self.assertRaises(OutOfMemoryException):
+            self.machine.read_memory(0xffff, 2)
+
+    def test_byte_and_word_access(self):
+        self.machine.write_byte(0x1234, 0xab)
+        self.assertEqual(self.machine.read_byte(0x1234), 0xab)
+        self.assertEqual(self.machine.read_byte(0x11234), 0xab)
+        self.machine.write_word(0x2000, 0xbeef)
+        self.assertEqual(self.machine.read_memory(0x2000, 2), [0xef, 0xbe])
+        self.assertEqual(self.machine.read_word(0x2000), 0xbeef)
+        # the high byte of a word at FFFF is at 0000
+        self.machine.write_word(0xffff, 0x1122)
+        self.assertEqual(self.machine.read_byte(0xffff), 0x22)
+        self.assertEqual(self.machine.read_byte(0x0000), 0x11)
+        self.assertEqual(self.machine.read_word(0xffff), 0x1122)
+
+    def test_stack_wraps(self):
+        self.machine._sp = 0x0000
+        self.machine._pc = 0x1234
+        self.machine.call(0xcd, [0x00, 0x30])
+        self.assertEqual(self.machine._sp, 0xfffe)
+        self.assertEqual(self.machine.read_word(0xfffe), 0x1234)
+        self.machine._sp = 0xffff
+        self.machine.write_word(0xffff, 0x4567)
+        self.machine.ret(0xc9)
+        self.assertEqual(self.machine._pc, 0x4567)
+        self.assertEqual(self.machine._sp, 0x0001)
 
     def test_mov(self):
         self.machine._registers[Registers.A] = 0x10
@@ -665,7 +695,7 @@ class TestMachine8080(TestCase):
         self.machine.sbb(0x99)  # 
         self._test_flag(Flags.CARRY, "Carry", 0)
         self._test_flag(Flags.AUX_CARRY, "Aux Carry", 1)
-        self.assertEqual(self.machine._registers[Registers.A], 0x0f)
+        self.assertEqual(self.machine._registers[Registers.A], 0x0d)
 
         self._clear_flags()
         self.machine._registers[Registers.A] = 0x59 # 0101 1001 (89)
@@ -700,7 +730,7 @@ class TestMachine8080(TestCase):
         self.machine.sbi(0xde, [0x4b])  # 
         self._test_flag(Flags.CARRY, "Carry", 0)
         self._test_flag(Flags.AUX_CARRY, "Aux Carry", 1)
-        self.assertEqual(self.machine._registers[Registers.A], 0x0f)
+        self.assertEqual(self.machine._registers[Registers.A], 0x0d)
 
         self._clear_flags()
         self.machine._registers[Registers.A] = 0x59 # 0101 1001 (89)
@@ -717,6 +747,21 @@ class TestMachine8080(TestCase):
         self._test_flag(Flags.ZERO, "Zero", 1)
         self._test_flag(Flags.PARITY, "Parity", 1)
 
+    def test_subtract_borrow_stays_a_byte(self):
+        # with the carry set, SBI/SBB subtract the operand and the borrow: 0x80 - 0x00 - 1
+        self._clear_flags()
+        self.machine._flags[Flags.CARRY] = 1
+        self.machine._registers[Registers.A] = 0x80
+        self.machine.sbi(0xde, [0x00])
+        self.assertEqual(self.machine._registers[Registers.A], 0x7f)
+
+        self._clear_flags()
+        self.machine._flags[Flags.CARRY] = 1
+        self.machine._registers[Registers.A] = 0x80
+        self.machine._registers[Registers.B] = 0x00
+        self.machine.sbb(0x98)
+        self.assertEqual(self.machine._registers[Registers.A], 0x7f)
+
     def test_sui(self):
         """
         Contents of immediate value is subtracted from A.
@@ -1190,3 +1235,11 @@ class TestMachine8080(TestCase):
         self._test_flag(Flags.AUX_CARRY, "Aux Carry", 1)
         self._test_flag(Flags.ZERO, "Zero", 1)
 
+
+class TestMachine8080CheckedRegisters(TestMachine8080):
+    """Runs every instruction test again with every register access validated.
+    """
+    def setUp(self):
+        self.machine = Machine8080(checked_registers=True)
+        self.machine.load("rom")
+        logging.basicConfig(level=logging.WARNING)
@@ -0,0 +1,121 @@
+from unittest import TestCase
+
+from machine import Machine8080
+from memory import MemoryMap, invaders_map, MAPPED_PAGE
+from tests.test_dispatch import load_program
+
+
+class TestMemoryMap(TestCase):
+    def setUp(self):
+        self.machine = Machine8080(memory_map=invaders_map())
+        self.machine.load(bytes([0x3e, 0x2a,           # MVI A, 2A
+                                 0x32, 0x00, 0x00,     # STA 0000
+                                 0x32, 0x00, 0x20,     # STA 2000
+                                 0x76]))               # HLT
+
+    def test_rom_ignores_writes(self):
+        self.machine.write_memory(0x0000, 0xff)
+        self.machine.write_memory(0x1fff, 0xff)
+        self.assertEqual(self.machine._memory[0x0000], 0x3e)
+        self.assertEqual(self.machine._memory[0x1fff], 0x00)
+        self.machine.run()
+        self.assertEqual(self.machine._memory[0x0000], 0x3e)
+        self.assertEqual(self.machine._memory[0x2000], 0x2a)
+
+    def test_mirror(self):
+        self.machine.write_memory(0x2001, 0x11)
+        self.assertEqual(self.machine.read_memory(0x4001, 1), [0x11])
+        self.machine.write_memory(0x5fff, 0x22)
+        self.assertEqual(self.machine.read_memory(0x3fff, 1), [0x22])
+
+    def test_mirror_synced_on_load(self):
+        self.machine.load(bytes(0x2400) + b'\x99')
+        self.assertEqual(self.machine._memory[0x4400], 0x99)
+
+    def test_mirror_of_rom(self):
+        memory_map = MemoryMap()
+        memory_map.rom(0x0000, 0x0100)
+        memory_map.mirror(0x8000, 0x0100, 0x0000)
+        machine = Machine8080(memory_map=memory_map)
+        machine.load(b'\x01\x02')
+        self.assertEqual(machine._memory[0x8001], 0x02)
+        machine.write_memory(0x8001, 0xff)
+        self.assertEqual(machine._memory[0x8001], 0x02)
+
+    def test_chained_mirrors(self):
+        memory_map = MemoryMap()
+        memory_map.mirror(0x4000, 0x0100, 0x2000)
+        memory_map.mirror(0x6000, 0x0100, 0x4000)
+        machine = Machine8080(memory_map=memory_map)
+        load_program(machine, {})
+        machine.write_memory(0x6010, 0x33)
+        self.assertEqual(machine._memory[0x2010], 0x33)
+        self.assertEqual(machine.read_byte(0x4010), 0x33)
+        machine.write_memory(0x2011, 0x44)
+        self.assertEqual(machine.read_byte(0x6011), 0x44)
+
+    def test_device(self):
+        written = []
+        memory_map = MemoryMap()
+        memory_map.device(0x8000, 0x0100, read=lambda address: address & 0xff, write=lambda a, v: written.append((a, v)))
+        machine = Machine8080(memory_map=memory_map)
+        load_program(machine, {})
+        machine.write_memory(0x8005, 0x77)
+        self.assertEqual(written, [(0x8005, 0x77)])
+        self.assertEqual(machine._memory[0x8005], 0)
+        self.assertEqual(machine.read_memory(0x80fe, 2), [0xfe, 0xff])
+        self.assertEqual(machine.read_memory(0x7fff, 2), [0x00, 0x00])
+
+    def test_read_across_device(self):
+        memory_map = MemoryMap()
+        memory_map.device(0x8100, 0x0100, read=lambda address: 0x42)
+        machine = Machine8080(memory_map=memory_map)
+        load_program(machine, {})
+        self.assertEqual(machine.read_memory(0x80ff, 0x0300)[1:3], [0x42, 0x42])
+
+    def test_mirror_of_device(self):
+        written = []
+        memory_map = MemoryMap()
+        memory_map.device(0x6000, 0x0100, read=lambda address: 0x42, write=lambda a, v: written.append((a, v)))
+        memory_map.mirror(0x7000, 0x0100, 0x6000)
+        machine = Machine8080(memory_map=memory_map)
+        load_program(machine, {})
+        self.assertEqual(machine.read_byte(0x7000), 0x42)
+        machine.write_memory(0x7005, 0x77)
+        self.assertEqual(written, [(0x6005, 0x77)])
+
+    def test_mirror_declared_before_rom(self):
+        memory_map = MemoryMap()
+        memory_map.mirror(0x8000, 0x0100, 0x0000)
+        memory_map.rom(0x0000, 0x0100)
+        machine = Machine8080(memory_map=memory_map)
+        machine.load(b'\x01\x02')
+        self.assertEqual(machine._memory[0x8001], 0x02)
+        machine.write_memory(0x8001, 0xff)
+        self.assertEqual(machine._memory[0x0001], 0x02)
+        self.assertEqual(machine._memory[0x8001], 0x02)
+
+    def test_mirror_loop(self):
+        memory_map = MemoryMap()
+        memory_map.mirror(0x4000, 0x0100, 0x2000)
+        with self.assertRaises(ValueError):
+            memory_map.mirror(0x2000, 0x0100, 0x4000)
+        self.assertEqual(len(memory_map.regions), 1)
+
+    def test_ram_is_unflagged(self):
+        self.assertEqual(self.machine._page_flags[0x60] & MAPPED_PAGE, 0)
+        self.assertEqual(self.machine._page_flags[0x00] & MAPPED_PAGE, MAPPED_PAGE)
+        # the mirror's target stays on the direct path; only the mirror is mapped
+        self.assertEqual(self.machine._page_flags[0x20] & MAPPED_PAGE, 0)
+        self.assertEqual(self.machine._page_flags[0x40] & MAPPED_PAGE, MAPPED_PAGE)
+
+    def test_remap(self):
+        self.machine.map_memory(MemoryMap())
+        self.machine.write_memory(0x0000, 0xff)
+        self.assertEqual(self.machine._memory[0x0000], 0xff)
+
+    def test_bad_region(self):
+        with self.assertRaises(ValueError):
+            MemoryMap().rom(0x0010, 0x0100)
+        with self.assertRaises(ValueError):
+            MemoryMap().mirror(0xff00, 0x0100, 0xff80)
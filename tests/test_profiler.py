@@ -0,0 +1,226 @@
+from unittest import TestCase
+import io
+
+from machine import Machine8080
+from profiler import (OpcodeProfiler, OpcodeStats, GuestProfiler, HotSpot, RoutineStats,
+                      _bucket, _bucket_value, HISTOGRAM_BUCKETS)
+from tracing import Tracer
+from tests.test_dispatch import PROGRAM, load_program, machine_state
+
+
+class TestHistogram(TestCase):
+    def test_buckets_are_ordered(self):
+        buckets = [_bucket(ns) for ns in range(5000)]
+        self.assertEqual(buckets, sorted(buckets))
+        self.assertLess(_bucket((1 << 41) - 1), HISTOGRAM_BUCKETS)
+        self.assertEqual(_bucket(1 << 50), HISTOGRAM_BUCKETS - 1)
+
+    def test_bucket_value_is_close(self):
+        for ns in (0, 3, 7, 100, 1000, 12345, 10 ** 9):
+            self.assertLessEqual(abs(_bucket_value(_bucket(ns)) - ns), ns * 0.125)
+
+
+class TestOpcodeProfiler(TestCase):
+    compile_blocks = False
+
+    def setUp(self):
+        self.profiler = OpcodeProfiler()
+        self.machine = Machine8080(compile_blocks=self.compile_blocks, profiler=self.profiler)
+        load_program(self.machine, {0x0000: [0x3e, 0x2a,          # MVI A,2A
+                                             0x06, 0x01,          # MVI B,01
+                                             0x80,                # ADD B
+                                             0x80,                # ADD B
+                                             0xc3, 0x0a, 0x00,    # JMP 000A
+                                             0x00,
+                                             0x76]})              # HLT
+
+    def test_counts(self):
+        self.machine.run()
+        counts = self.profiler.counts
+        self.assertEqual(counts[0x3e], 1)
+        self.assertEqual(counts[0x80], 2)
+        self.assertEqual(counts[0xc3], 1)
+        self.assertEqual(counts[0x76], 1)   # HLT counts though it raises
+        self.assertEqual(sum(counts), 6)
+        self.assertEqual(sum(self.profiler.histogram), 6)
+
+    def test_stats(self):
+        self.machine.run()
+        stats = self.profiler.stats()
+        self.assertEqual({s.opcode for s in stats}, {0x3e, 0x06, 0x80, 0xc3, 0x76})
+        self.assertIsInstance(stats[0], OpcodeStats)
+        self.assertEqual([s.total_ns for s in stats], sorted((s.total_ns for s in stats), reverse=True))
+        self.assertAlmostEqual(sum(s.share for s in stats), 1.0)
+        add = next(s for s in stats if s.opcode == 0x80)
+        self.assertEqual(add.mnemonic, "ADD B")
+        self.assertEqual(add.count, 2)
+        self.assertLessEqual(add.p50_ns, add.p99_ns)
+        self.assertIn("ADD B", self.profiler.report())
+        self.assertEqual(len(self.profiler.report(limit=2).splitlines()), 3)
+
+    def test_reset(self):
+        self.machine.run()
+        self.profiler.reset()
+        self.assertEqual(self.profiler.stats(), [])
+        self.assertEqual(self.profiler.percentile(0x80, 0.5), 0)
+        load_program(self.machine, PROGRAM)
+        self.machine._halted = False
+        self.machine.run()
+        self.assertGreater(sum(self.profiler.counts), 0)
+
+    def test_same_results_as_unprofiled(self):
+        load_program(self.machine, PROGRAM)
+        self.machine.run()
+        reference = Machine8080(compile_blocks=self.compile_blocks)
+        load_program(reference, PROGRAM)
+        reference.run()
+        self.assertEqual(machine_state(self.machine), machine_state(reference))
+        self.assertEqual(self.machine.cycles, reference.cycles)
+
+    def test_unprofiled_machine_has_plain_handlers(self):
+        machine = Machine8080(compile_blocks=self.compile_blocks)
+        self.assertEqual(machine.opcodes[0x80].handler, machine.add)
+        self.assertFalse(any(machine._instrumented))
+
+
+class TestOpcodeProfilerCompiled(TestOpcodeProfiler):
+    compile_blocks = True
+
+
+CALLS = {0x0000: [0x31, 0x00, 0x24,    # LXI SP,2400
+                  0xcd, 0x10, 0x00,    # CALL 0010
+                  0xcd, 0x10, 0x00,    # CALL 0010
+                  0x76],               # HLT
+         0x0010: [0xcd, 0x20, 0x00,    # CALL 0020
+                  0xc9],               # RET
+         0x0020: [0x06, 0x03,          # MVI B,03
+                  0x05,                # DCR B
+                  0xc2, 0x22, 0x00,    # JNZ 0022
+                  0xc9]}               # RET
+
+
+class TestGuestProfiler(TestCase):
+    compile_blocks = False
+
+    def machine(self, program, profiler):
+        machine = Machine8080(compile_blocks=self.compile_blocks, profiler=profiler)
+        load_program(machine, program)
+        return machine
+
+    def test_pc_counts(self):
+        profiler = GuestProfiler()
+        self.machine(CALLS, profiler).run()
+        self.assertEqual(profiler.pc_counts[0x0022], 6)
+        self.assertEqual(profiler.pc_counts[0x0020], 2)
+        self.assertEqual(profiler.pc_counts[0x0009], 1)
+        self.assertEqual(sum(profiler.pc_counts), 4 + 2 * 2 + 2 * 8)
+        spots = profiler.hot_spots(limit=2)
+        self.assertIsInstance(spots[0], HotSpot)
+        self.assertEqual([(s.address, s.count) for s in spots], [(0x0022, 6), (0x0023, 6)])
+
+    def test_call_stacks(self):
+        profiler = GuestProfiler(symbols={0x0020: "delay"})
+        machine = self.machine(CALLS, profiler)
+        machine.run()
+        self.assertEqual(profiler.calls[0x0010], 2)
+        self.assertEqual(profiler.calls[0x0020], 2)
+        self.assertEqual(profiler.collapsed(), ["start 51", "start;0010 54", "start;0010;delay 124"])
+        self.assertEqual(sum(profiler.stacks.values()), machine.cycles)
+
+        routines = {r.address: r for r in profiler.routines()}
+        self.assertEqual(routines[0x0010].inclusive, 54 + 124)
+        self.assertEqual(routines[0x0010].exclusive, 54)
+        self.assertEqual(routines[0x0020], RoutineStats(0x0020, "delay", 2, 124, 124, 124 / machine.cycles))
+        self.assertIn("delay", profiler.report())
+
+        out = io.StringIO()
+        profiler.write_collapsed(out)
+        self.assertEqual(out.getvalue(), "start 51\nstart;0010 54\nstart;0010;delay 124\n")
+
+    def test_ret_as_jump_is_ignored(self):
+        profiler = GuestProfiler()
+        self.machine({0x0000: [0x31, 0x00, 0x24,    # LXI SP,2400
+                               0xcd, 0x10, 0x00,    # CALL 0010
+                               0x76],               # HLT
+                      0x0010: [0x21, 0x20, 0x00,    # LXI H,0020
+                               0xe5,                # PUSH H
+                               0xc9],               # RET (to 0020)
+                      0x0020: [0xc9]}, profiler).run()
+        self.assertEqual(sorted(profiler.stacks), [(), (0x0010,)])
+        self.assertEqual(profiler._stack, ())
+
+    def test_abandoned_frames_are_dropped(self):
+        profiler = GuestProfiler()
+        # a main loop that resets SP and calls a routine that never returns
+        self.machine({0x0000: [0x31, 0x00, 0x24,    # LXI SP,2400
+                               0xcd, 0x10, 0x00],   # CALL 0010
+                      0x0010: [0xc3, 0x00, 0x00]},  # JMP 0000
+                     profiler).run(cycles=1000)
+        self.assertEqual(len(profiler._stack), 1)
+        self.assertEqual(sorted(profiler.stacks), [(), (0x0010,)])
+
+    def test_interrupts(self):
+        tracer = Tracer()
+        profiler = GuestProfiler()
+        machine = Machine8080(compile_blocks=self.compile_blocks, profiler=profiler, tracer=tracer)
+        load_program(machine, {0x0000: [0x31, 0x00, 0x24,    # LXI SP,2400
+                                        0xfb,                # EI
+                                        0xc3, 0x04, 0x00],   # JMP 0004
+                               0x0008: [0xc9]})              # RET
+        machine.run(cycles=100)
+        machine.interrupt(1)
+        machine.run(cycles=100)
+        self.assertEqual(profiler.calls[0x0008], 1)
+        self.assertEqual(profiler.pc_counts[0x0007], 0)
+        self.assertEqual(profiler.pc_counts[0x0008], 1)
+        self.assertEqual(profiler._stack, ())
+        self.assertIn((0x0008,), profiler.stacks)
+        rst = next(r for r in tracer.records if r.opcode == 0xcf)
+        self.assertEqual((rst.pc, rst.operands), (0x0004, ()))
+
+    def test_sampling(self):
+        profiler = GuestProfiler(sample_interval=50)
+        machine = self.machine(CALLS, profiler)
+        self.assertEqual(machine.opcodes[0x05].handler, machine.dcr)
+        self.assertFalse(machine._instrumented[0x05])
+        self.assertTrue(machine._instrumented[0xcd])
+        machine.run()
+        self.assertEqual(sum(profiler.pc_counts), machine.cycles // 50)
+        self.assertEqual(sum(profiler.stacks.values()), machine.cycles // 50)
+        self.assertEqual(profiler.calls[0x0020], 2)
+        profiler.stop()
+        self.assertIsNone(profiler._event)
+
+    def test_sampling_after_end_of_memory(self):
+        profiler = GuestProfiler(sample_interval=10)
+        machine = self.machine({0x0000: [0x31, 0x00, 0x24,   # LXI SP,2400
+                                         0xfb,               # EI
+                                         0xc3, 0xff, 0xff],  # JMP FFFF
+                                0x0008: [0x76],              # HLT
+                                0xffff: [0x00]}, profiler)   # NOP
+        # the sampling event keeps a halted machine idling, so run for a budget
+        machine.run(cycles=100)
+        machine.interrupt(1)
+        machine.run(cycles=100)
+        self.assertEqual(machine.interrupts_serviced, 1)
+        # samples taken while it idled past the end count at 0000
+        self.assertGreater(profiler.pc_counts[0x0000], 0)
+
+    def test_reset(self):
+        profiler = GuestProfiler()
+        machine = self.machine(CALLS, profiler)
+        machine.run(cycles=40)
+        profiler.reset()
+        machine.run()
+        self.assertEqual(profiler.calls[0x0010], 1)
+        self.assertEqual(sum(r.exclusive for r in profiler.routines()) + profiler.stacks[()], machine.cycles - 44)
+
+    def test_with_opcode_profiler(self):
+        opcodes = OpcodeProfiler()
+        guest = GuestProfiler()
+        self.machine(CALLS, [opcodes, guest]).run()
+        self.assertEqual(sum(opcodes.counts), sum(guest.pc_counts))
+
+
+class TestGuestProfilerCompiled(TestGuestProfiler):
+    compile_blocks = True
@@ -1,6 +1,6 @@
 from unittest import TestCase
 
-from cpu import Registers, InvalidPairException
+from cpu import Registers, CheckedRegisters, InvalidPairException
 
 
 class TestRegisters(TestCase):
@@ -34,4 +34,33 @@ class TestRegisters(TestCase):
             expected_src = expected_registers[i][0]
             expected_dst = expected_registers[i][1]
             self.assertTrue(Registers.get_register_from_opcode(code, 3) == expected_src)
-            self.assertTrue(Registers.get_register_from_opcode(code, 0) == expected_dst)
\ No newline at end of file
+            self.assertTrue(Registers.get_register_from_opcode(code, 0) == expected_dst)
+
+    def test_pairs(self):
+        self.reg.set_pair(Registers.D, 0x1234)
+        self.assertEqual(self.reg[Registers.D], 0x12)
+        self.assertEqual(self.reg[Registers.E], 0x34)
+        self.assertEqual(self.reg.get_pair(Registers.D), 0x1234)
+        self.reg.set_pair(Registers.H, 0x1ffff)
+        self.assertEqual(self.reg.get_pair(Registers.H), 0xffff)
+
+
+class TestCheckedRegisters(TestRegisters):
+    def setUp(self):
+        self.reg = CheckedRegisters()
+
+    def test_invalid_register(self):
+        with self.assertRaises(IndexError):
+            self.reg[Registers.M]
+        with self.assertRaises(IndexError):
+            self.reg[8] = 0
+        with self.assertRaises(TypeError):
+            self.reg["A"]
+        with self.assertRaises(ValueError):
+            self.reg[Registers.A] = 0x100
+
+    def test_invalid_pair(self):
+        with self.assertRaises(InvalidPairException):
+            self.reg.get_pair(Registers.C)
+        with self.assertRaises(InvalidPairException):
+            self.reg.set_pair(Registers.A, 0)
@@ -0,0 +1,92 @@
+from unittest import TestCase
+
+from machine import Machine8080
+from rewind import Rewind
+from tests.test_dispatch import load_program, machine_state
+
+# counts through the bytes of page 20 forever, B counting iterations
+COUNTER = {0x0000: [0x21, 0x00, 0x20,   # LXI H, 2000
+                    0x34,               # INR M
+                    0x2c,               # INR L
+                    0x04,               # INR B
+                    0xc3, 0x03, 0x00]}  # JMP 0003
+
+
+class TestRewind(TestCase):
+    compile_blocks = False
+
+    def setUp(self):
+        self.machine = Machine8080(compile_blocks=self.compile_blocks)
+        load_program(self.machine, COUNTER)
+        self.rewind = Rewind(self.machine, interval=1000, keyframe_interval=4)
+        self.rewind.start()
+
+    def reference(self, cycles):
+        machine = Machine8080()
+        load_program(machine, COUNTER)
+        machine.run(cycles=cycles)
+        return machine
+
+    def test_captures_every_interval(self):
+        self.machine.run(cycles=10000)
+        self.assertEqual(len(self.rewind), 11)
+        self.assertEqual(self.rewind.oldest, 0)
+
+    def test_rewind_to_cycle(self):
+        self.machine.run(cycles=20000)
+        for cycle in (0, 1000, 4321, 7999, 15000):
+            self.rewind.rewind_to(cycle)
+            reference = self.reference(cycle)
+            self.assertEqual(self.machine.cycles, reference.cycles)
+            self.assertEqual(machine_state(self.machine), machine_state(reference))
+            self.machine.run(cycles=20000 - self.machine.cycles)
+
+    def test_step_back(self):
+        self.machine.run(cycles=10000)
+        states = []
+        for count in range(3):
+            cycle = self.rewind.step_back()
+            states.append((cycle, machine_state(self.machine)))
+        self.assertEqual([cycle for cycle, _ in states], [9000, 8000, 7000])
+        for cycle, state in states:
+            self.assertEqual(state, machine_state(self.reference(cycle)))
+        with self.assertRaises(IndexError):
+            self.rewind.step_back(len(self.rewind))
+
+    def test_recording_continues_after_rewind(self):
+        self.machine.run(cycles=10000)
+        self.rewind.rewind_to(5000)
+        self.assertEqual(len(self.rewind), 6)
+        self.machine.run(cycles=5000)
+        self.assertEqual(len(self.rewind), 11)
+        self.rewind.rewind_to(8000)
+        self.assertEqual(machine_state(self.machine), machine_state(self.reference(8000)))
+
+    def test_deltas_are_small(self):
+        self.machine.run(cycles=4000)
+        keyframe, delta = self.rewind._captures[0], self.rewind._captures[1]
+        self.assertTrue(keyframe.keyframe)
+        self.assertFalse(delta.keyframe)
+        self.assertLess(len(delta.data), len(keyframe.data))
+
+    def test_memory_stays_bounded(self):
+        self.rewind.budget = 4000
+        self.machine.run(cycles=200000)
+        self.assertLessEqual(self.rewind.size, self.rewind.budget)
+        self.assertGreater(self.rewind.oldest, 0)
+        self.assertTrue(self.rewind._captures[0].keyframe)
+        with self.assertRaises(IndexError):
+            self.rewind.rewind_to(0)
+        cycle = self.rewind.oldest + 10
+        self.rewind.rewind_to(cycle)
+        self.assertEqual(machine_state(self.machine), machine_state(self.reference(cycle)))
+
+    def test_stop(self):
+        self.machine.run(cycles=2000)
+        self.rewind.stop()
+        self.machine.run(cycles=5000)
+        self.assertEqual(len(self.rewind), 3)
+
+
+class TestRewindCompiled(TestRewind):
+    compile_blocks = True
@@ -0,0 +1,112 @@
+from unittest import TestCase
+import logging
+
+from machine import Machine8080
+from cpu import Registers
+from scheduler import Scheduler, NEVER
+from tests.test_dispatch import load_program
+from tests.test_interrupts import PROGRAM
+
+
+class TestScheduler(TestCase):
+    def setUp(self):
+        self.scheduler = Scheduler()
+        self.fired = []
+
+    def record(self, name):
+        return lambda cycle: self.fired.append((name, cycle))
+
+    def test_events_fire_in_cycle_order(self):
+        self.scheduler.schedule(300, self.record("c"))
+        self.scheduler.schedule(100, self.record("a"))
+        self.scheduler.schedule(200, self.record("b"))
+        self.scheduler.schedule(100, self.record("a2"))
+        self.assertEqual(self.scheduler.next_deadline, 100)
+        self.assertEqual(self.scheduler.run_due(250), 3)
+        self.assertEqual(self.fired, [("a", 100), ("a2", 100), ("b", 200)])
+        self.assertEqual(self.scheduler.next_deadline, 300)
+
+    def test_cancel(self):
+        event = self.scheduler.schedule(100, self.record("a"))
+        self.scheduler.schedule(200, self.record("b"))
+        self.scheduler.cancel(event)
+        self.assertEqual(len(self.scheduler), 1)
+        self.assertEqual(self.scheduler.next_deadline, 200)
+        self.scheduler.run_due(1000)
+        self.assertEqual(self.fired, [("b", 200)])
+        self.assertEqual(self.scheduler.next_deadline, NEVER)
+
+    def test_callbacks_can_reschedule(self):
+        def tick(cycle):
+            self.fired.append(cycle)
+            self.scheduler.schedule(cycle + 100, tick)
+        self.scheduler.schedule(100, tick)
+        self.scheduler.run_due(350)
+        self.assertEqual(self.fired, [100, 200, 300])
+        self.assertEqual(self.scheduler.next_deadline, 400)
+
+
+class TestMachineEvents(TestCase):
+    compile_blocks = False
+
+    def setUp(self):
+        logging.basicConfig(level=logging.WARNING)
+        self.machine = Machine8080(compile_blocks=self.compile_blocks)
+
+    def test_event_fires_on_first_boundary_after_its_cycle(self):
+        load_program(self.machine, {0x0000: [0x00] * 100})       # NOPs
+        seen = []
+        self.machine.schedule(10, lambda cycle: seen.append((cycle, self.machine.cycles)))
+        self.machine.run(cycles=40)
+        self.assertEqual(seen, [(10, 12)])
+        self.assertEqual(self.machine.cycles, 40)
+
+    def test_periodic_interrupt_wakes_halted_machine(self):
+        load_program(self.machine, PROGRAM)
+
+        def vblank(cycle):
+            self.machine.interrupt(1)
+            self.machine.schedule(cycle + 1000, vblank)
+        self.machine.schedule(1000, vblank)
+        self.machine.run(cycles=3500)
+        # the first interrupt wakes the main program, which halts again
+        self.assertEqual(self.machine._registers[Registers.C], 3)
+        self.assertEqual(self.machine._registers[Registers.D], 1)
+
+    def test_event_scheduled_during_run(self):
+        load_program(self.machine, {0x0000: [0x00] * 200})
+        seen = []
+
+        def first(cycle):
+            self.machine.schedule(cycle + 20, lambda c: seen.append(self.machine.cycles))
+        self.machine.schedule(8, first)
+        self.machine.run(cycles=600)
+        self.assertEqual(seen, [28])
+
+    def test_event_scheduled_by_device(self):
+        load_program(self.machine, {0x0000: [0x00, 0x00,             # NOP, NOP
+                                             0xd3, 0x05,             # OUT 05
+                                             0x06, 0x01,             # MVI B, 01
+                                             0x0e, 0x02,             # MVI C, 02
+                                             0x76]})                 # HLT
+        seen = []
+
+        def fire(cycle):
+            seen.append((self.machine.cycles, self.machine._registers[Registers.B]))
+        self.machine.io.map(5, write=lambda port, val: self.machine.schedule(self.machine.cycles, fire))
+        self.machine.run(cycles=100000)
+        # fired straight after the OUT, before the MVIs
+        self.assertEqual(seen, [(18, 0)])
+
+    def test_step_fires_events(self):
+        load_program(self.machine, {0x0000: [0x00] * 10})
+        seen = []
+        self.machine.schedule(8, seen.append)
+        self.machine.step(2)
+        self.assertEqual(seen, [])
+        self.machine.step()
+        self.assertEqual(seen, [8])
+
+
+class TestMachineEventsCompiled(TestMachineEvents):
+    compile_blocks = True
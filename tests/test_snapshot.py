@@ -0,0 +1,80 @@
+from unittest import TestCase
+
+from machine import Machine8080
+from snapshot import SnapshotException, HEADER
+from tests.test_dispatch import PROGRAM, load_program, machine_state
+from tests.test_interrupts import PROGRAM as INTERRUPT_PROGRAM
+
+
+class TestSnapshot(TestCase):
+    compile_blocks = False
+
+    def setUp(self):
+        self.machine = Machine8080(compile_blocks=self.compile_blocks)
+        load_program(self.machine, PROGRAM)
+
+    def test_resume_matches_uninterrupted_run(self):
+        reference = Machine8080()
+        load_program(reference, PROGRAM)
+        reference.run()
+
+        self.machine.run(cycles=200)
+        for compression in (None, "zlib", "lzma"):
+            state = self.machine.snapshot(compression)
+            resumed = Machine8080(compile_blocks=self.compile_blocks)
+            resumed.restore(state)
+            self.assertEqual(resumed.cycles, self.machine.cycles)
+            resumed.run()
+            self.assertEqual(machine_state(resumed), machine_state(reference))
+            self.assertEqual(resumed.cycles, reference.cycles)
+
+    def test_restore_discards_later_changes(self):
+        self.machine.run(cycles=100)
+        state = self.machine.snapshot()
+        before = machine_state(self.machine)
+        self.machine.run()
+        self.machine.restore(state)
+        self.assertEqual(machine_state(self.machine), before)
+
+    def test_restore_drops_stale_code(self):
+        load_program(self.machine, {0x0000: [0x3e, 0x01, 0x76]})    # MVI A,01; HLT
+        state = self.machine.snapshot()
+        self.machine.run()
+        self.machine.write_memory(0x0001, 0x02)
+        self.machine.restore(state)
+        self.machine.run()
+        self.assertEqual(self.machine._registers[self.machine._registers.A], 0x01)
+
+    def test_interrupt_state(self):
+        load_program(self.machine, INTERRUPT_PROGRAM)
+        self.machine.run(cycles=100)
+        self.machine.interrupt(1)
+        state = self.machine.snapshot("zlib")
+        resumed = Machine8080(compile_blocks=self.compile_blocks)
+        resumed.restore(state)
+        self.assertTrue(resumed.halted)
+        resumed.run(cycles=100)
+        self.assertEqual(resumed.interrupts_serviced, 1)
+        self.assertEqual(resumed._registers[resumed._registers.D], 1)
+
+    def test_io_latches(self):
+        self.machine.io.write(7, 0x42)
+        resumed = Machine8080()
+        resumed.restore(self.machine.snapshot())
+        self.assertEqual(resumed.io.read(7), 0x42)
+
+    def test_compression_shrinks(self):
+        self.assertLess(len(self.machine.snapshot("zlib")), len(self.machine.snapshot()) // 10)
+
+    def test_invalid(self):
+        state = self.machine.snapshot()
+        for bad in (b'', b'XXXX' + state[4:], state[:4] + b'\x09' + state[5:], state[:-1],
+                    HEADER.pack(b'8080', 1, 1) + b'garbage'):
+            with self.assertRaises(SnapshotException):
+                self.machine.restore(bad)
+        with self.assertRaises(SnapshotException):
+            self.machine.snapshot("bz2")
+
+
+class TestSnapshotCompiled(TestSnapshot):
+    compile_blocks = True
@@ -0,0 +1,184 @@
+from unittest import TestCase
+import logging
+import os
+import tempfile
+
+from machine import Machine8080
+import tracing
+from tracing import Tracer, TraceRecord, TraceRecorder, TraceException, read_trace, logging_sink, RECORD_SIZE
+from tests.test_dispatch import PROGRAM, load_program, machine_state
+
+
+class TestTracing(TestCase):
+    compile_blocks = False
+
+    def setUp(self):
+        self.tracer = Tracer()
+        self.machine = Machine8080(compile_blocks=self.compile_blocks, tracer=self.tracer)
+        load_program(self.machine, {0x0000: [0x3e, 0x2a,          # MVI A,2A
+                                             0x06, 0x01,          # MVI B,01
+                                             0x80,                # ADD B
+                                             0xc3, 0x09, 0x00,    # JMP 0009
+                                             0x00,
+                                             0x76]})              # HLT
+
+    def test_records(self):
+        self.machine.run()
+        records = list(self.tracer.records)
+        self.assertEqual([r.pc for r in records], [0x0000, 0x0002, 0x0004, 0x0005, 0x0009])
+        self.assertEqual([r.opcode for r in records], [0x3e, 0x06, 0x80, 0xc3, 0x76])
+        self.assertEqual(records[0].operands, (0x2a,))
+        self.assertEqual(records[3].operands, (0x09, 0x00))
+        add = records[2]
+        self.assertEqual(add.registers[7], 0x2a)       # before ADD runs
+        self.assertEqual(records[3].registers[7], 0x2b)
+        self.assertEqual(add.cycles, 7 + 7 + 4)
+        self.assertIsInstance(add, TraceRecord)
+
+    def test_same_results_as_untraced(self):
+        load_program(self.machine, PROGRAM)
+        self.machine.run()
+        reference = Machine8080(compile_blocks=self.compile_blocks)
+        load_program(reference, PROGRAM)
+        reference.run()
+        self.assertEqual(machine_state(self.machine), machine_state(reference))
+        self.assertEqual(self.machine.cycles, reference.cycles)
+        self.assertEqual(self.tracer.records[-1].opcode, 0x76)
+
+    def test_limit_and_sink(self):
+        tracer = Tracer(limit=2)
+        machine = Machine8080(compile_blocks=self.compile_blocks, tracer=tracer)
+        machine._memory = self.machine._memory
+        machine.run()
+        self.assertEqual([r.opcode for r in tracer.records], [0xc3, 0x76])
+
+        seen = []
+        machine = Machine8080(compile_blocks=self.compile_blocks, tracer=Tracer(sink=seen.append))
+        machine._memory = self.machine._memory
+        machine.run()
+        self.assertEqual(len(seen), 5)
+
+    def test_logging_sink(self):
+        logger = logging.getLogger("test_tracing")
+        with self.assertLogs(logger, level=logging.DEBUG) as logs:
+            machine = Machine8080(compile_blocks=self.compile_blocks, tracer=Tracer(logging_sink(logger)))
+            machine._memory = self.machine._memory
+            machine.run()
+        self.assertEqual(len(logs.records), 5)
+        self.assertEqual(logs.records[0].getMessage(), "0000 3E 2a")
+        self.assertEqual(logs.records[0].trace.pc, 0)
+
+    def test_untraced_machine_has_plain_handlers(self):
+        machine = Machine8080()
+        self.assertEqual(machine.opcodes[0x80].handler, machine.add)
+
+
+class TestTracingCompiled(TestTracing):
+    compile_blocks = True
+
+
+class TestTraceRecorder(TestCase):
+    compile_blocks = False
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, "trace")
+
+    def run_machine(self, recorder, program=PROGRAM):
+        machine = Machine8080(compile_blocks=self.compile_blocks, tracer=recorder)
+        load_program(machine, program)
+        machine.run()
+        return machine
+
+    def reference(self):
+        tracer = Tracer()
+        self.run_machine(tracer)
+        return list(tracer.records)
+
+    def test_ring_matches_tracer(self):
+        recorder = TraceRecorder(capacity=4096)
+        machine = self.run_machine(recorder)
+        reference = self.reference()
+        self.assertEqual(list(recorder.records()), reference)
+        self.assertEqual(len(recorder), len(reference))
+        self.assertEqual(machine_state(machine)[0], reference[-1].pc + 1)
+
+    def test_ring_keeps_newest(self):
+        recorder = TraceRecorder(capacity=32, chunks=4)
+        self.run_machine(recorder)
+        reference = self.reference()
+        self.assertGreater(len(reference), 32)
+        self.assertEqual(len(recorder), len(reference))
+        self.assertEqual(len(recorder.buffer), 32 * RECORD_SIZE)
+        records = list(recorder.records())
+        # whole chunks of the last lap plus the current partial chunk
+        self.assertEqual(records, reference[-len(records):])
+        self.assertGreaterEqual(len(records), 32 - 8)
+
+    def test_file(self):
+        methods = [None, "zlib", "lzma"] + (["zstd"] if tracing.zstandard is not None else [])
+        reference = self.reference()
+        for method in methods:
+            with self.subTest(method=method):
+                recorder = TraceRecorder(capacity=32, chunks=4, path=self.path, compression=method)
+                self.run_machine(recorder)
+                recorder.close()
+                self.assertEqual(list(read_trace(self.path)), reference)
+
+    def test_default_compression(self):
+        recorder = TraceRecorder(path=self.path)
+        recorder.close()
+        self.assertEqual(list(read_trace(self.path)), [])
+        with open(self.path, "rb") as fp:
+            method = fp.read(6)[5]
+        self.assertEqual(method, tracing.ZSTD if tracing.zstandard is not None else tracing.LZMA)
+
+    def test_interrupt(self):
+        recorder = TraceRecorder(capacity=64)
+        machine = Machine8080(compile_blocks=self.compile_blocks, tracer=recorder)
+        load_program(machine, {0x0000: [0x31, 0x00, 0x24,    # LXI SP,2400
+                                        0xfb,                # EI
+                                        0xc3, 0x04, 0x00],   # JMP 0004
+                               0x0008: [0xc9]})              # RET
+        machine.run(cycles=50)
+        machine.interrupt(1)
+        machine.run(cycles=50)
+        rst = next(r for r in recorder.records() if r.opcode == 0xcf)
+        self.assertEqual((rst.pc, rst.operands), (0x0004, ()))
+
+    def test_interrupt_after_end_of_memory(self):
+        recorder = TraceRecorder(capacity=64)
+        machine = Machine8080(compile_blocks=self.compile_blocks, tracer=recorder)
+        load_program(machine, {0x0000: [0x31, 0x00, 0x24,    # LXI SP,2400
+                                        0xfb,                # EI
+                                        0xc3, 0xff, 0xff],   # JMP FFFF
+                               0x0008: [0x76],               # HLT
+                               0xffff: [0x00]})              # NOP
+        machine.run()
+        machine.interrupt(1)
+        machine.run(cycles=100)
+        rst = next(r for r in recorder.records() if r.opcode == 0xcf)
+        self.assertEqual(rst.pc, 0x0000)
+
+    def test_bad_files(self):
+        with self.assertRaises(TraceException):
+            TraceRecorder(compression="rar")
+        with open(self.path, "wb") as fp:
+            fp.write(b'not a trace')
+        with self.assertRaises(TraceException):
+            list(read_trace(self.path))
+
+        recorder = TraceRecorder(capacity=32, chunks=4, path=self.path, compression="zlib")
+        self.run_machine(recorder)
+        recorder.close()
+        with open(self.path, "rb") as fp:
+            data = fp.read()
+        with open(self.path, "wb") as fp:
+            fp.write(data[:-3])
+        with self.assertRaises(TraceException):
+            list(read_trace(self.path))
+
+
+class TestTraceRecorderCompiled(TestTraceRecorder):
+    compile_blocks = True
@@ -0,0 +1,349 @@
+"""
+Instruction tracing.
+
+Handlers don't log.  A Tracer is given to Machine8080 when it's built, and
+the machine then wraps every entry of its opcode table so that each
+instruction hands the tracer a TraceRecord before it runs.  Without a
+tracer the opcode table holds the plain handlers, so tracing costs nothing
+when it's off.
+
+Compiled blocks normally run simple instructions inline without calling
+their handlers; with a tracer they call the (wrapped) handler for every
+instruction, so a traced run records everything.  profiler.py hooks in the
+same way.
+
+Interrupts are run through the opcode table too, as their RST with operands
+of None, so they're recorded at the address they interrupted.
+
+A TraceRecord is the machine's state as the instruction starts, except the
+cycle counter, which already includes the instruction's cycles:
+
+    cycles    -- cycle counter
+    pc        -- address of the instruction
+    opcode    -- opcode byte
+    operands  -- operand bytes (a tuple)
+    registers -- bytes of the register file, indexed like cpu.Registers
+    flags     -- flags byte
+    sp        -- stack pointer
+
+Building a TraceRecord for every instruction is too slow for long traces.
+TraceRecorder is a tracer that instead packs each record into RECORD_SIZE
+bytes of a preallocated ring buffer, which keeps the most recent `capacity`
+records.  Given a path, it also streams the ring to a file: whenever a
+chunk of the ring fills, a copy is queued for a background thread that
+compresses it (zstd if the zstandard package is installed, otherwise lzma)
+and appends it to the file.  The compressors release the GIL, so this
+overlaps with emulation.  The queue is bounded, so if the writer falls
+behind the machine waits for it rather than using more memory.
+
+A trace file is a FILE_HEADER followed by chunks, each a CHUNK_HEADER
+(compressed size and record count) and the compressed records.  read_trace()
+decompresses one chunk at a time and yields its records as TraceRecords, so
+a file of any length is read in bounded memory.
+"""
+from collections import deque, namedtuple
+import functools
+import logging
+import lzma
+import queue
+import struct
+import threading
+import zlib
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+_DECOMPRESSION_ERRORS = (zlib.error, lzma.LZMAError) + ((zstandard.ZstdError,) if zstandard is not None else ())
+
+TraceRecord = namedtuple('TraceRecord', ['cycles', 'pc', 'opcode', 'operands', 'registers', 'flags', 'sp'])
+
+# cycles, pc, opcode, operand count, operands (zero padded), registers,
+# flags, sp
+RECORD = struct.Struct('<QHBB2s8sBH')
+RECORD_SIZE = RECORD.size
+
+MAGIC = b'8TRC'
+VERSION = 1
+# magic, version, compression method, record size
+FILE_HEADER = struct.Struct('<4sBBH')
+# compressed size, record count
+CHUNK_HEADER = struct.Struct('<II')
+
+NONE = 0
+ZLIB = 1
+LZMA = 2
+ZSTD = 3
+_COMPRESSION = {None: NONE, "zlib": ZLIB, "lzma": LZMA, "zstd": ZSTD}
+
+
+class TraceException(Exception):
+    def __init__(self, msg):
+        self._msg = msg
+
+    def __str__(self):
+        return self._msg
+
+
+class Tracer:
+    def __init__(self, sink=None, limit=None):
+        """
+        :param sink: called with every TraceRecord.  If None the records are
+                     kept in self.records.
+        :param limit: most records kept in self.records (the newest ones);
+                      None keeps them all
+        """
+        self.records = deque(maxlen=limit)
+        self.sink = sink if sink is not None else self.records.append
+
+    def wrap(self, machine, op):
+        """Returns a handler that records the instruction and then runs op's
+        handler.
+
+        :param machine: Machine8080 the handler belongs to
+        :param op: entry of the machine's opcode table
+        """
+        handler = op.handler
+        length = op.length
+        sink = self.sink
+
+        @functools.wraps(handler)
+        def traced(opcode, operands=()):
+            # the run loop has already moved the PC past the instruction; an
+            # interrupt's RST (operands None) runs at the PC it interrupts
+            if operands is None:
+                pc, args = machine._pc & 0xffff, ()
+            else:
+                pc, args = (machine._pc - length) & 0xffff, tuple(operands)
+            sink(TraceRecord(machine._cycles, pc, opcode, args,
+                             bytes(machine._registers), machine._flags.flags, machine._sp))
+            return handler(opcode, operands)
+        return traced
+
+
+class TraceRecorder:
+    def __init__(self, capacity=1 << 20, path=None, compression=None, chunks=16, queued=4):
+        """
+        :param capacity: records kept in the ring buffer
+        :param path: file to stream every record to, or None to keep only
+                     the ring
+        :param compression: "zstd", "lzma", "zlib" or None for the file;
+                            the default is zstd if zstandard is installed
+                            and lzma if not
+        :param chunks: number of chunks the ring is divided into; each one
+                       is written to the file as it fills
+        :param queued: most full chunks waiting for the writer thread
+
+        :raises TraceException: if the compression method isn't available
+        """
+        if capacity % chunks:
+            raise ValueError("capacity must be a multiple of chunks")
+        if compression is None and path is not None:
+            compression = "zstd" if zstandard is not None else "lzma"
+        if compression not in _COMPRESSION:
+            raise TraceException("Unknown compression {0!r}".format(compression))
+        if compression == "zstd" and zstandard is None:
+            raise TraceException("zstd compression needs the zstandard package")
+        self.capacity = capacity
+        self.buffer = bytearray(capacity * RECORD_SIZE)
+        self._chunk_size = (capacity // chunks) * RECORD_SIZE
+        self._position = 0  # offset the next record is packed at
+        self._chunk_start = 0
+        self._chunk_end = self._chunk_size
+        self._wrapped = False
+        self._chunks_done = 0  # chunks of the ring filled so far
+        self._method = _COMPRESSION[compression]
+        self._file = None
+        self._queue = None
+        self._writer = None
+        self._error = None
+        if path is not None:
+            self._file = open(path, "wb")
+            self._file.write(FILE_HEADER.pack(MAGIC, VERSION, self._method, RECORD_SIZE))
+            self._queue = queue.Queue(queued)
+            self._writer = threading.Thread(target=self._write_chunks, name="trace-writer", daemon=True)
+            self._writer.start()
+
+    def __len__(self):
+        """Number of records recorded, including any the ring has dropped.
+        """
+        return (self._chunks_done * self._chunk_size + self._position - self._chunk_start) // RECORD_SIZE
+
+    def wrap(self, machine, op):
+        """Returns a handler that packs the instruction into the ring and
+        then runs op's handler.
+
+        :param machine: Machine8080 the handler belongs to
+        :param op: entry of the machine's opcode table
+        """
+        handler = op.handler
+        length = op.length
+        count = length - 1
+        buffer = self.buffer
+        pack_into = RECORD.pack_into
+        registers = machine._registers
+        flags = machine._flags
+
+        @functools.wraps(handler)
+        def traced(opcode, operands=()):
+            position = self._position
+            if operands is None:
+                pack_into(buffer, position, machine._cycles, machine._pc & 0xffff, opcode, 0, b'',
+                          registers, flags.flags, machine._sp)
+            else:
+                pack_into(buffer, position, machine._cycles, (machine._pc - length) & 0xffff, opcode, count,
+                          bytes(operands), registers, flags.flags, machine._sp)
+            position += RECORD_SIZE
+            self._position = position
+            if position == self._chunk_end:
+                self._chunk_full()
+            return handler(opcode, operands)
+        return traced
+
+    def _chunk_full(self):
+        """Queues the chunk that just filled for the writer and moves on to
+        the next one.
+        """
+        if self._queue is not None:
+            self._put(bytes(memoryview(self.buffer)[self._chunk_start:self._chunk_end]))
+        self._chunks_done += 1
+        if self._chunk_end == len(self.buffer):
+            self._wrapped = True
+            self._chunk_start = 0
+        else:
+            self._chunk_start = self._chunk_end
+        self._position = self._chunk_start
+        self._chunk_end = self._chunk_start + self._chunk_size
+
+    def _put(self, chunk):
+        if self._error is not None:
+            raise TraceException("Trace writer failed: {0}".format(self._error))
+        self._queue.put(chunk)
+
+    def _write_chunks(self):
+        """Writer thread: compresses and writes queued chunks until it's
+        given None.
+        """
+        compress = _compressor(self._method)
+        while True:
+            chunk = self._queue.get()
+            if chunk is None:
+                return
+            if self._error is not None:
+                continue
+            try:
+                data = compress(chunk)
+                self._file.write(CHUNK_HEADER.pack(len(data), len(chunk) // RECORD_SIZE))
+                self._file.write(data)
+            except (OSError, MemoryError) as e:
+                self._error = e
+
+    def close(self):
+        """Writes the records of the partly filled chunk, waits for the
+        writer thread and closes the file.  The ring is still readable.
+
+        :raises TraceException: if the writer thread couldn't write the file
+        """
+        if self._writer is None:
+            return
+        if self._position != self._chunk_start:
+            self._put(bytes(memoryview(self.buffer)[self._chunk_start:self._position]))
+        self._queue.put(None)
+        self._writer.join()
+        self._file.close()
+        self._writer = None
+        self._queue = None
+        if self._error is not None:
+            raise TraceException("Trace writer failed: {0}".format(self._error))
+
+    def records(self):
+        """Yields the records in the ring, oldest first.
+        """
+        view = memoryview(self.buffer)
+        if self._wrapped:
+            # the unfilled part of the current chunk holds records from the last lap
+            yield from _unpack(view[self._position:])
+        yield from _unpack(view[:self._position])
+
+
+def _compressor(method):
+    if method == ZSTD:
+        return zstandard.ZstdCompressor(level=1).compress
+    if method == LZMA:
+        return functools.partial(lzma.compress, preset=0)
+    if method == ZLIB:
+        return functools.partial(zlib.compress, level=1)
+    return bytes
+
+
+def _decompressor(method):
+    if method == ZSTD:
+        if zstandard is None:
+            raise TraceException("Trace is zstd compressed; reading it needs the zstandard package")
+        return zstandard.ZstdDecompressor().decompress
+    if method == LZMA:
+        return lzma.decompress
+    if method == ZLIB:
+        return zlib.decompress
+    if method == NONE:
+        return bytes
+    raise TraceException("Unknown compression method {0}".format(method))
+
+
+def _unpack(data):
+    for cycles, pc, opcode, count, operands, registers, flags, sp in RECORD.iter_unpack(data):
+        yield TraceRecord(cycles, pc, opcode, tuple(operands[:count]), registers, flags, sp)
+
+
+def read_trace(path):
+    """Yields the records of a trace file written by TraceRecorder, reading
+    and decompressing one chunk at a time.
+
+    :param path: path of the file
+    :raises TraceException: if the file isn't a trace this version can read,
+                            or is truncated or corrupt
+    """
+    with open(path, "rb") as fp:
+        header = fp.read(FILE_HEADER.size)
+        if len(header) != FILE_HEADER.size:
+            raise TraceException("{0}: trace is truncated".format(path))
+        magic, version, method, record_size = FILE_HEADER.unpack(header)
+        if magic != MAGIC:
+            raise TraceException("{0}: not a trace".format(path))
+        if version != VERSION or record_size != RECORD_SIZE:
+            raise TraceException("{0}: unsupported trace version {1}".format(path, version))
+        decompress = _decompressor(method)
+        while True:
+            header = fp.read(CHUNK_HEADER.size)
+            if not header:
+                return
+            if len(header) != CHUNK_HEADER.size:
+                raise TraceException("{0}: trace is truncated".format(path))
+            size, count = CHUNK_HEADER.unpack(header)
+            data = fp.read(size)
+            if len(data) != size:
+                raise TraceException("{0}: trace is truncated".format(path))
+            try:
+                chunk = decompress(data)
+            except _DECOMPRESSION_ERRORS as e:
+                raise TraceException("{0}: corrupt chunk: {1}".format(path, e))
+            if len(chunk) != count * RECORD_SIZE:
+                raise TraceException("{0}: chunk holds {1} bytes, expected {2}".format(
+                    path, len(chunk), count * RECORD_SIZE))
+            yield from _unpack(chunk)
+
+
+def logging_sink(logger=None, level=logging.DEBUG):
+    """Returns a sink that logs each record at level, with the record itself
+    attached to the log record as `trace` for handlers that want the fields.
+    The message is only formatted if the logger is enabled for level.
+    """
+    if logger is None:
+        logger = logging.getLogger("tracing")
+
+    def sink(record):
+        if logger.isEnabledFor(level):
+            logger.log(level, "%04X %02X %s", record.pc, record.opcode, bytes(record.operands).hex(),
+                       extra={"trace": record})
+    return sink